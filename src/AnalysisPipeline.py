@@ -0,0 +1,236 @@
+"""
+This Python module contains the classes for running items through a pipeline of stages, such as searching for the
+articles of a ticker, downloading them, parsing them and scoring them. Every stage has its own pool of worker threads
+and takes its items from a bounded queue, so all the stages work at once (the network isn't idle while the models run
+and the reverse) while a slow stage holds back the stages before it instead of letting items pile up in memory.
+
+Copyright and Usage Information
+===============================
+
+This file is provided solely for the personal and private use of TAs and professors
+at the University of Toronto St. George campus. All forms of
+distribution of this code, whether as given or with any changes, are
+expressly prohibited. For more information on copyright for CSC111 materials,
+please consult the Course Syllabus.
+
+This file is Copyright (c) 2023 Mark Zhang, Li Zhang and Luke Zhang
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Any, Callable, Iterator, Optional
+import queue
+import threading
+import time
+
+# the number of items that can wait in the queue of a stage for every one of its workers
+PIPELINE_QUEUE_SIZE = 2
+
+
+@dataclass
+class PipelineStage:
+    """A dataclass representing a stage of a pipeline
+
+    Instance Attributes:
+        - name: the name of the stage in the reported statistics
+        - function: the function every item is passed through, returning the item given to the next stage
+        - workers: the number of threads running the function
+        - ordered: whether the items go through the function in the order they were given to the pipeline, so what
+                   the function does for an item can depend on what it did for the items before it
+
+    Representation Invariants:
+        - self.workers > 0
+        - not self.ordered or self.workers == 1
+    """
+    name: str
+    function: Callable[[Any], Any]
+    workers: int = 1
+    ordered: bool = False
+
+
+class _Failure:
+    """The exception raised by a stage for an item, passed through the rest of the stages in place of the item
+
+    Instance Attributes:
+        - error: the exception raised
+    """
+    error: Exception
+
+    def __init__(self, error: Exception) -> None:
+        self.error = error
+
+
+class AnalysisPipeline:
+    """This class runs items through stages, every stage with its own pool of worker threads.
+
+    The stages are joined by bounded queues, so a stage blocks once the queue of the next stage is full. Items finish
+    the stages in whatever order their workers get to them but are given back in the order they were given, so the
+    results can be merged deterministically. If a stage raises an exception for an item, the items after it are
+    drained without running any more stages and the exception is raised when the item's turn to be given back comes.
+
+    Instance Attributes:
+        - stages: the stages every item goes through, in order
+        - queue_size: the number of items that can wait for every worker of a stage
+    Private Instance Attributes:
+        - _queues: the queue of items waiting for every stage, followed by the queue of finished items
+        - _processed: the number of items every stage finished
+        - _busy_seconds: the number of seconds the workers of every stage spent running its function
+        - _max_depths: the largest number of items that waited in the queue of every stage
+        - _started_at: the time the pipeline started running, or None if it hasn't
+        - _stopped: set when the items still in the pipeline should be drained without running the stages
+        - _lock: a lock guarding the statistics
+
+    Representation Invariants:
+        - self.stages != []
+        - self.queue_size > 0
+    """
+    stages: list[PipelineStage]
+    queue_size: int
+    _queues: list[queue.Queue]
+    _processed: list[int]
+    _busy_seconds: list[float]
+    _max_depths: list[int]
+    _started_at: Optional[float]
+    _stopped: threading.Event
+    _lock: threading.Lock
+
+    def __init__(self, stages: list[PipelineStage], queue_size: int = PIPELINE_QUEUE_SIZE) -> None:
+        self.stages = stages
+        self.queue_size = queue_size
+        self._queues = []
+        self._processed = [0] * len(stages)
+        self._busy_seconds = [0.0] * len(stages)
+        self._max_depths = [0] * len(stages)
+        self._started_at = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+
+    def _put(self, stage_index: int, task: Any) -> None:
+        """Adds the task to the queue of the stage, blocking while it is full, and updates its largest depth"""
+        self._queues[stage_index].put(task)
+        if stage_index < len(self.stages):
+            with self._lock:
+                self._max_depths[stage_index] = max(self._max_depths[stage_index],
+                                                    self._queues[stage_index].qsize())
+
+    def _feed(self, items: list[Any]) -> None:
+        """Adds the items to the queue of the first stage, then tells its workers there are no more"""
+        for index in range(len(items)):
+            if self._stopped.is_set():
+                break
+            self._put(0, (index, items[index]))
+        for _ in range(self.stages[0].workers):
+            self._queues[0].put(None)
+
+    def _run_stage(self, stage_index: int, item: Any) -> Any:
+        """Returns the result of running the function of the stage on the item, or the failure it raised"""
+        if isinstance(item, _Failure) or self._stopped.is_set():
+            return item
+        start = time.perf_counter()
+        try:
+            item = self.stages[stage_index].function(item)
+        except Exception as error:  # raised again when the item is given back
+            item = _Failure(error)
+        with self._lock:
+            self._processed[stage_index] += 1
+            self._busy_seconds[stage_index] += time.perf_counter() - start
+        return item
+
+    def _work(self, stage_index: int, finished_workers: list[int]) -> None:
+        """Runs the function of the stage on every item in its queue until there are no more, then tells the workers
+        of the next stage once every worker of this stage is done. The items of an ordered stage are held back until
+        the items before them have gone through"""
+        stage = self.stages[stage_index]
+        waiting = {}
+        next_index = 0
+        while True:
+            task = self._queues[stage_index].get()
+            if task is None:
+                break
+            if not stage.ordered:
+                self._put(stage_index + 1, (task[0], self._run_stage(stage_index, task[1])))
+                continue
+            waiting[task[0]] = task[1]
+            while next_index in waiting:
+                self._put(stage_index + 1, (next_index, self._run_stage(stage_index, waiting.pop(next_index))))
+                next_index += 1
+        # only left over if the pipeline was stopped before every item was given
+        for index in sorted(waiting):
+            self._put(stage_index + 1, (index, self._run_stage(stage_index, waiting[index])))
+        with self._lock:
+            finished_workers[0] += 1
+            is_last = finished_workers[0] == stage.workers
+        if is_last:
+            next_workers = self.stages[stage_index + 1].workers if stage_index + 1 < len(self.stages) else 1
+            for _ in range(next_workers):
+                self._queues[stage_index + 1].put(None)
+
+    def run(self, items: list[Any]) -> Iterator[Any]:
+        """Yields the result of running every item through every stage, in the order the items were given
+        """
+        self._queues = [queue.Queue(maxsize=stage.workers * self.queue_size) for stage in self.stages] + \
+            [queue.Queue()]
+        self._stopped.clear()
+        self._started_at = time.perf_counter()
+        threads = [threading.Thread(target=self._feed, args=(items,), daemon=True)]
+        for stage_index in range(len(self.stages)):
+            finished_workers = [0]
+            threads += [threading.Thread(target=self._work, args=(stage_index, finished_workers), daemon=True)
+                        for _ in range(self.stages[stage_index].workers)]
+        for thread in threads:
+            thread.start()
+        finished = {}
+        next_index = 0
+        drained = False
+        try:
+            while next_index < len(items):
+                task = self._queues[-1].get()
+                if task is None:
+                    drained = True
+                    break
+                finished[task[0]] = task[1]
+                while next_index in finished:
+                    item = finished.pop(next_index)
+                    next_index += 1
+                    if isinstance(item, _Failure):
+                        raise item.error
+                    yield item
+        finally:
+            # drain whatever is left so every thread can finish, without running any more stages
+            self._stopped.set()
+            while not drained:
+                drained = self._queues[-1].get() is None
+            for thread in threads:
+                thread.join()
+
+    def get_stats(self) -> dict[str, dict[str, float]]:
+        """Returns the statistics of every stage by name: the number of items waiting in its queue and the most that
+        ever waited, the number of items it finished, how busy its workers were and the items it finished per second
+        """
+        elapsed = time.perf_counter() - self._started_at if self._started_at is not None else 0.0
+        stats = {}
+        with self._lock:
+            for stage_index in range(len(self.stages)):
+                stage = self.stages[stage_index]
+                stats[stage.name] = {
+                    'queue_depth': self._queues[stage_index].qsize() if self._queues != [] else 0,
+                    'max_queue_depth': self._max_depths[stage_index],
+                    'processed': self._processed[stage_index],
+                    'utilization': round(self._busy_seconds[stage_index] / (elapsed * stage.workers), 2)
+                    if elapsed > 0 else 0.0,
+                    'throughput': round(self._processed[stage_index] / elapsed, 3) if elapsed > 0 else 0.0
+                }
+        return stats
+
+
+if __name__ == '__main__':
+    import doctest
+    import python_ta
+
+    doctest.testmod(verbose=True)
+
+    python_ta.check_all(config={
+        'max-line-length': 120,
+        'extra-imports': ['__future__', 'dataclasses', 'typing', 'queue', 'threading', 'time'],
+        'allowed-io': [],
+        'max-nested-blocks': 10
+    })
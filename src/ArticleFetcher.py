@@ -0,0 +1,504 @@
+"""
+This Python module contains the class for downloading news articles concurrently. Articles are downloaded from a
+bounded pool of threads sharing one keep-alive connection pool, with a cap on the number of downloads from any one
+publisher, so a slow publisher only holds up its own articles. Responses are streamed so downloads that can't be
+articles (ie. videos, PDFs or pages without paragraphs) are abandoned as soon as that is known.
+
+Copyright and Usage Information
+===============================
+
+This file is provided solely for the personal and private use of TAs and professors
+at the University of Toronto St. George campus. All forms of
+distribution of this code, whether as given or with any changes, are
+expressly prohibited. For more information on copyright for CSC111 materials,
+please consult the Course Syllabus.
+
+This file is Copyright (c) 2023 Mark Zhang, Li Zhang and Luke Zhang
+"""
+from __future__ import annotations
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Iterator, Optional
+from urllib.parse import urlsplit
+from NewsScraper import get_random_header_agent
+from HttpCache import CachedResponse, HttpCache
+from RateLimiter import HostRateLimiter, get_host_rate_limiter
+import os
+import re
+import threading
+import time
+
+FETCH_MAX_IN_FLIGHT = 16
+FETCH_MAX_PER_HOST = 2
+# the most seconds a download can take in total, from connecting to reading the last byte
+FETCH_DEADLINE = 15.0
+FETCH_CHUNK_SIZE = 64 * 1024
+# the most bytes read of a page, the rest of a longer page is never downloaded
+FETCH_MAX_BYTES = 2 * 1024 * 1024
+# a download is abandoned if this many bytes of it have been read without seeing a <p> tag
+FETCH_SNIFF_BYTES = 256 * 1024
+# the content types of the pages that can be articles, a page without a content type is assumed to be html
+HTML_CONTENT_TYPES = ('text/html', 'application/xhtml+xml')
+# the number of times a url is requested before giving up on it when its host keeps rate limiting us
+FETCH_MAX_REQUESTS = 3
+PARAGRAPH_PATTERN = re.compile(rb'<p[\s>/]', re.I)
+
+
+@dataclass
+class FetchResult:
+    """A dataclass to represent the result of downloading a url
+
+    Instance Attributes:
+        - url: the url downloaded
+        - content: the body of the response, or None if the download failed
+        - status: the http status of the response, or None if no response was received
+        - error: the reason the download failed, or None if it didn't
+        - elapsed: the number of seconds the download took, including waiting for its host
+        - from_cache: whether the content was served from the http cache rather than downloaded
+        - truncated: whether the page was longer than the byte cap, so only its start was read
+        - final_url: the url the page was downloaded from after following redirects, or None if it wasn't downloaded
+        - bytes_read: the number of bytes of the body read, including those of pages abandoned partway
+
+    Representation Invariants:
+        - (self.content is None) == (self.error is not None)
+        - self.elapsed >= 0
+    """
+    url: str
+    content: Optional[bytes]
+    status: Optional[int]
+    error: Optional[str]
+    elapsed: float
+    from_cache: bool = False
+    truncated: bool = False
+    final_url: Optional[str] = None
+    bytes_read: int = 0
+
+
+class FetchStats:
+    """This class counts the outcomes of the downloads of an ArticleFetcher, for reporting at the end of a run.
+
+    Instance Attributes:
+        - downloaded: the number of pages downloaded
+        - cached: the number of pages served from the http cache
+        - truncated: the number of pages cut off at the byte cap
+        - bytes_read: the number of bytes of pages read, including the bytes of abandoned downloads
+        - skipped: a dictionary mapping the reason downloads failed or were abandoned to the number of them
+    Private Instance Attributes:
+        - _lock: a lock guarding the counters
+
+    Representation Invariants:
+        - self.downloaded >= 0
+        - self.cached >= 0
+        - self.bytes_read >= 0
+        - all(count > 0 for count in self.skipped.values())
+    """
+    downloaded: int
+    cached: int
+    truncated: int
+    bytes_read: int
+    skipped: dict[str, int]
+    _lock: threading.Lock
+
+    def __init__(self) -> None:
+        self.downloaded = 0
+        self.cached = 0
+        self.truncated = 0
+        self.bytes_read = 0
+        self.skipped = {}
+        self._lock = threading.Lock()
+
+    def record(self, result: FetchResult, bytes_read: int) -> None:
+        """Counts the result of a download that read bytes_read bytes
+        """
+        with self._lock:
+            self.bytes_read += bytes_read
+            if result.error is not None:
+                self.skipped[result.error] = self.skipped.get(result.error, 0) + 1
+            elif result.from_cache:
+                self.cached += 1
+            else:
+                self.downloaded += 1
+            if result.truncated:
+                self.truncated += 1
+
+    def get_stats(self) -> dict[str, object]:
+        """Returns the counters
+        """
+        with self._lock:
+            return {
+                'downloaded': self.downloaded,
+                'cached': self.cached,
+                'truncated': self.truncated,
+                'megabytes_read': round(self.bytes_read / 1e6, 2),
+                'skipped': dict(self.skipped)
+            }
+
+
+def is_html_content_type(content_type: Optional[str]) -> bool:
+    """Returns whether a page with the given Content-Type header can be an article
+
+    >>> is_html_content_type('text/html; charset=utf-8')
+    True
+    >>> is_html_content_type('application/pdf')
+    False
+    """
+    if content_type is None or content_type.strip() == '':
+        return True
+    return content_type.split(';')[0].strip().lower() in HTML_CONTENT_TYPES
+
+
+def get_host(url: str) -> str:
+    """Returns the host of the url, the key its downloads are capped by
+
+    >>> get_host('https://www.marketwatch.com/story/gilead-stock-rises?mod=mw_quote_news')
+    'www.marketwatch.com'
+    """
+    return (urlsplit(url).hostname or '').lower()
+
+
+@dataclass
+class FetchJob:
+    """A dataclass to represent a url waiting to be downloaded, or being downloaded
+
+    Instance Attributes:
+        - url: the url to download
+        - future: the future the result of the download is given to
+        - cached: the page of the url in the http cache, or None if it isn't cached
+        - start: the time the download was asked for
+        - deadline: the time after which the download is abandoned, or None until it starts
+        - requests_made: the number of requests for the url the host rate limited
+
+    Representation Invariants:
+        - 0 <= self.requests_made <= FETCH_MAX_REQUESTS
+    """
+    url: str
+    future: Future
+    cached: Optional[CachedResponse]
+    start: float
+    deadline: Optional[float] = None
+    requests_made: int = 0
+
+
+class ArticleFetcher:
+    """This class downloads urls concurrently.
+
+    At most max_in_flight urls are downloaded at once and at most max_per_host of them from the same host. Every
+    download shares one http session so connections to a host are kept alive and reused, and every download is
+    abandoned once it has taken longer than deadline seconds. Responses that aren't html are abandoned after their
+    headers, pages are cut off after max_bytes and abandoned if their first sniff_bytes have no <p> tag.
+
+    The urls of every host wait in the host's own queue and are only given to the pool of threads once a thread is
+    free, the host has a free download and the rate limiter lets a request through, so the urls of a slow or rate
+    limited host never take threads away from the other hosts and no url waits inside the pool.
+
+    Instance Attributes:
+        - max_in_flight: the largest number of urls downloaded at once
+        - max_per_host: the largest number of urls downloaded at once from the same host
+        - deadline: the most seconds a download can take
+        - http_cache: the cache pages are served from and stored in, or None to always download them
+        - max_bytes: the most bytes read of a page
+        - sniff_bytes: the number of bytes read of a page without a <p> tag before the download is abandoned
+        - stats: the counts of the outcomes of the downloads
+        - rate_limiter: the rate limiter every request goes through, it only slows down the hosts that rate limit us
+    Private Instance Attributes:
+        - _session: the http session shared by all downloads, per process
+        - _executor: the pool of threads downloading the urls
+        - _host_queues: a dictionary mapping a host to the jobs waiting to be downloaded from it, in order
+        - _host_downloads: a dictionary mapping a host to the number of its urls being downloaded
+        - _waiting_hosts: the hosts with a timer set to try their queue again once the rate limiter allows it
+        - _in_flight: the number of urls being downloaded from every host
+        - _pid: the id of the process _session and _executor were created in
+        - _lock: a lock guarding the creation of the session and executor, and the host queues
+
+    Representation Invariants:
+        - self.max_in_flight > 0
+        - self.max_per_host > 0
+        - self.deadline > 0
+        - self.max_bytes > 0
+        - self.sniff_bytes > 0
+        - all(0 <= count <= self.max_per_host for count in self._host_downloads.values())
+        - 0 <= self._in_flight <= self.max_in_flight
+    """
+    max_in_flight: int
+    max_per_host: int
+    deadline: float
+    http_cache: Optional[HttpCache]
+    max_bytes: int
+    sniff_bytes: int
+    stats: FetchStats
+    rate_limiter: HostRateLimiter
+    _session: Optional[requests.Session]
+    _executor: Optional[ThreadPoolExecutor]
+    _host_queues: dict[str, deque[FetchJob]]
+    _host_downloads: dict[str, int]
+    _waiting_hosts: set[str]
+    _in_flight: int
+    _pid: int
+    _lock: threading.Lock
+
+    def __init__(self, max_in_flight: int = FETCH_MAX_IN_FLIGHT, max_per_host: int = FETCH_MAX_PER_HOST,
+                 deadline: float = FETCH_DEADLINE, http_cache: Optional[HttpCache] = None,
+                 max_bytes: int = FETCH_MAX_BYTES, sniff_bytes: int = FETCH_SNIFF_BYTES,
+                 rate_limiter: Optional[HostRateLimiter] = None) -> None:
+        self.max_in_flight = max_in_flight
+        self.max_per_host = max_per_host
+        self.deadline = deadline
+        self.http_cache = http_cache
+        self.max_bytes = max_bytes
+        self.sniff_bytes = sniff_bytes
+        self.stats = FetchStats()
+        self.rate_limiter = rate_limiter if rate_limiter is not None else get_host_rate_limiter()
+        self._session = None
+        self._executor = None
+        self._host_queues = {}
+        self._host_downloads = {}
+        self._waiting_hosts = set()
+        self._in_flight = 0
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def _get_session(self) -> requests.Session:
+        """Returns the http session of this process, creating it if needed"""
+        import requests
+        with self._lock:
+            if self._session is None or self._pid != os.getpid():
+                self._session = requests.Session()
+                # one pool per host, each holding as many connections as downloads allowed from the host
+                adapter = requests.adapters.HTTPAdapter(pool_connections=self.max_in_flight,
+                                                        pool_maxsize=self.max_per_host)
+                self._session.mount('http://', adapter)
+                self._session.mount('https://', adapter)
+                self._executor = None
+                # the downloads of the parent process aren't happening in this one
+                self._host_queues = {}
+                self._host_downloads = {}
+                self._waiting_hosts = set()
+                self._in_flight = 0
+                self._pid = os.getpid()
+            return self._session
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Returns the pool of threads of this process, creating it if needed"""
+        self._get_session()
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight)
+            return self._executor
+
+    def fetch(self, url: str) -> FetchResult:
+        """Downloads the url, blocking while max_per_host downloads from its host are already happening.
+        A fresh page in the http cache is served without a request and a stale one is revalidated
+        """
+        return self._submit(url).result()
+
+    def _submit(self, url: str) -> Future:
+        """Returns the future of the result of downloading the url, serving it right away if the http cache can,
+        otherwise adding it to its host's queue
+        """
+        job = FetchJob(url, Future(), None, time.monotonic())
+        if self.http_cache is not None:
+            job.cached = self.http_cache.get(url)
+            if job.cached is not None and (self.http_cache.offline or job.cached.is_fresh(self.http_cache.ttl)):
+                self.http_cache.record('hit')
+                self._finish(job, FetchResult(url, job.cached.content, job.cached.status, None, 0, True), 0)
+                return job.future
+            if self.http_cache.offline:
+                self._finish(job, FetchResult(url, None, None, 'offline', 0), 0)
+                return job.future
+        host = get_host(url)
+        self._get_executor()
+        with self._lock:
+            self._host_queues.setdefault(host, deque()).append(job)
+        self._dispatch(host)
+        return job.future
+
+    def _dispatch(self, host: str) -> None:
+        """Gives the jobs at the front of the host's queue to the pool of threads while a thread is free, the host has
+        free downloads and the rate limiter lets their requests through. If the rate limiter doesn't, a timer tries
+        again once it will, and the jobs that would pass their deadline by then are abandoned
+        """
+        executor = self._get_executor()
+        abandoned = []
+        with self._lock:
+            queue = self._host_queues.get(host)
+            while queue and self._host_downloads.get(host, 0) < self.max_per_host and \
+                    self._in_flight < self.max_in_flight:
+                job = queue[0]
+                now = time.monotonic()
+                wait_time = self.rate_limiter.try_acquire(host)
+                # a job that hasn't started yet can wait for as long as a download can take
+                deadline = job.deadline if job.deadline is not None else now + self.deadline
+                if wait_time > 0 and now + wait_time > deadline:
+                    abandoned.append(queue.popleft())
+                elif wait_time > 0:
+                    if host not in self._waiting_hosts:
+                        self._waiting_hosts.add(host)
+                        timer = threading.Timer(wait_time, self._wake, (host,))
+                        timer.daemon = True
+                        timer.start()
+                    break
+                else:
+                    queue.popleft()
+                    self._host_downloads[host] = self._host_downloads.get(host, 0) + 1
+                    self._in_flight += 1
+                    executor.submit(self._download, job)
+            if queue is not None and len(queue) == 0 and self._host_downloads.get(host, 0) == 0:
+                del self._host_queues[host]
+        for job in abandoned:
+            self._finish(job, *self._get_failure(job, 'rate-limited'))
+
+    def _wake(self, host: str) -> None:
+        """Called by the timer of a host once the rate limiter should let its next request through"""
+        with self._lock:
+            self._waiting_hosts.discard(host)
+        self._dispatch(host)
+
+    def _download(self, job: FetchJob) -> None:
+        """Downloads the job's url in a thread of the pool, putting it back at the front of its host's queue if the
+        host rate limited the request
+        """
+        host = get_host(job.url)
+        if job.deadline is None:
+            # the deadline starts once a thread starts the download, not while it waits for its host
+            job.deadline = time.monotonic() + self.deadline
+        try:
+            outcome = self._fetch(job)
+            if outcome is not None:
+                self._finish(job, *outcome)
+        except Exception as error:  # fetch_many re-raises it
+            job.future.set_exception(error)
+            outcome = error
+        with self._lock:
+            self._host_downloads[host] -= 1
+            self._in_flight -= 1
+            if outcome is None:
+                self._host_queues.setdefault(host, deque()).appendleft(job)
+            # the thread freed can be given to any host, the others first so one host doesn't keep every thread
+            hosts = [other for other in self._host_queues if other != host and other not in self._waiting_hosts]
+            hosts.append(host)
+        for other in hosts:
+            self._dispatch(other)
+
+    def _finish(self, job: FetchJob, result: FetchResult, bytes_read: int) -> None:
+        """Counts the result of the job's download and gives it to the job's future"""
+        result.elapsed = time.monotonic() - job.start
+        result.bytes_read = bytes_read
+        self.stats.record(result, bytes_read)
+        job.future.set_result(result)
+
+    def _get_failure(self, job: FetchJob, error: str) -> tuple[FetchResult, int]:
+        """Returns the result of the job's download failing for the reason error, its stale page if it has one"""
+        if job.cached is not None:
+            # a stale page is better than no page
+            self.http_cache.record('hit')
+            return FetchResult(job.url, job.cached.content, job.cached.status, None, 0, True), 0
+        return FetchResult(job.url, None, None, error, 0), 0
+
+    def _fetch(self, job: FetchJob) -> Optional[tuple[FetchResult, int]]:
+        """Sends the request for the job's url, which the rate limiter already let through. Returns the result of
+        the download along with the number of bytes read, or None if the host rate limited the request and it should
+        be sent again
+        """
+        import requests
+        url = job.url
+        host = get_host(url)
+        cached = job.cached
+        headers = {'User-Agent': get_random_header_agent()}
+        if cached is not None:
+            # only download the page again if it changed
+            if cached.etag is not None:
+                headers['If-None-Match'] = cached.etag
+            if cached.last_modified is not None:
+                headers['If-Modified-Since'] = cached.last_modified
+        try:
+            response = self._get_session().get(url, headers=headers, stream=True,
+                                               timeout=max(0.001, job.deadline - time.monotonic()))
+        except requests.exceptions.RequestException as error:
+            return self._get_failure(job, type(error).__name__)
+        if self.rate_limiter.on_response(host, response.status_code, response.headers.get('Retry-After')):
+            response.close()
+            job.requests_made += 1
+            if job.requests_made < FETCH_MAX_REQUESTS:
+                return None
+            return self._get_failure(job, 'rate-limited')
+        try:
+            if response.status_code == 304 and cached is not None:
+                self.http_cache.refresh(url)
+                self.http_cache.record('revalidation')
+                return FetchResult(url, cached.content, cached.status, None, 0, True), 0
+            if not is_html_content_type(response.headers.get('Content-Type')):
+                return FetchResult(url, None, response.status_code, 'content-type', 0), 0
+            content, error, truncated = self._read_body(response, job.deadline)
+        finally:
+            response.close()
+        if error is not None:
+            return FetchResult(url, None, response.status_code, error, 0), len(content)
+        if self.http_cache is not None:
+            self.http_cache.record('miss')
+            if response.status_code == 200:
+                self.http_cache.put(url, content, response.status_code, response.headers.get('ETag'),
+                                    response.headers.get('Last-Modified'))
+        return FetchResult(url, content, response.status_code, None, 0, False, truncated, response.url), len(content)
+
+    def _read_body(self, response: requests.Response, deadline: float) -> tuple[bytes, Optional[str], bool]:
+        """Reads the body of the streamed response until it ends or max_bytes have been read. Returns the bytes read,
+        the reason reading was abandoned or None if it wasn't, and whether the body was cut off at max_bytes"""
+        import requests
+        chunks = []
+        size = 0
+        has_paragraph = False
+        tail = b''
+        try:
+            for chunk in response.iter_content(FETCH_CHUNK_SIZE):
+                if not has_paragraph:
+                    # keep the end of the last chunk in case a <p> tag is split between chunks
+                    has_paragraph = PARAGRAPH_PATTERN.search(tail + chunk) is not None
+                    tail = chunk[-3:]
+                chunks.append(chunk)
+                size += len(chunk)
+                if size >= self.max_bytes:
+                    return b''.join(chunks)[:self.max_bytes], None if has_paragraph else 'no-paragraphs', True
+                if not has_paragraph and size >= self.sniff_bytes:
+                    return b''.join(chunks), 'no-paragraphs', False
+                if time.monotonic() > deadline:
+                    return b''.join(chunks), 'deadline', False
+        except requests.exceptions.RequestException as error:
+            return b''.join(chunks), type(error).__name__, False
+        return b''.join(chunks), None if has_paragraph else 'no-paragraphs', False
+
+    def fetch_many(self, urls: list[str]) -> Iterator[FetchResult]:
+        """Downloads the urls concurrently and yields the result of every download as soon as it finishes
+        """
+        if len(urls) == 0:
+            return
+        futures = [self._submit(url) for url in urls]
+        for future in as_completed(futures):
+            yield future.result()
+
+    def close(self) -> None:
+        """Waits for the downloads in progress and closes the connections
+        """
+        with self._lock:
+            if self._pid == os.getpid():
+                if self._executor is not None:
+                    self._executor.shutdown(wait=True)
+                if self._session is not None:
+                    self._session.close()
+            self._executor = None
+            self._session = None
+
+
+if __name__ == '__main__':
+    import doctest
+    import python_ta
+
+    doctest.testmod(verbose=True)
+
+    python_ta.check_all(config={
+        'max-line-length': 120,
+        'extra-imports': ['__future__', 'collections', 'concurrent.futures', 'dataclasses', 'typing', 'urllib.parse',
+                          'NewsScraper', 'HttpCache', 'RateLimiter', 'os', 're', 'threading', 'time', 'requests'],
+        'allowed-io': [],
+        'max-nested-blocks': 10
+    })
@@ -0,0 +1,181 @@
+"""
+This Python module contains the class for storing the scores of every article analyzed, shared by every ticker, search
+focus and run. Articles are keyed by their canonical url, with tracking parameters removed and redirects resolved, so
+an article found under several urls or by the searches of several tickers is only downloaded and scored once. The
+stored scores of an article's passages don't depend on the stock it was analyzed for, so its sentiment data for every
+ticker it mentions comes from the same row.
+
+Copyright and Usage Information
+===============================
+
+This file is provided solely for the personal and private use of TAs and professors
+at the University of Toronto St. George campus. All forms of
+distribution of this code, whether as given or with any changes, are
+expressly prohibited. For more information on copyright for CSC111 materials,
+please consult the Course Syllabus.
+
+This file is Copyright (c) 2023 Mark Zhang, Li Zhang and Luke Zhang
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Optional
+from HttpCache import canonicalize_url
+from Sentiment import ArticlePassageScores
+import json
+import os
+import sqlite3
+import threading
+import time
+
+ARTICLE_STORE_FILE = 'scrape_cache/articles.sqlite3'
+
+
+@dataclass
+class StoredArticle:
+    """A dataclass to represent an article in the store
+
+    Instance Attributes:
+        - url: the canonical url of the article, after following redirects
+        - title: the title of the article
+        - scores: the scores of the passages of the article
+
+    Representation Invariants:
+        - self.url == canonicalize_url(self.url)
+    """
+    url: str
+    title: str
+    scores: ArticlePassageScores
+
+
+def _dump_scores(scores: ArticlePassageScores) -> str:
+    """Returns the scores as JSON"""
+    return json.dumps([scores.title_scores, scores.passage_scores])
+
+
+def _load_scores(text: str) -> ArticlePassageScores:
+    """Returns the scores stored as JSON by _dump_scores
+
+    >>> scores = ArticlePassageScores({'GILD': 3.5}, [(True, {'GILD': 1.0, 'MRK': -2.0}), (False, {'GILD': 4.0})])
+    >>> _load_scores(_dump_scores(scores)) == scores
+    True
+    """
+    title_scores, passage_scores = json.loads(text)
+    return ArticlePassageScores(title_scores, [(is_complex, scores) for is_complex, scores in passage_scores])
+
+
+class ArticleStore:
+    """This class stores the scores of articles in a SQLite file.
+
+    Every article has one row keyed by its canonical url, which holds the scores of its passages along with the version
+    of the scorers that produced them, so changing a model or prompt scores the article again. Every url the article
+    was requested under is kept as an alias of its row, so redirects are only followed once.
+
+    Instance Attributes:
+        - path: the location of the SQLite file
+        - version: the version of the scores served, see Sentiment.get_article_scorer_version
+        - hits: the number of lookups that found an article
+        - misses: the number of lookups that didn't find an article
+    Private Instance Attributes:
+        - _connection: the connection to the SQLite file, None until the file is first used
+        - _pid: the id of the process _connection was opened in
+        - _lock: a lock guarding the connection and counters
+
+    Representation Invariants:
+        - self.hits >= 0
+        - self.misses >= 0
+    """
+    path: str
+    version: str
+    hits: int
+    misses: int
+    _connection: Optional[sqlite3.Connection]
+    _pid: int
+    _lock: threading.Lock
+
+    def __init__(self, version: str, path: str = ARTICLE_STORE_FILE) -> None:
+        self.path = path
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self._connection = None
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """Returns the connection to the SQLite file, creating the file and its tables if needed"""
+        if self._connection is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory != '':
+                os.makedirs(directory, exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._pid = os.getpid()
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS articles (url TEXT PRIMARY KEY, title TEXT, '
+                                     'version TEXT, scores TEXT, stored_at REAL)')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS aliases (url TEXT PRIMARY KEY, article_url TEXT)')
+            self._connection.commit()
+        return self._connection
+
+    def get(self, url: str, stored_before: Optional[float] = None) -> Optional[StoredArticle]:
+        """Returns the article requested under the url, or None if it isn't stored or was scored by other scorers.
+        If stored_before is given, articles stored at or after that time are treated as not stored
+        """
+        url = canonicalize_url(url)
+        with self._lock:
+            connection = self._get_connection()
+            alias = connection.execute('SELECT article_url FROM aliases WHERE url = ?', (url,)).fetchone()
+            if alias is not None:
+                url = alias[0]
+            row = connection.execute('SELECT url, title, scores FROM articles WHERE url = ? AND version = ? '
+                                     'AND stored_at < ?', (url, self.version,
+                                                           stored_before if stored_before is not None else float('inf')
+                                                           )).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return StoredArticle(row[0], row[1], _load_scores(row[2]))
+
+    def put(self, url: str, title: str, scores: ArticlePassageScores,
+            final_url: Optional[str] = None) -> StoredArticle:
+        """Stores the article requested under the url, which redirected to final_url if it is given, and returns it
+        """
+        url = canonicalize_url(url)
+        article_url = canonicalize_url(final_url) if final_url is not None else url
+        with self._lock:
+            connection = self._get_connection()
+            connection.execute('INSERT OR REPLACE INTO articles VALUES (?, ?, ?, ?, ?)',
+                               (article_url, title, self.version, _dump_scores(scores), time.time()))
+            if article_url != url:
+                connection.execute('INSERT OR REPLACE INTO aliases VALUES (?, ?)', (url, article_url))
+            connection.commit()
+        return StoredArticle(article_url, title, scores)
+
+    def get_stats(self) -> dict[str, float]:
+        """Returns the counters of the store along with the fraction of articles that didn't need scoring
+        """
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / lookups if lookups > 0 else 0.0}
+
+    def close(self) -> None:
+        """Closes the connection to the SQLite file
+        """
+        with self._lock:
+            if self._connection is not None and self._pid == os.getpid():
+                self._connection.close()
+            self._connection = None
+
+
+if __name__ == '__main__':
+    import doctest
+    import python_ta
+
+    doctest.testmod(verbose=True)
+
+    python_ta.check_all(config={
+        'max-line-length': 120,
+        'extra-imports': ['__future__', 'dataclasses', 'typing', 'HttpCache', 'Sentiment', 'json', 'os', 'sqlite3',
+                          'threading', 'time'],
+        'allowed-io': [],
+        'max-nested-blocks': 10
+    })
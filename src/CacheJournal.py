@@ -0,0 +1,301 @@
+"""
+This Python module contains the class for saving the progress of an analysis as it happens. Every analyzed article is
+committed to a SQLite file in write-ahead logging mode as one small transaction, so saving the progress of a ticker no
+longer rewrites the data of every ticker and a crash can at most lose the article being committed. The cache CSV is
+exported from the analyzed data once a run finishes and is imported again whenever it is changed by anything else.
+
+Copyright and Usage Information
+===============================
+
+This file is provided solely for the personal and private use of TAs and professors
+at the University of Toronto St. George campus. All forms of
+distribution of this code, whether as given or with any changes, are
+expressly prohibited. For more information on copyright for CSC111 materials,
+please consult the Course Syllabus.
+
+This file is Copyright (c) 2023 Mark Zhang, Li Zhang and Luke Zhang
+"""
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Optional
+import os
+import sqlite3
+import threading
+from urllib.request import pathname2url
+
+# the journal of a cache CSV is kept next to it, under its name followed by this suffix
+JOURNAL_SUFFIX = '.journal.sqlite3'
+
+
+@dataclass
+class CachedTicker:
+    """A dataclass to represent the progress of the analysis of a ticker kept in a journal
+
+    Instance Attributes:
+        - ticker: the ticker analyzed
+        - primary_articles_data: the url and sentiment score of every article focusing on the ticker, in order
+        - linking_articles_data: the url and sentiment score of every article of another ticker mentioning the ticker,
+                                 in order
+        - connected_tickers: the number of articles of the ticker mentioning every connected ticker, in the order they
+                             were first mentioned
+        - done_scraping: whether the articles of the ticker were scraped
+    """
+    ticker: str
+    primary_articles_data: list[tuple[str, float]] = field(default_factory=list)
+    linking_articles_data: list[tuple[str, float]] = field(default_factory=list)
+    connected_tickers: dict[str, int] = field(default_factory=dict)
+    done_scraping: bool = False
+
+
+def get_journal_path(csv_path: str) -> str:
+    """Returns the location of the journal of the cache CSV
+
+    >>> get_journal_path('scrape_cache/Default')
+    'scrape_cache/Default.journal.sqlite3'
+    """
+    return csv_path + JOURNAL_SUFFIX
+
+
+def get_file_version(path: str) -> Optional[str]:
+    """Returns a string that changes whenever the file is written, or None if it doesn't exist"""
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return str(stat.st_mtime_ns) + ':' + str(stat.st_size)
+
+
+class CacheJournal:
+    """This class keeps the progress of an analysis in a SQLite file in write-ahead logging mode.
+
+    The articles of every ticker, the articles linking it and its connected tickers are rows ordered by when they were
+    added, so loading the journal gives the lists in the same order as the analyzed data they were recorded from. The
+    journal remembers the version of the cache CSV it was last exported to or imported from and whether progress was
+    committed since then; once the CSV is changed by anything else, the journal is out of date and is imported from
+    the CSV again. The journal also keeps what incremental refreshes need that the CSV doesn't have: when the
+    articles of every ticker were last searched for and the urls of the articles already tried for it.
+
+    A read only journal opens an existing SQLite file without creating tables or moving the write-ahead log into the
+    file, so only the load methods can be used on it.
+
+    Instance Attributes:
+        - path: the location of the SQLite file
+        - records: the number of transactions committed since the journal was opened
+        - read_only: a boolean representing if the SQLite file is only read, never created or written to
+    Private Instance Attributes:
+        - _connection: the connection to the SQLite file, None until the file is first used
+        - _lock: a lock guarding the connection
+
+    Representation Invariants:
+        - self.records >= 0
+    """
+    path: str
+    records: int
+    read_only: bool
+    _connection: Optional[sqlite3.Connection]
+    _lock: threading.Lock
+
+    def __init__(self, path: str, read_only: bool = False) -> None:
+        self.path = path
+        self.records = 0
+        self.read_only = read_only
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """Returns the connection to the SQLite file, creating the file and its tables if needed unless the journal is
+        read only"""
+        if self._connection is None and self.read_only:
+            self._connection = sqlite3.connect('file:' + pathname2url(os.path.abspath(self.path)) + '?mode=ro',
+                                               uri=True, check_same_thread=False, timeout=30)
+        elif self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory != '':
+                os.makedirs(directory, exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS tickers (ticker TEXT PRIMARY KEY, '
+                                     'done_scraping INTEGER)')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS primary_articles (seq INTEGER PRIMARY KEY '
+                                     'AUTOINCREMENT, ticker TEXT, url TEXT, score REAL)')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS linking_articles (seq INTEGER PRIMARY KEY '
+                                     'AUTOINCREMENT, ticker TEXT, url TEXT, score REAL)')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS connected_tickers (seq INTEGER PRIMARY KEY '
+                                     'AUTOINCREMENT, ticker TEXT, connected_ticker TEXT, frequency INTEGER, '
+                                     'UNIQUE (ticker, connected_ticker))')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS refreshes (ticker TEXT PRIMARY KEY, '
+                                     'refreshed_at REAL)')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS seen_urls (ticker TEXT, url TEXT, '
+                                     'PRIMARY KEY (ticker, url))')
+            self._connection.commit()
+        return self._connection
+
+    def is_exported(self, csv_path: str) -> bool:
+        """Returns whether the journal holds the data of the cache CSV, which is the case if the CSV, or its absence,
+        is what the journal was last exported to or imported from
+        """
+        with self._lock:
+            row = self._get_connection().execute("SELECT value FROM meta WHERE key = 'csv_version'").fetchone()
+        return row is not None and row[0] == get_file_version(csv_path)
+
+    def has_unexported_records(self) -> bool:
+        """Returns whether progress was committed to the journal since it was last exported or imported, which is the
+        case if the analysis stopped before it could export its progress
+        """
+        with self._lock:
+            row = self._get_connection().execute("SELECT value FROM meta WHERE key = 'dirty'").fetchone()
+        return row is not None
+
+    def mark_exported(self, csv_path: str) -> None:
+        """Records that the data of the journal was just exported to the cache CSV
+        """
+        with self._lock:
+            connection = self._get_connection()
+            with connection:
+                connection.execute("INSERT OR REPLACE INTO meta VALUES ('csv_version', ?)",
+                                   (get_file_version(csv_path),))
+                connection.execute("DELETE FROM meta WHERE key = 'dirty'")
+
+    def load(self) -> dict[str, CachedTicker]:
+        """Returns the progress of every ticker in the journal
+        """
+        with self._lock:
+            connection = self._get_connection()
+            tickers = {row[0]: CachedTicker(row[0], done_scraping=bool(row[1]))
+                       for row in connection.execute('SELECT ticker, done_scraping FROM tickers')}
+            for ticker, url, score in connection.execute('SELECT ticker, url, score FROM primary_articles '
+                                                         'ORDER BY seq'):
+                tickers.setdefault(ticker, CachedTicker(ticker)).primary_articles_data.append((url, score))
+            for ticker, url, score in connection.execute('SELECT ticker, url, score FROM linking_articles '
+                                                         'ORDER BY seq'):
+                tickers.setdefault(ticker, CachedTicker(ticker)).linking_articles_data.append((url, score))
+            for ticker, connected_ticker, frequency in connection.execute(
+                    'SELECT ticker, connected_ticker, frequency FROM connected_tickers ORDER BY seq'):
+                tickers.setdefault(ticker, CachedTicker(ticker)).connected_tickers[connected_ticker] = frequency
+        return tickers
+
+    def reset(self, tickers: list[CachedTicker], csv_path: str) -> None:
+        """Replaces the data of the journal with the progress of the tickers, imported from the cache CSV
+        """
+        with self._lock:
+            connection = self._get_connection()
+            with connection:
+                for table in ('tickers', 'primary_articles', 'linking_articles', 'connected_tickers'):
+                    connection.execute('DELETE FROM ' + table)
+                for cached_ticker in tickers:
+                    ticker = cached_ticker.ticker
+                    connection.execute('INSERT INTO tickers VALUES (?, ?)', (ticker, int(cached_ticker.done_scraping)))
+                    connection.executemany('INSERT INTO primary_articles (ticker, url, score) VALUES (?, ?, ?)',
+                                           [(ticker, url, score) for url, score in cached_ticker.primary_articles_data])
+                    connection.executemany('INSERT INTO linking_articles (ticker, url, score) VALUES (?, ?, ?)',
+                                           [(ticker, url, score) for url, score in cached_ticker.linking_articles_data])
+                    connection.executemany('INSERT INTO connected_tickers (ticker, connected_ticker, frequency) '
+                                           'VALUES (?, ?, ?)', [(ticker, connected_ticker, frequency)
+                                                                for connected_ticker, frequency
+                                                                in cached_ticker.connected_tickers.items()])
+                connection.execute("INSERT OR REPLACE INTO meta VALUES ('csv_version', ?)",
+                                   (get_file_version(csv_path),))
+                connection.execute("DELETE FROM meta WHERE key = 'dirty'")
+            connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    def _update_connected_tickers(self, connection: sqlite3.Connection, ticker: str,
+                                  connected_tickers: dict[str, int]) -> None:
+        """Sets the frequencies of the connected tickers of the ticker, keeping the order they were first added in"""
+        connection.executemany('INSERT INTO connected_tickers (ticker, connected_ticker, frequency) VALUES (?, ?, ?) '
+                               'ON CONFLICT (ticker, connected_ticker) DO UPDATE SET frequency = excluded.frequency',
+                               [(ticker, connected_ticker, frequency)
+                                for connected_ticker, frequency in connected_tickers.items()])
+
+    def record_article(self, ticker: str, url: str, score: float, connected_tickers: dict[str, int],
+                       linking_articles: list[tuple[str, str, float]]) -> None:
+        """Commits an article analyzed for the ticker with its sentiment score, along with the new frequencies of the
+        connected tickers it mentions and the ticker, url and score of every article linking it added
+        """
+        with self._lock:
+            connection = self._get_connection()
+            with connection:
+                connection.execute("INSERT OR REPLACE INTO meta VALUES ('dirty', '1')")
+                connection.execute('INSERT OR IGNORE INTO tickers VALUES (?, 0)', (ticker,))
+                connection.execute('INSERT INTO primary_articles (ticker, url, score) VALUES (?, ?, ?)',
+                                   (ticker, url, score))
+                self._update_connected_tickers(connection, ticker, connected_tickers)
+                for linked_ticker, linked_url, linked_score in linking_articles:
+                    connection.execute('INSERT OR IGNORE INTO tickers VALUES (?, 0)', (linked_ticker,))
+                    connection.execute('INSERT INTO linking_articles (ticker, url, score) VALUES (?, ?, ?)',
+                                       (linked_ticker, linked_url, linked_score))
+            self.records += 1
+
+    def record_ticker(self, ticker: str, connected_tickers: dict[str, int],
+                      removed_linking_articles: list[tuple[str, str]], done_scraping: bool) -> None:
+        """Commits the end of the analysis of the ticker: the new frequencies of its connected tickers, the ticker
+        and url of every article linking it removed and whether it is done scraping
+        """
+        with self._lock:
+            connection = self._get_connection()
+            with connection:
+                connection.execute("INSERT OR REPLACE INTO meta VALUES ('dirty', '1')")
+                connection.execute('INSERT OR REPLACE INTO tickers VALUES (?, ?)', (ticker, int(done_scraping)))
+                self._update_connected_tickers(connection, ticker, connected_tickers)
+                for linked_ticker, linked_url in removed_linking_articles:
+                    # only the first article with the url is removed, like StockAnalyzer.remove_linking_article_by_url
+                    connection.execute('DELETE FROM linking_articles WHERE seq = (SELECT MIN(seq) FROM '
+                                       'linking_articles WHERE ticker = ? AND url = ?)', (linked_ticker, linked_url))
+            self.records += 1
+
+    def load_refreshes(self) -> tuple[dict[str, float], dict[str, set[str]]]:
+        """Returns the time the articles of every ticker were last searched for and the urls of the articles tried for
+        every ticker so far
+        """
+        with self._lock:
+            connection = self._get_connection()
+            refreshes = dict(connection.execute('SELECT ticker, refreshed_at FROM refreshes').fetchall())
+            seen_urls = {}
+            for ticker, url in connection.execute('SELECT ticker, url FROM seen_urls'):
+                seen_urls.setdefault(ticker, set()).add(url)
+        return refreshes, seen_urls
+
+    def record_refresh(self, ticker: str, refreshed_at: float, seen_urls: list[str]) -> None:
+        """Commits that the articles of the ticker were searched for at the given time and the urls of the articles
+        tried for it. The refreshes aren't part of the cache CSV, so they are kept when the journal is imported again
+        """
+        with self._lock:
+            connection = self._get_connection()
+            with connection:
+                connection.execute('INSERT OR REPLACE INTO refreshes VALUES (?, ?)', (ticker, refreshed_at))
+                connection.executemany('INSERT OR IGNORE INTO seen_urls VALUES (?, ?)',
+                                       [(ticker, url) for url in seen_urls])
+            self.records += 1
+
+    def forget_refreshes(self) -> None:
+        """Forgets every refresh, so every ticker is analyzed as if it never was
+        """
+        with self._lock:
+            connection = self._get_connection()
+            with connection:
+                connection.execute('DELETE FROM refreshes')
+                connection.execute('DELETE FROM seen_urls')
+
+    def close(self) -> None:
+        """Moves the write-ahead log into the SQLite file, unless the journal is read only, and closes the connection
+        to it
+        """
+        with self._lock:
+            if self._connection is not None:
+                if not self.read_only:
+                    self._connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+                self._connection.close()
+            self._connection = None
+
+
+if __name__ == '__main__':
+    import doctest
+    import python_ta
+
+    doctest.testmod(verbose=True)
+
+    python_ta.check_all(config={
+        'max-line-length': 120,
+        'extra-imports': ['__future__', 'dataclasses', 'typing', 'os', 'sqlite3', 'threading', 'urllib.request'],
+        'allowed-io': [],
+        'max-nested-blocks': 10
+    })
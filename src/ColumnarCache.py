@@ -0,0 +1,280 @@
+"""
+This Python module contains the class for the columnar format the cache of an analysis is loaded from. Every list of
+the cache CSV is stored as typed arrays: the urls and tickers are interned into a single string table and referenced
+by index, the sentiment scores and frequencies are stored as machine numbers and the lists of every ticker are slices
+given by offsets. Loading the file memory-maps it and reads every column at once instead of evaluating the text of
+every cell of the CSV, and the format converts losslessly to and from the CACHE_HEADERS CSV.
+
+Copyright and Usage Information
+===============================
+
+This file is provided solely for the personal and private use of TAs and professors
+at the University of Toronto St. George campus. All forms of
+distribution of this code, whether as given or with any changes, are
+expressly prohibited. For more information on copyright for CSC111 materials,
+please consult the Course Syllabus.
+
+This file is Copyright (c) 2023 Mark Zhang, Li Zhang and Luke Zhang
+"""
+from __future__ import annotations
+from array import array
+from typing import Any, Optional
+from CacheJournal import CachedTicker, get_file_version
+import ast
+import json
+import mmap
+import os
+import struct
+import sys
+
+CACHE_HEADERS = [
+    'Ticker', 'ArticlesUrls', 'ArticlesSentimentScores', 'ConnectedTickers', 'ConnectedFrequency',
+    'LinkingArticlesUrls', 'LinkingArticlesSentimentScores', 'DoneScraping'
+]
+# the columnar file of a cache CSV is kept next to it, under its name followed by this suffix
+COLUMNAR_SUFFIX = '.columns'
+COLUMNAR_MAGIC = b'RSSCOLS1'
+# the typecode of every column, see the array module
+COLUMN_TYPES = {
+    'tickers': 'i', 'done_scraping': 'i',
+    'primary_offsets': 'q', 'primary_urls': 'i', 'primary_scores': 'd', 'primary_is_int': 'B',
+    'linking_offsets': 'q', 'linking_urls': 'i', 'linking_scores': 'd', 'linking_is_int': 'B',
+    'connected_offsets': 'q', 'connected_tickers': 'i', 'connected_frequencies': 'q'
+}
+
+
+def get_columnar_path(csv_path: str) -> str:
+    """Returns the location of the columnar file of the cache CSV
+
+    >>> get_columnar_path('scrape_cache/Default')
+    'scrape_cache/Default.columns'
+    """
+    return csv_path + COLUMNAR_SUFFIX
+
+
+def _get_list(columns: dict[str, Any], kind: str, strings: list[str], start: int, end: int) -> list:
+    """Returns the urls and scores of a list of articles of a ticker, stored from start to end in the columns of the
+    kind ('primary' or 'linking'), with the scores that were integers in the CSV given back as integers"""
+    scores = columns[kind + '_scores'][start:end]
+    is_int = columns[kind + '_is_int']
+    position = is_int.find(1, start, end)
+    while position != -1:
+        scores[position - start] = int(scores[position - start])
+        position = is_int.find(1, position + 1, end)
+    return list(zip(map(strings.__getitem__, columns[kind + '_urls'][start:end]), scores))
+
+
+class ColumnarCache:
+    """This class holds the rows of a cache CSV as typed columns.
+
+    A file is laid out as COLUMNAR_MAGIC, the length of a JSON header and the header, followed by the string table (the
+    UTF-8 strings joined by NUL characters) and every column of COLUMN_TYPES, each aligned to 8 bytes. The header gives
+    the number of rows, the version of the CSV the file was converted from, the byte order and where the string table
+    and every column are from the end of the header. Scores are stored as doubles along with whether they were
+    integers, so the CSV a cache is converted back into has the same text in every cell.
+
+    Instance Attributes:
+        - strings: the string table, every url, ticker and DoneScraping value of the cache once
+        - columns: the columns by name, arrays when built and memoryviews of the file when loaded
+        - csv_version: the version of the CSV the columns were converted from or to, see CacheJournal.get_file_version
+    Private Instance Attributes:
+        - _mmap: the memory map of the file the columns were loaded from, None if they were built
+
+    Representation Invariants:
+        - all(name in self.columns for name in COLUMN_TYPES)
+        - all('\\0' not in string for string in self.strings)
+    """
+    strings: list[str]
+    columns: dict[str, Any]
+    csv_version: Optional[str]
+    _mmap: Optional[mmap.mmap]
+
+    def __init__(self, strings: list[str], columns: dict[str, Any], csv_version: Optional[str] = None,
+                 memory_map: Optional[mmap.mmap] = None) -> None:
+        self.strings = strings
+        self.columns = columns
+        self.csv_version = csv_version
+        self._mmap = memory_map
+
+    @classmethod
+    def from_lists(cls, rows: list[tuple[str, list, list, list, list, list, list, str]]) -> ColumnarCache:
+        """Returns the columns of the rows, every row being the values of the cells of CACHE_HEADERS in order with
+        the lists evaluated
+        """
+        string_ids, strings = {}, []
+        columns = {name: array(typecode) for name, typecode in COLUMN_TYPES.items()}
+
+        def intern(string: str) -> int:
+            """Returns the index of the string in the string table, adding it if it isn't there"""
+            if string not in string_ids:
+                if '\0' in string:
+                    raise ValueError('cache strings cannot contain NUL characters: ' + repr(string))
+                string_ids[string] = len(strings)
+                strings.append(string)
+            return string_ids[string]
+
+        for column in ('primary_offsets', 'linking_offsets', 'connected_offsets'):
+            columns[column].append(0)
+        for ticker, urls, scores, connected, frequencies, linking_urls, linking_scores, done_scraping in rows:
+            columns['tickers'].append(intern(ticker))
+            columns['done_scraping'].append(intern(done_scraping))
+            for kind, kind_urls, kind_scores in (('primary', urls, scores), ('linking', linking_urls, linking_scores)):
+                columns[kind + '_urls'].extend(intern(url) for url in kind_urls)
+                columns[kind + '_scores'].extend(float(score) for score in kind_scores)
+                columns[kind + '_is_int'].extend(int(isinstance(score, int)) for score in kind_scores)
+                columns[kind + '_offsets'].append(len(columns[kind + '_urls']))
+            columns['connected_tickers'].extend(intern(connected_ticker) for connected_ticker in connected)
+            columns['connected_frequencies'].extend(frequencies)
+            columns['connected_offsets'].append(len(columns['connected_tickers']))
+        return cls(strings, columns)
+
+    @classmethod
+    def from_rows(cls, rows: list[dict[str, str]]) -> ColumnarCache:
+        """Returns the columns of the rows of a cache CSV, as read by CSV.read_file
+        """
+        return cls.from_lists([(row['Ticker'], ast.literal_eval(row['ArticlesUrls']),
+                                ast.literal_eval(row['ArticlesSentimentScores']),
+                                ast.literal_eval(row['ConnectedTickers']),
+                                ast.literal_eval(row['ConnectedFrequency']),
+                                ast.literal_eval(row['LinkingArticlesUrls']),
+                                ast.literal_eval(row['LinkingArticlesSentimentScores']), row['DoneScraping'])
+                               for row in rows if row != {}])
+
+    @classmethod
+    def from_cached_tickers(cls, cached_tickers: list[CachedTicker]) -> ColumnarCache:
+        """Returns the columns of the progress of the tickers
+        """
+        return cls.from_lists([(cached_ticker.ticker,
+                                [url for url, _ in cached_ticker.primary_articles_data],
+                                [score for _, score in cached_ticker.primary_articles_data],
+                                list(cached_ticker.connected_tickers), list(cached_ticker.connected_tickers.values()),
+                                [url for url, _ in cached_ticker.linking_articles_data],
+                                [score for _, score in cached_ticker.linking_articles_data],
+                                str(cached_ticker.done_scraping)) for cached_ticker in cached_tickers])
+
+    @classmethod
+    def load(cls, path: str, csv_path: Optional[str] = None) -> Optional[ColumnarCache]:
+        """Returns the columns memory-mapped from the file, or None if it doesn't exist, can't be read on this machine
+        or, if csv_path is given, was converted from another version of the CSV
+        """
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return None
+        with open(path, 'rb') as file:
+            memory_map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(memory_map)
+        if bytes(view[:len(COLUMNAR_MAGIC)]) != COLUMNAR_MAGIC:
+            view.release()
+            memory_map.close()
+            return None
+        header_start = len(COLUMNAR_MAGIC) + 8
+        header_length = struct.unpack('<Q', view[len(COLUMNAR_MAGIC):header_start])[0]
+        header = json.loads(bytes(view[header_start:header_start + header_length]))
+        base = header_start + header_length
+        if header['byteorder'] != sys.byteorder or \
+                (csv_path is not None and header['csv_version'] != get_file_version(csv_path)):
+            view.release()
+            memory_map.close()
+            return None
+        start, end = header['strings']
+        strings = str(view[base + start:base + end], 'utf-8').split('\0') if end > start else []
+        columns = {}
+        for name, typecode in COLUMN_TYPES.items():
+            start, end = header['columns'][name]
+            columns[name] = view[base + start:base + end].cast(typecode)
+        view.release()
+        return cls(strings, columns, header['csv_version'], memory_map)
+
+    def write(self, path: str, csv_path: Optional[str] = None) -> None:
+        """Writes the columns to the file, replacing it at once so it is never left half written. If csv_path is
+        given, the columns are recorded as converted from the CSV as it is now
+        """
+        if csv_path is not None:
+            self.csv_version = get_file_version(csv_path)
+        string_table = '\0'.join(self.strings).encode('utf-8')
+        blocks, layout = [string_table], {}
+        position = len(string_table)
+        for name in COLUMN_TYPES:
+            data = array(COLUMN_TYPES[name], self.columns[name]).tobytes()
+            padding = -position % 8
+            blocks += [b'\0' * padding, data]
+            layout[name] = [position + padding, position + padding + len(data)]
+            position += padding + len(data)
+        header_bytes = json.dumps({'rows': len(self.columns['tickers']), 'csv_version': self.csv_version,
+                                   'byteorder': sys.byteorder, 'strings': [0, len(string_table)],
+                                   'columns': layout}).encode('utf-8')
+        # the data starts at the next multiple of 8 after the header so every column is aligned
+        header_bytes += b' ' * (-(len(COLUMNAR_MAGIC) + 8 + len(header_bytes)) % 8)
+        directory = os.path.dirname(path)
+        if directory != '':
+            os.makedirs(directory, exist_ok=True)
+        with open(path + '.tmp', 'wb') as file:
+            file.write(COLUMNAR_MAGIC + struct.pack('<Q', len(header_bytes)) + header_bytes)
+            for block in blocks:
+                file.write(block)
+        os.replace(path + '.tmp', path)
+
+    def get_cached_tickers(self) -> list[CachedTicker]:
+        """Returns the progress of the ticker of every row
+        """
+        strings = self.strings
+        columns = {name: self.columns[name].tolist() for name in COLUMN_TYPES if not name.endswith('_is_int')}
+        columns['primary_is_int'] = bytes(self.columns['primary_is_int'])
+        columns['linking_is_int'] = bytes(self.columns['linking_is_int'])
+        primary_offsets, linking_offsets = columns['primary_offsets'], columns['linking_offsets']
+        connected_offsets = columns['connected_offsets']
+        cached_tickers = []
+        for row in range(len(columns['tickers'])):
+            start, end = connected_offsets[row], connected_offsets[row + 1]
+            cached_tickers.append(CachedTicker(
+                ticker=strings[columns['tickers'][row]],
+                primary_articles_data=_get_list(columns, 'primary', strings, primary_offsets[row],
+                                                primary_offsets[row + 1]),
+                linking_articles_data=_get_list(columns, 'linking', strings, linking_offsets[row],
+                                                linking_offsets[row + 1]),
+                connected_tickers=dict(zip(map(strings.__getitem__, columns['connected_tickers'][start:end]),
+                                           columns['connected_frequencies'][start:end])),
+                # the csv is exported with True but the presets were saved with TRUE
+                done_scraping=strings[columns['done_scraping'][row]].upper() == 'TRUE'
+            ))
+        return cached_tickers
+
+    def get_rows(self) -> list[dict[str, str]]:
+        """Returns the rows of the cache CSV the columns convert to, with CACHE_HEADERS as their keys
+        """
+        rows = []
+        for cached_ticker, row in zip(self.get_cached_tickers(), range(len(self.columns['tickers']))):
+            rows.append({
+                'Ticker': cached_ticker.ticker,
+                'ArticlesUrls': str([url for url, _ in cached_ticker.primary_articles_data]),
+                'ArticlesSentimentScores': str([score for _, score in cached_ticker.primary_articles_data]),
+                'ConnectedTickers': str(list(cached_ticker.connected_tickers)),
+                'ConnectedFrequency': str(list(cached_ticker.connected_tickers.values())),
+                'LinkingArticlesUrls': str([url for url, _ in cached_ticker.linking_articles_data]),
+                'LinkingArticlesSentimentScores': str([score for _, score in cached_ticker.linking_articles_data]),
+                'DoneScraping': self.strings[self.columns['done_scraping'][row]]
+            })
+        return rows
+
+    def close(self) -> None:
+        """Releases the memory map the columns were loaded from, the columns can't be used afterwards
+        """
+        if self._mmap is not None:
+            for column in self.columns.values():
+                column.release()
+            self._mmap.close()
+            self._mmap = None
+
+
+if __name__ == '__main__':
+    import doctest
+    import python_ta
+
+    doctest.testmod(verbose=True)
+
+    python_ta.check_all(config={
+        'max-line-length': 120,
+        'extra-imports': ['__future__', 'array', 'typing', 'CacheJournal', 'ast', 'json', 'mmap', 'os', 'struct',
+                          'sys'],
+        'allowed-io': ['ColumnarCache.load', 'ColumnarCache.write'],
+        'max-nested-blocks': 10
+    })
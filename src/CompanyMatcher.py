@@ -0,0 +1,175 @@
+"""
+This Python module contains the classes for finding the companies mentioned in a passage. All the company names,
+aliases and tickers are compiled once into an Aho-Corasick automaton, so a passage is matched in a single pass over
+its characters no matter how many companies are being tracked.
+
+Copyright and Usage Information
+===============================
+
+This file is provided solely for the personal and private use of TAs and professors
+at the University of Toronto St. George campus. All forms of
+distribution of this code, whether as given or with any changes, are
+expressly prohibited. For more information on copyright for CSC111 materials,
+please consult the Course Syllabus.
+
+This file is Copyright (c) 2023 Mark Zhang, Li Zhang and Luke Zhang
+"""
+from __future__ import annotations
+from collections import deque
+from dataclasses import dataclass
+
+# exchanges that are written before a ticker, ie. (NASDAQ: MQ)
+TICKER_EXCHANGES = ['NASDAQ', 'NYSE', 'AMEX', 'OTC', 'TSX']
+# the column of the tickers csv holding other names for a company, separated by ALIAS_SEPARATOR
+ALIASES_COLUMN = 'Aliases'
+ALIAS_SEPARATOR = ';'
+
+# the kinds of patterns, they differ in what has to surround a match
+NAME_PATTERN = 0
+TICKER_PATTERN = 1
+
+
+@dataclass
+class CompanyMention:
+    """A dataclass representing a company mentioned inside of a passage
+
+    Instance Attributes:
+        - ticker: the ticker of the company mentioned
+        - start: the index of the passage where the mention starts
+        - end: the index of the passage right after where the mention ends
+
+    Representation Invariants:
+        - self.ticker != ''
+        - 0 <= self.start < self.end
+    """
+    ticker: str
+    start: int
+    end: int
+
+
+def normalize_text(text: str) -> str:
+    """Returns the text in upper case without changing its length so indexes in it match the original text
+
+    >>> normalize_text('Apple and Microsoft')
+    'APPLE AND MICROSOFT'
+    """
+    normalized = text.upper()
+    if len(normalized) == len(text):
+        return normalized
+    # some characters (ie. ß) grow when upper cased so keep those characters as they are
+    return ''.join([char.upper() if len(char.upper()) == 1 else char for char in text])
+
+
+class CompanyMatcher:
+    """This class finds every company mentioned in a passage in one pass using an Aho-Corasick automaton.
+
+    Company names and aliases match when they are a whole word in the passage, they must be preceded by a space (or
+    start the passage) and followed by a space or a period. Tickers only match in the forms $TICKER and
+    EXCHANGE: TICKER since bare tickers such as "U" or "A" are also common words.
+
+    Private Instance Attributes:
+        - _goto: the transitions of the automaton, _goto[state] maps a character to the next state
+        - _fail: the state to fall back to when there is no transition, for every state
+        - _outputs: the patterns ending at every state as (pattern length, ticker, pattern kind) tuples
+
+    Representation Invariants:
+        - len(self._goto) == len(self._fail) == len(self._outputs)
+    """
+    _goto: list[dict[str, int]]
+    _fail: list[int]
+    _outputs: list[list[tuple[int, str, int]]]
+
+    def __init__(self, rows: list[dict[str, str]]) -> None:
+        """Builds the automaton from the rows of the tickers csv
+
+        Preconditions:
+            - every row in rows has a 'Symbol' and 'Name' key
+        """
+        self._goto = [{}]
+        self._fail = [0]
+        self._outputs = [[]]
+        for row in rows:
+            ticker = row['Symbol'].upper()
+            names = [row['Name']]
+            if row.get(ALIASES_COLUMN):
+                names += row[ALIASES_COLUMN].split(ALIAS_SEPARATOR)
+            for name in names:
+                if name.strip() != '':
+                    self._add_pattern(normalize_text(name.strip()), ticker, NAME_PATTERN)
+            self._add_pattern('$' + ticker, ticker, TICKER_PATTERN)
+            for exchange in TICKER_EXCHANGES:
+                self._add_pattern(exchange + ': ' + ticker, ticker, TICKER_PATTERN)
+        self._build_fail_links()
+
+    def _add_pattern(self, pattern: str, ticker: str, kind: int) -> None:
+        """Adds a pattern to the trie of the automaton"""
+        state = 0
+        for char in pattern:
+            if char not in self._goto[state]:
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append([])
+                self._goto[state][char] = len(self._goto) - 1
+            state = self._goto[state][char]
+        self._outputs[state].append((len(pattern), ticker, kind))
+
+    def _build_fail_links(self) -> None:
+        """Computes the fail links of the trie with a BFS, turning it into an Aho-Corasick automaton"""
+        states = deque(self._goto[0].values())
+        while states:
+            state = states.popleft()
+            for char, next_state in self._goto[state].items():
+                states.append(next_state)
+                fallback = self._fail[state]
+                while fallback != 0 and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                if self._fail[next_state] == next_state:
+                    self._fail[next_state] = 0
+                # a state also outputs the patterns of the state it falls back to
+                self._outputs[next_state] = self._outputs[next_state] + self._outputs[self._fail[next_state]]
+
+    def find_mentions(self, passage: str) -> list[CompanyMention]:
+        """Returns every company mention in the passage, ordered by where they start in the passage
+        """
+        text = normalize_text(passage)
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        mentions = []
+        state = 0
+        for index, char in enumerate(text):
+            while state != 0 and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length, ticker, kind in outputs[state]:
+                start, end = index - length + 1, index + 1
+                if _has_boundaries(text, start, end, kind):
+                    mentions.append(CompanyMention(ticker=ticker, start=start, end=end))
+        mentions.sort(key=lambda mention: (mention.start, mention.end))
+        return mentions
+
+    def find_tickers(self, passage: str) -> set[str]:
+        """Returns a set containing the tickers of all the companies mentioned in the passage
+        """
+        return {mention.ticker for mention in self.find_mentions(passage)}
+
+
+def _has_boundaries(text: str, start: int, end: int, kind: int) -> bool:
+    """Returns whether a match of the given kind between start and end is surrounded by what it needs to be"""
+    if kind == NAME_PATTERN:
+        return (start == 0 or text[start - 1] == ' ') and end < len(text) and text[end] in ' .'
+    else:
+        return (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum())
+
+
+if __name__ == '__main__':
+    import doctest
+    import python_ta
+
+    doctest.testmod(verbose=True)
+
+    python_ta.check_all(config={
+        'max-line-length': 120,
+        'extra-imports': ['__future__', 'collections', 'dataclasses'],
+        'allowed-io': [],
+        'max-nested-blocks': 10
+    })
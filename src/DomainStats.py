@@ -0,0 +1,251 @@
+"""
+This Python module contains the class for keeping statistics on how useful the articles of every publisher's domain
+are: how often a download gives an article that can be scored, how many bytes are downloaded for every sentence that
+mentions a stock and how long downloads take. The statistics are stored on disk and used to try the urls of
+productive domains first and to skip domains that keep giving paywalled or JavaScript rendered pages.
+
+Copyright and Usage Information
+===============================
+
+This file is provided solely for the personal and private use of TAs and professors
+at the University of Toronto St. George campus. All forms of
+distribution of this code, whether as given or with any changes, are
+expressly prohibited. For more information on copyright for CSC111 materials,
+please consult the Course Syllabus.
+
+This file is Copyright (c) 2023 Mark Zhang, Li Zhang and Luke Zhang
+"""
+from __future__ import annotations
+from dataclasses import dataclass, replace
+from typing import Optional
+from urllib.parse import urlsplit
+import os
+import sqlite3
+import threading
+import time
+
+DOMAIN_STATS_FILE = 'scrape_cache/domain_stats.sqlite3'
+# the weight of the statistics so far when a new download is recorded, so a domain that changes is noticed
+DOMAIN_STATS_DECAY = 0.95
+# the success rate a domain is assumed to have before any of its downloads, given the weight of this many downloads
+PRIOR_SUCCESS_RATE = 0.5
+PRIOR_ATTEMPTS = 2.0
+# a domain is skipped once this many of its downloads were recorded and fewer than this fraction gave an article
+MIN_ATTEMPTS = 5.0
+SKIP_SUCCESS_RATE = 0.2
+# the number of seconds after its last download a skipped domain is tried again, in case it changed
+SKIP_RETRY_AFTER = 7 * 24 * 60 * 60
+
+
+@dataclass
+class DomainYield:
+    """A dataclass to represent the statistics of the downloads from a domain. Every count decays by DOMAIN_STATS_DECAY
+    whenever a download is recorded, so recent downloads weigh the most
+
+    Instance Attributes:
+        - attempts: the number of downloads
+        - successes: the number of downloads that gave an article with a sentence mentioning a stock and a sentiment
+                     other than 0
+        - useful_sentences: the number of sentences mentioning a stock in the articles downloaded
+        - bytes_read: the number of bytes downloaded
+        - seconds: the number of seconds the downloads took
+        - last_attempt: the time of the last download
+
+    Representation Invariants:
+        - 0 <= self.successes <= self.attempts
+        - self.useful_sentences >= 0
+        - self.bytes_read >= 0
+        - self.seconds >= 0
+    """
+    attempts: float = 0.0
+    successes: float = 0.0
+    useful_sentences: float = 0.0
+    bytes_read: float = 0.0
+    seconds: float = 0.0
+    last_attempt: float = 0.0
+
+    def get_success_rate(self) -> float:
+        """Returns the estimated chance a download from the domain gives a useful article, starting from
+        PRIOR_SUCCESS_RATE for a domain with no downloads
+
+        >>> DomainYield().get_success_rate()
+        0.5
+        >>> DomainYield(attempts=8, successes=0).get_success_rate()
+        0.1
+        """
+        return (self.successes + PRIOR_SUCCESS_RATE * PRIOR_ATTEMPTS) / (self.attempts + PRIOR_ATTEMPTS)
+
+    def get_bytes_per_useful_sentence(self) -> Optional[float]:
+        """Returns the number of bytes downloaded for every sentence mentioning a stock, or None if there were none"""
+        return self.bytes_read / self.useful_sentences if self.useful_sentences > 0 else None
+
+    def get_mean_latency(self) -> Optional[float]:
+        """Returns the mean number of seconds a download takes, or None if there were no downloads"""
+        return self.seconds / self.attempts if self.attempts > 0 else None
+
+
+def get_domain(url: str) -> str:
+    """Returns the domain of the url's publisher
+
+    >>> get_domain('https://WWW.MarketWatch.com/story/gilead')
+    'marketwatch.com'
+    """
+    host = (urlsplit(url).hostname or '').lower()
+    return host[4:] if host.startswith('www.') else host
+
+
+class DomainStats:
+    """This class keeps the statistics of every domain articles are downloaded from in a SQLite file.
+
+    Urls are ranked by the estimated success rate of their domains, so the quota of a ticker is filled from the most
+    productive domains first. The urls of domains with at least MIN_ATTEMPTS downloads and a success rate below
+    SKIP_SUCCESS_RATE are skipped, unless the domain hasn't been tried for SKIP_RETRY_AFTER seconds. Urls are ranked
+    with the statistics as they were when the first urls were ranked, so the urls picked while several tickers are
+    analyzed at once don't depend on the order their downloads finish in.
+
+    Instance Attributes:
+        - path: the location of the SQLite file
+        - skipped: the number of urls skipped
+    Private Instance Attributes:
+        - _domains: the statistics of every domain, None until they are loaded from the file
+        - _ranking_domains: a copy of _domains taken when the first urls were ranked, None until then
+        - _connection: the connection to the SQLite file, None until the file is first used
+        - _pid: the id of the process _connection was opened in
+        - _lock: a lock guarding the statistics and connection
+
+    Representation Invariants:
+        - self.skipped >= 0
+    """
+    path: str
+    skipped: int
+    _domains: Optional[dict[str, DomainYield]]
+    _ranking_domains: Optional[dict[str, DomainYield]]
+    _connection: Optional[sqlite3.Connection]
+    _pid: int
+    _lock: threading.Lock
+
+    def __init__(self, path: str = DOMAIN_STATS_FILE) -> None:
+        self.path = path
+        self.skipped = 0
+        self._domains = None
+        self._ranking_domains = None
+        self._connection = None
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """Returns the connection to the SQLite file, creating the file and its table if needed"""
+        if self._connection is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory != '':
+                os.makedirs(directory, exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._pid = os.getpid()
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS domains (domain TEXT PRIMARY KEY, attempts REAL, '
+                                     'successes REAL, useful_sentences REAL, bytes_read REAL, seconds REAL, '
+                                     'last_attempt REAL)')
+            self._connection.commit()
+        return self._connection
+
+    def _get_domains(self) -> dict[str, DomainYield]:
+        """Returns the statistics of every domain, loading them from the file the first time"""
+        if self._domains is None:
+            self._domains = {row[0]: DomainYield(*row[1:])
+                             for row in self._get_connection().execute('SELECT * FROM domains').fetchall()}
+        return self._domains
+
+    def get_yield(self, domain: str) -> DomainYield:
+        """Returns the statistics of the domain
+        """
+        with self._lock:
+            return self._get_domains().get(domain, DomainYield())
+
+    def record(self, url: str, seconds: float, bytes_read: int, useful_sentences: int, success: bool) -> None:
+        """Records a download of the url that took the given number of seconds and bytes and gave an article with
+        the given number of sentences mentioning a stock, success is whether the article was useful
+        """
+        domain = get_domain(url)
+        with self._lock:
+            domains = self._get_domains()
+            stats = domains.setdefault(domain, DomainYield())
+            stats.attempts = stats.attempts * DOMAIN_STATS_DECAY + 1
+            stats.successes = stats.successes * DOMAIN_STATS_DECAY + (1 if success else 0)
+            stats.useful_sentences = stats.useful_sentences * DOMAIN_STATS_DECAY + useful_sentences
+            stats.bytes_read = stats.bytes_read * DOMAIN_STATS_DECAY + bytes_read
+            stats.seconds = stats.seconds * DOMAIN_STATS_DECAY + seconds
+            stats.last_attempt = time.time()
+            connection = self._get_connection()
+            connection.execute('INSERT OR REPLACE INTO domains VALUES (?, ?, ?, ?, ?, ?, ?)',
+                               (domain, stats.attempts, stats.successes, stats.useful_sentences, stats.bytes_read,
+                                stats.seconds, stats.last_attempt))
+            connection.commit()
+
+    def _get_ranking_yield(self, domain: str) -> DomainYield:
+        """Returns the statistics of the domain urls are ranked with"""
+        with self._lock:
+            if self._ranking_domains is None:
+                self._ranking_domains = {name: replace(stats)
+                                         for name, stats in self._get_domains().items()}
+            return self._ranking_domains.get(domain, DomainYield())
+
+    def reset_ranking(self) -> None:
+        """Makes the next urls ranked use the statistics as they are then, called when an analysis starts
+        """
+        with self._lock:
+            self._ranking_domains = None
+
+    def is_skipped(self, domain: str) -> bool:
+        """Returns whether the urls of the domain are skipped
+        """
+        stats = self._get_ranking_yield(domain)
+        return stats.attempts >= MIN_ATTEMPTS and stats.get_success_rate() < SKIP_SUCCESS_RATE and \
+            time.time() - stats.last_attempt < SKIP_RETRY_AFTER
+
+    def rank_urls(self, urls: list[str]) -> list[str]:
+        """Returns the urls without the ones of skipped domains, with the urls of the domains with the highest success
+        rates first. Urls of domains whose success rates round to the same tenth keep their order, except that faster
+        domains go first
+        """
+        ranked = []
+        for url in urls:
+            domain = get_domain(url)
+            if self.is_skipped(domain):
+                with self._lock:
+                    self.skipped += 1
+            else:
+                ranked.append(url)
+        yields = {url: self._get_ranking_yield(get_domain(url)) for url in ranked}
+        return sorted(ranked, key=lambda url: (-round(yields[url].get_success_rate(), 1),
+                                               yields[url].get_mean_latency() or 0.0))
+
+    def get_stats(self) -> dict[str, int]:
+        """Returns the number of domains with statistics, how many of them are skipped and how many urls were skipped
+        """
+        with self._lock:
+            domains = list(self._get_domains())
+        return {'domains': len(domains), 'skipped_domains': sum(1 for domain in domains if self.is_skipped(domain)),
+                'skipped_urls': self.skipped}
+
+    def close(self) -> None:
+        """Closes the connection to the SQLite file
+        """
+        with self._lock:
+            if self._connection is not None and self._pid == os.getpid():
+                self._connection.close()
+            self._connection = None
+
+
+if __name__ == '__main__':
+    import doctest
+    import python_ta
+
+    doctest.testmod(verbose=True)
+
+    python_ta.check_all(config={
+        'max-line-length': 120,
+        'extra-imports': ['__future__', 'dataclasses', 'typing', 'urllib.parse', 'os', 'sqlite3', 'threading',
+                          'time'],
+        'allowed-io': [],
+        'max-nested-blocks': 10
+    })
@@ -0,0 +1,134 @@
+"""
+This Python module benchmarks the single pass article text extractor of NewsScraper against the original extractor,
+which builds a BeautifulSoup tree of the page and walks every <p> tag of it. Both extractors parse the same corpus of
+saved pages, by default the pages in the local http cache, and their speed and any pages they disagree on are
+reported.
+
+Usage: python ExtractorBenchmark.py [--directory DIR] [--limit N] [--repeats N]
+
+Copyright and Usage Information
+===============================
+
+This file is provided solely for the personal and private use of TAs and professors
+at the University of Toronto St. George campus. All forms of
+distribution of this code, whether as given or with any changes, are
+expressly prohibited. For more information on copyright for CSC111 materials,
+please consult the Course Syllabus.
+
+This file is Copyright (c) 2023 Mark Zhang, Li Zhang and Luke Zhang
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Optional
+from bs4 import BeautifulSoup
+from HttpCache import HttpCache, HTTP_CACHE_DIRECTORY
+from NewsScraper import NewsArticleContent, get_children_as_str, parse_article_html
+import argparse
+import os
+import time
+
+
+@dataclass
+class ExtractorBenchmarkResult:
+    """A dataclass representing the result of benchmarking the extractors
+
+    Instance Attributes:
+        - pages: the number of pages parsed
+        - megabytes: the size of the pages in megabytes
+        - tree_seconds: the number of seconds the BeautifulSoup extractor took to parse every page
+        - single_pass_seconds: the number of seconds the single pass extractor took to parse every page
+        - mismatches: the names of the pages the extractors gave different content for
+
+    Representation Invariants:
+        - self.pages > 0
+        - self.tree_seconds > 0
+        - self.single_pass_seconds > 0
+    """
+    pages: int
+    megabytes: float
+    tree_seconds: float
+    single_pass_seconds: float
+    mismatches: list[str]
+
+
+def parse_article_html_with_tree(html: bytes | str) -> NewsArticleContent:
+    """Returns the content of the article in the given html the way NewsScraper originally extracted it, by building a
+    BeautifulSoup tree and walking every <p> tag
+    """
+    texts = ''
+    soup = BeautifulSoup(html, 'html.parser')
+
+    tags = {'p'}
+    found_title = soup.find('title')
+    if found_title:
+        title = str(found_title.string)
+    else:
+        title = ""
+    content = soup.find_all(tags)
+    for passage in content:
+        string = get_children_as_str(passage)
+        if len(string.split()) > 1:  # has more than just 1 word
+            texts += string
+
+    return NewsArticleContent(
+        title=title,
+        sentences=texts.split('. ')
+    )
+
+
+def load_pages(directory: Optional[str], limit: Optional[int]) -> list[tuple[str, bytes]]:
+    """Returns (name, html) pairs of the pages to benchmark with, the files in directory, or the pages in the http
+    cache if directory is None
+    """
+    pages = []
+    if directory is not None:
+        for name in sorted(os.listdir(directory))[:limit]:
+            with open(os.path.join(directory, name), 'rb') as file:
+                pages.append((name, file.read()))
+        return pages
+    http_cache = HttpCache(HTTP_CACHE_DIRECTORY, offline=True)
+    for url in http_cache.get_urls(limit):
+        cached = http_cache.get(url)
+        if cached is not None:
+            pages.append((url, cached.content))
+    return pages
+
+
+def benchmark_extractors(pages: list[tuple[str, bytes]], repeats: int = 1) -> ExtractorBenchmarkResult:
+    """Returns the result of parsing every page with both extractors, repeats times each
+
+    Preconditions:
+        - pages != []
+        - repeats > 0
+    """
+    start = time.perf_counter()
+    for _ in range(repeats):
+        tree_contents = [parse_article_html_with_tree(html) for _, html in pages]
+    tree_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(repeats):
+        single_pass_contents = [parse_article_html(html) for _, html in pages]
+    single_pass_seconds = time.perf_counter() - start
+    mismatches = [pages[i][0] for i in range(len(pages)) if tree_contents[i] != single_pass_contents[i]]
+    return ExtractorBenchmarkResult(len(pages), sum(len(html) for _, html in pages) / 1e6, tree_seconds,
+                                    single_pass_seconds, mismatches)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the article text extractors')
+    parser.add_argument('--directory', default=None, help='a folder of saved html pages, the pages in the http '
+                                                          'cache are used if not given')
+    parser.add_argument('--limit', type=int, default=None, help='the most pages to benchmark with')
+    parser.add_argument('--repeats', type=int, default=1, help='the number of times every page is parsed')
+    args = parser.parse_args()
+
+    corpus = load_pages(args.directory, args.limit)
+    if corpus == []:
+        raise SystemExit('The corpus is empty, scrape some articles first or pass --directory')
+    result = benchmark_extractors(corpus, args.repeats)
+    print(f'Parsed {result.pages} pages ({result.megabytes:.1f} MB) {args.repeats} times')
+    print(f'BeautifulSoup tree: {result.tree_seconds:.2f}s, single pass: {result.single_pass_seconds:.2f}s, '
+          f'{result.tree_seconds / result.single_pass_seconds:.1f}x faster')
+    print(f'{result.pages - len(result.mismatches)}/{result.pages} pages gave identical content')
+    for name in result.mismatches:
+        print('  mismatch: ' + name)
@@ -0,0 +1,472 @@
+"""
+This Python module contains the classes for discovering news articles from RSS and Atom feeds, as an alternative to
+scraping Google search results with NewsScraper. Feeds are parsed with a streaming XML parser and polled incrementally:
+conditional requests let the server skip sending a feed that hasn't changed, and the guids of the items already seen
+are remembered on disk so every poll only yields the items published since the last one. Feeds can be web urls, file://
+urls or paths to local feed files.
+
+Copyright and Usage Information
+===============================
+
+This file is provided solely for the personal and private use of TAs and professors
+at the University of Toronto St. George campus. All forms of
+distribution of this code, whether as given or with any changes, are
+expressly prohibited. For more information on copyright for CSC111 materials,
+please consult the Course Syllabus.
+
+This file is Copyright (c) 2023 Mark Zhang, Li Zhang and Luke Zhang
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import IO, Iterator, Optional
+from urllib.parse import quote_plus, unquote, urlsplit
+from xml.etree import ElementTree
+from RateLimiter import get_host_rate_limiter
+from StockInfo import get_company_matcher
+import email.utils
+import os
+import sqlite3
+import threading
+import time
+
+FEED_STATE_DIRECTORY = 'feed_cache/'
+FEED_TIMEOUT = 15
+# the feeds polled for every ticker, {ticker} is replaced by the ticker and {query} by the search query of the ticker.
+# Feeds without either are publisher feeds, only their items that mention the ticker are kept
+FEED_URLS = [
+    'https://feeds.finance.yahoo.com/rss/2.0/headline?s={ticker}&region=US&lang=en-US',
+    'https://news.google.com/rss/search?q={query}&hl=en-US&gl=US&ceid=US:en',
+]
+# the age of the oldest item kept for every publish range of NewsScraper.PUBLISH_RANGE
+PUBLISH_RANGE_AGES = {
+    'y': timedelta(days=365),
+    'm': timedelta(days=31),
+    'w': timedelta(days=7),
+    'd': timedelta(days=1),
+    '': None,
+}
+
+
+@dataclass
+class FeedItem:
+    """A dataclass to represent an item of an RSS feed or an entry of an Atom feed
+
+    Instance Attributes:
+        - guid: the id of the item, its link if the feed doesn't give it one
+        - url: the link to the article of the item
+        - title: the title of the item
+        - summary: the description or summary of the item
+        - published: the time the item was published, or None if the feed doesn't say
+
+    Representation Invariants:
+        - self.guid != ''
+        - self.url != ''
+    """
+    guid: str
+    url: str
+    title: str
+    summary: str
+    published: Optional[datetime]
+
+
+def _get_local_name(tag: str) -> str:
+    """Returns the tag without its XML namespace
+
+    >>> _get_local_name('{http://www.w3.org/2005/Atom}entry')
+    'entry'
+    """
+    return tag.rsplit('}', 1)[-1]
+
+
+def _parse_date(text: str) -> Optional[datetime]:
+    """Returns the time in an RFC 822 (RSS) or ISO 8601 (Atom) date, or None if it isn't either
+
+    >>> _parse_date('Tue, 10 Jan 2023 14:30:00 GMT')
+    datetime.datetime(2023, 1, 10, 14, 30, tzinfo=datetime.timezone.utc)
+    >>> _parse_date('2023-01-10T14:30:00Z')
+    datetime.datetime(2023, 1, 10, 14, 30, tzinfo=datetime.timezone.utc)
+    """
+    text = text.strip()
+    try:
+        published = email.utils.parsedate_to_datetime(text)
+    except (TypeError, ValueError):
+        try:
+            published = datetime.fromisoformat(text)
+        except ValueError:
+            return None
+    if published.tzinfo is None:
+        published = published.replace(tzinfo=timezone.utc)
+    return published
+
+
+def _get_item(element: ElementTree.Element) -> Optional[FeedItem]:
+    """Returns the FeedItem of an RSS <item> or Atom <entry> element, or None if it doesn't link to anything"""
+    fields = {}
+    url = ''
+    for child in element:
+        name = _get_local_name(child.tag)
+        if name == 'link':
+            # rss links are the text of the tag, atom links are the href of the alternate link
+            href = child.get('href')
+            if href is None:
+                url = url or (child.text or '').strip()
+            elif child.get('rel', 'alternate') == 'alternate' and url == '':
+                url = href.strip()
+        elif name not in fields:
+            fields[name] = (child.text or '').strip()
+    if url == '':
+        return None
+    published = None
+    for name in ('pubDate', 'published', 'updated', 'date'):
+        if fields.get(name):
+            published = _parse_date(fields[name])
+            break
+    return FeedItem(
+        guid=fields.get('guid') or fields.get('id') or url,
+        url=url,
+        title=fields.get('title', ''),
+        summary=fields.get('description') or fields.get('summary') or '',
+        published=published
+    )
+
+
+def parse_feed(source: str | IO[bytes]) -> Iterator[FeedItem]:
+    """Yields the items of the RSS or Atom feed read from source, a path or a binary file, in the order they appear.
+
+    The feed is parsed as it is read and every item is discarded once yielded, so only one item is held in memory at a
+    time. Parsing stops at the first malformed part of the feed, the items before it are still yielded.
+
+    >>> import io
+    >>> feed = io.BytesIO(b'<rss><channel><title>News</title><item><title>Gilead beats</title>'
+    ...                   b'<link>https://example.com/gilead</link><guid>a1</guid></item></channel></rss>')
+    >>> [(item.guid, item.url, item.title) for item in parse_feed(feed)]
+    [('a1', 'https://example.com/gilead', 'Gilead beats')]
+    """
+    open_elements = []
+    try:
+        for event, element in ElementTree.iterparse(source, events=('start', 'end')):
+            if event == 'start':
+                open_elements.append(element)
+                continue
+            open_elements.pop()
+            if _get_local_name(element.tag) in ('item', 'entry'):
+                item = _get_item(element)
+                # detach the item from its parent so the tree never grows
+                if open_elements != []:
+                    open_elements[-1].remove(element)
+                if item is not None:
+                    yield item
+    except ElementTree.ParseError:
+        return
+
+
+def _get_local_path(feed_url: str) -> Optional[str]:
+    """Returns the path of the feed if it is a local file, or None if it is a web url
+
+    >>> _get_local_path('file:///tmp/feeds/GILD.xml')
+    '/tmp/feeds/GILD.xml'
+    >>> _get_local_path('https://example.com/rss') is None
+    True
+    """
+    parts = urlsplit(feed_url)
+    if parts.scheme == 'file':
+        return unquote(parts.path)
+    if parts.scheme in ('http', 'https'):
+        return None
+    return feed_url
+
+
+class FeedReader:
+    """This class polls feeds incrementally.
+
+    Every poll of a feed only returns the items a consumer hasn't seen before. The ETag and Last-Modified headers of a
+    feed are sent back on the next poll so an unchanged feed isn't downloaded again (for local files, the time the file
+    was modified is used instead), and the guids of the items a consumer has seen are stored on disk so they are
+    remembered between runs. Every consumer (ie. every ticker of an analysis) has its own seen items, so the same
+    publisher feed can be polled for several tickers. Nothing a poll returns is remembered until the consumer commits
+    the items it used, so the items it didn't use, or couldn't use before a crash, are returned again by later polls.
+
+    Instance Attributes:
+        - directory: the folder the state of the feeds is stored in
+        - timeout: the most seconds a request for a feed can take
+        - polls: the number of feeds polled
+        - not_modified: the number of polls of feeds that hadn't changed since the last poll
+        - errors: the number of polls of feeds that couldn't be read
+        - new_items: the number of new items the polls returned
+    Private Instance Attributes:
+        - _connection: the connection to the stored state, None until it is first used
+        - _pending: a dictionary mapping a (consumer, feed url) pair to the new ETag and Last-Modified values of its
+                    last poll and the guids of the items it returned, until they are committed
+        - _pid: the id of the process _connection was opened in
+        - _lock: a lock guarding the connection and counters
+
+    Representation Invariants:
+        - self.timeout > 0
+    """
+    directory: str
+    timeout: float
+    polls: int
+    not_modified: int
+    errors: int
+    new_items: int
+    _connection: Optional[sqlite3.Connection]
+    _pending: dict[tuple[str, str], tuple[Optional[str], Optional[str], set[str]]]
+    _pid: int
+    _lock: threading.Lock
+
+    def __init__(self, directory: str = FEED_STATE_DIRECTORY, timeout: float = FEED_TIMEOUT) -> None:
+        self.directory = directory
+        self.timeout = timeout
+        self.polls = 0
+        self.not_modified = 0
+        self.errors = 0
+        self.new_items = 0
+        self._connection = None
+        self._pending = {}
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """Returns the connection to the stored state, creating the tables if needed"""
+        if self._connection is None or self._pid != os.getpid():
+            os.makedirs(self.directory, exist_ok=True)
+            self._connection = sqlite3.connect(os.path.join(self.directory, 'feeds.sqlite3'),
+                                               check_same_thread=False, timeout=30)
+            self._pid = os.getpid()
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS feeds (consumer TEXT, url TEXT, etag TEXT, '
+                                     'last_modified TEXT, polled_at REAL, PRIMARY KEY (consumer, url))')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS seen (consumer TEXT, url TEXT, guid TEXT, '
+                                     'seen_at REAL, PRIMARY KEY (consumer, url, guid))')
+            self._connection.commit()
+        return self._connection
+
+    def _open_feed(self, feed_url: str, etag: Optional[str],
+                   last_modified: Optional[str]) -> tuple[Optional[IO[bytes]], Optional[str], Optional[str]]:
+        """Returns the open feed along with its new ETag and Last-Modified values, the feed is None if it hasn't
+        changed since the values given. Raises OSError or requests.RequestException if the feed can't be read.
+        """
+        import requests
+        path = _get_local_path(feed_url)
+        if path is not None:
+            modified = str(os.stat(path).st_mtime_ns)
+            if modified == last_modified:
+                return None, etag, last_modified
+            return open(path, 'rb'), None, modified
+        headers = {}
+        if etag is not None:
+            headers['If-None-Match'] = etag
+        if last_modified is not None:
+            headers['If-Modified-Since'] = last_modified
+        host = urlsplit(feed_url).hostname or ''
+        rate_limiter = get_host_rate_limiter()
+        rate_limiter.acquire(host)
+        response = requests.get(feed_url, headers=headers, timeout=self.timeout, stream=True)
+        if rate_limiter.on_response(host, response.status_code, response.headers.get('Retry-After')):
+            response.close()
+            raise requests.HTTPError('rate limited', response=response)
+        if response.status_code == 304:
+            response.close()
+            return None, etag, last_modified
+        response.raise_for_status()
+        # let the parser read the body as it arrives
+        response.raw.decode_content = True
+        return response.raw, response.headers.get('ETag'), response.headers.get('Last-Modified')
+
+    def poll(self, feed_url: str, consumer: str = '') -> Optional[list[FeedItem]]:
+        """Returns the items of the feed the consumer hasn't seen before, in the order they appear in the feed. Returns
+        an empty list if the feed hasn't changed, or None if it can't be read. The items are only remembered as seen
+        once they are committed, see commit.
+        """
+        import requests
+        import urllib3
+        with self._lock:
+            self.polls += 1
+            row = self._get_connection().execute('SELECT etag, last_modified FROM feeds WHERE consumer = ? AND '
+                                                 'url = ?', (consumer, feed_url)).fetchone()
+        etag, last_modified = row if row is not None else (None, None)
+        try:
+            feed, etag, last_modified = self._open_feed(feed_url, etag, last_modified)
+        except (OSError, requests.RequestException):
+            with self._lock:
+                self.errors += 1
+            return None
+        if feed is None:
+            with self._lock:
+                self.not_modified += 1
+            return []
+        try:
+            items = list(parse_feed(feed))
+        except (OSError, requests.RequestException, urllib3.exceptions.HTTPError):
+            # the connection dropped partway (the raw body raises urllib3's errors rather than requests'), keep the
+            # old validators so the feed is downloaded again next time
+            with self._lock:
+                self.errors += 1
+            return None
+        finally:
+            feed.close()
+        new_items = []
+        with self._lock:
+            seen = {row[0] for row in self._get_connection().execute('SELECT guid FROM seen WHERE consumer = ? AND '
+                                                                     'url = ?', (consumer, feed_url))}
+            for item in items:
+                if item.guid not in seen:
+                    seen.add(item.guid)
+                    new_items.append(item)
+            self._pending[(consumer, feed_url)] = (etag, last_modified, {item.guid for item in new_items})
+            self.new_items += len(new_items)
+        return new_items
+
+    def commit(self, feed_url: str, guids: list[str], consumer: str = '') -> None:
+        """Remembers the items of the last poll of the feed with the given guids as seen by the consumer. Once every
+        item the poll returned is seen, the feed's new ETag and Last-Modified values are sent by the next poll, before
+        that the feed is downloaded again so the items that weren't committed are returned again
+        """
+        now = time.time()
+        with self._lock:
+            if (consumer, feed_url) not in self._pending:
+                return
+            etag, last_modified, pending_guids = self._pending[(consumer, feed_url)]
+            connection = self._get_connection()
+            with connection:
+                for guid in guids:
+                    if guid in pending_guids:
+                        connection.execute('INSERT OR IGNORE INTO seen VALUES (?, ?, ?, ?)',
+                                           (consumer, feed_url, guid, now))
+                        pending_guids.discard(guid)
+                if len(pending_guids) == 0:
+                    connection.execute('INSERT OR REPLACE INTO feeds VALUES (?, ?, ?, ?, ?)',
+                                       (consumer, feed_url, etag, last_modified, now))
+                    del self._pending[(consumer, feed_url)]
+
+    def forget(self, consumer: str) -> None:
+        """Forgets the items the consumer has seen and the validators of its feeds, so its next polls return every item
+        """
+        with self._lock:
+            connection = self._get_connection()
+            connection.execute('DELETE FROM seen WHERE consumer = ?', (consumer,))
+            connection.execute('DELETE FROM feeds WHERE consumer = ?', (consumer,))
+            connection.commit()
+            self._pending = {key: value for key, value in self._pending.items() if key[0] != consumer}
+
+    def get_stats(self) -> dict[str, int]:
+        """Returns the counters of the reader
+        """
+        return {'polls': self.polls, 'not_modified': self.not_modified, 'errors': self.errors,
+                'new_items': self.new_items}
+
+    def close(self) -> None:
+        """Closes the connection to the stored state
+        """
+        with self._lock:
+            if self._connection is not None and self._pid == os.getpid():
+                self._connection.close()
+            self._connection = None
+
+
+class FeedScraper:
+    """This class discovers the news articles of a ticker from feeds, with the same interface as NewsScraper
+
+    Instance Attributes:
+        - search_query: a string representing the search query of the ticker, used by feeds with {query}
+        - number_of_articles: an integer representing the number of articles to scrape.
+        - articles_scraped: a list containing the urls of the news articles scraped.
+        - publish_range: a string representing how recent the articles should be when being scraped.
+        - ticker: the ticker the articles are about
+        - feed_urls: the feeds polled, see FEED_URLS
+        - consumer: the name the items seen by this scraper are remembered under by the reader
+        - skipped_urls: the urls of the articles that were already tried, they are skipped
+    Private Instance Attributes:
+        - _reader: the FeedReader polling the feeds
+        - _polled: a dictionary mapping every feed polled since the last commit to the items its poll returned
+
+    Representation Invariants:
+        - self.search_query != ''
+        - 0 < self.number_of_articles
+        - self.publish_range in PUBLISH_RANGE_AGES
+    """
+    search_query: str
+    number_of_articles: int
+    articles_scraped: list[str]
+    publish_range: str
+    ticker: str
+    feed_urls: list[str]
+    consumer: str
+    skipped_urls: set[str]
+    _reader: FeedReader
+    _polled: dict[str, list[FeedItem]]
+
+    def __init__(self, search_query: str, number_of_articles: int, publish_range: str, ticker: str,
+                 feed_urls: list[str], reader: FeedReader, consumer: str = '') -> None:
+        self.search_query = search_query
+        self.number_of_articles = number_of_articles
+        self.articles_scraped = []
+        self.publish_range = publish_range
+        self.ticker = ticker
+        self.feed_urls = feed_urls
+        self.consumer = consumer
+        self.skipped_urls = set()
+        self._reader = reader
+        self._polled = {}
+
+    def _is_relevant(self, item: FeedItem, is_publisher_feed: bool) -> bool:
+        """Returns whether the item was published in the publish range and, for publisher feeds, mentions the ticker"""
+        max_age = PUBLISH_RANGE_AGES[self.publish_range]
+        if max_age is not None and item.published is not None and \
+                datetime.now(timezone.utc) - item.published > max_age:
+            return False
+        return not is_publisher_feed or \
+            self.ticker in get_company_matcher().find_tickers(item.title + '. ' + item.summary)
+
+    def scrape_articles(self) -> bool:
+        """Polls every feed and adds the articles of the new items to self.articles_scraped.
+        Returns true if any feed could be polled, false otherwise.
+        """
+        # the reader's error count is shared by the scrapers of every ticker, so the failures are counted here
+        failures = 0
+        for template in self.feed_urls:
+            feed_url = template.format(ticker=self.ticker, query=quote_plus(self.search_query))
+            is_publisher_feed = feed_url == template
+            items = self._reader.poll(feed_url, self.consumer)
+            if items is None:
+                failures += 1
+                continue
+            self._polled[feed_url] = items
+            for item in items:
+                if self._is_relevant(item, is_publisher_feed) and item.url not in self.articles_scraped and \
+                        item.url not in self.skipped_urls:
+                    self.articles_scraped.append(item.url)
+        return failures < len(self.feed_urls)
+
+    def commit(self, tried_urls: list[str]) -> None:
+        """Commits the items polled since the last commit to the reader, except the ones whose articles were scraped
+        but not tried yet, so later polls return those again
+        """
+        untried_urls = set(self.articles_scraped).difference(tried_urls)
+        for feed_url in self._polled:
+            guids = [item.guid for item in self._polled[feed_url] if item.url not in untried_urls]
+            self._reader.commit(feed_url, guids, self.consumer)
+        self._polled = {}
+
+    def get_articles(self) -> list[str]:
+        """
+        Returns the url of the articles scraped
+        """
+        return self.articles_scraped
+
+
+if __name__ == '__main__':
+    import doctest
+    import python_ta
+
+    doctest.testmod(verbose=True)
+
+    python_ta.check_all(config={
+        'max-line-length': 120,
+        'extra-imports': ['__future__', 'dataclasses', 'datetime', 'typing', 'urllib.parse', 'xml.etree',
+                          'RateLimiter', 'StockInfo', 'email.utils', 'os', 'sqlite3', 'threading', 'time',
+                          'requests', 'urllib3'],
+        'allowed-io': ['FeedReader._open_feed'],
+        'max-nested-blocks': 10
+    })
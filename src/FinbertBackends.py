@@ -0,0 +1,173 @@
+"""
+This Python module contains the inference backends finbert can be run with. Besides the original fp32 PyTorch
+model, finbert can be run as a dynamically int8 quantized PyTorch model or as an exported ONNX Runtime graph, which
+are both much faster on machines without a GPU. Converted models are saved in a local cache directory so the
+conversion only happens once.
+
+Copyright and Usage Information
+===============================
+
+This file is provided solely for the personal and private use of TAs and professors
+at the University of Toronto St. George campus. All forms of
+distribution of this code, whether as given or with any changes, are
+expressly prohibited. For more information on copyright for CSC111 materials,
+please consult the Course Syllabus.
+
+This file is Copyright (c) 2023 Mark Zhang, Li Zhang and Luke Zhang
+"""
+from __future__ import annotations
+from SentimentCache import MODEL_CACHE_DIRECTORY
+import json
+import os
+
+FINBERT_BACKEND_DIRECTORY = MODEL_CACHE_DIRECTORY + 'finbert/'
+FP32_BACKEND = 'fp32'
+INT8_BACKEND = 'int8'
+ONNX_BACKEND = 'onnx'
+FINBERT_BACKENDS = [FP32_BACKEND, INT8_BACKEND, ONNX_BACKEND]
+ONNX_OPSET = 14
+
+
+class FinbertBackend:
+    """An abstract class for a way of running finbert
+
+    Instance Attributes:
+        - name: the name of the backend, one of FINBERT_BACKENDS
+        - id2label: a dictionary mapping the index of every logit to finbert's label for it
+
+    Representation Invariants:
+        - self.name in FINBERT_BACKENDS
+        - set(self.id2label.values()) == {'Positive', 'Neutral', 'Negative'}
+    """
+    name: str
+    id2label: dict[int, str]
+
+    def predict_logits(self, input_ids: list[list[int]], attention_mask: list[list[int]]) -> list[list[float]]:
+        """Returns the logits of every padded row of input_ids
+        """
+        raise NotImplementedError
+
+
+class TorchFinbertBackend(FinbertBackend):
+    """Runs finbert as a PyTorch model
+
+    Instance Attributes:
+        - model: the PyTorch model of finbert
+    """
+    model: BertForSequenceClassification
+
+    def __init__(self, model_name: str, cache_directory: str = FINBERT_BACKEND_DIRECTORY) -> None:
+        from transformers import BertForSequenceClassification
+        self.name = FP32_BACKEND
+        self.model = BertForSequenceClassification.from_pretrained(model_name, num_labels=3,
+                                                                   cache_dir=cache_directory + 'hub/')
+        self.model.eval()
+        self.id2label = {int(label_id): label for label_id, label in self.model.config.id2label.items()}
+
+    def predict_logits(self, input_ids: list[list[int]], attention_mask: list[list[int]]) -> list[list[float]]:
+        """Returns the logits of every padded row of input_ids
+        """
+        import torch
+        with torch.no_grad():
+            logits = self.model(input_ids=torch.tensor(input_ids), attention_mask=torch.tensor(attention_mask)).logits
+        return logits.tolist()
+
+
+class QuantizedFinbertBackend(TorchFinbertBackend):
+    """Runs finbert as a PyTorch model with its linear layers dynamically quantized to int8.
+    The quantized model is saved to the cache directory the first time it is made. The whole module is pickled, which
+    only loads with the versions of torch and transformers it was saved with, so they are part of the file name
+    """
+
+    def __init__(self, model_name: str, cache_directory: str = FINBERT_BACKEND_DIRECTORY) -> None:
+        import torch
+        import transformers
+        path = cache_directory + model_name.replace('/', '--') + '.int8.torch-' + torch.__version__ \
+            + '.transformers-' + transformers.__version__ + '.pt'
+        if os.path.exists(path):
+            self.name = INT8_BACKEND
+            self.model = torch.load(path, weights_only=False)
+            self.model.eval()
+            self.id2label = {int(label_id): label for label_id, label in self.model.config.id2label.items()}
+        else:
+            super().__init__(model_name, cache_directory)
+            self.name = INT8_BACKEND
+            self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+            os.makedirs(cache_directory, exist_ok=True)
+            torch.save(self.model, path)
+
+
+class OnnxFinbertBackend(FinbertBackend):
+    """Runs finbert as an ONNX Runtime graph. The graph is exported from the PyTorch model into the cache directory
+    the first time, after which neither torch nor the PyTorch model are needed to load it
+
+    Private Instance Attributes:
+        - _session: the ONNX Runtime session running the graph
+    """
+    _session: onnxruntime.InferenceSession
+
+    def __init__(self, model_name: str, cache_directory: str = FINBERT_BACKEND_DIRECTORY) -> None:
+        import onnxruntime
+        self.name = ONNX_BACKEND
+        path = cache_directory + model_name.replace('/', '--') + '.onnx'
+        labels_path = path + '.labels.json'
+        if not os.path.exists(path) or not os.path.exists(labels_path):
+            _export_onnx(model_name, cache_directory, path, labels_path)
+        with open(labels_path) as labels_file:
+            self.id2label = {int(label_id): label for label_id, label in json.load(labels_file).items()}
+        self._session = onnxruntime.InferenceSession(path, providers=['CPUExecutionProvider'])
+
+    def predict_logits(self, input_ids: list[list[int]], attention_mask: list[list[int]]) -> list[list[float]]:
+        """Returns the logits of every padded row of input_ids
+        """
+        import numpy
+        inputs = {
+            'input_ids': numpy.array(input_ids, dtype=numpy.int64),
+            'attention_mask': numpy.array(attention_mask, dtype=numpy.int64)
+        }
+        return self._session.run(['logits'], inputs)[0].tolist()
+
+
+def _export_onnx(model_name: str, cache_directory: str, path: str, labels_path: str) -> None:
+    """Exports the PyTorch model of finbert to an ONNX graph at path, and its labels to labels_path"""
+    import torch
+    torch_backend = TorchFinbertBackend(model_name, cache_directory)
+    example = torch.ones((1, 8), dtype=torch.int64)
+    os.makedirs(cache_directory, exist_ok=True)
+    torch.onnx.export(torch_backend.model, (example, example), path, input_names=['input_ids', 'attention_mask'],
+                      output_names=['logits'], opset_version=ONNX_OPSET,
+                      dynamic_axes={'input_ids': {0: 'batch', 1: 'tokens'},
+                                    'attention_mask': {0: 'batch', 1: 'tokens'},
+                                    'logits': {0: 'batch'}})
+    with open(labels_path, 'w') as labels_file:
+        json.dump(torch_backend.id2label, labels_file)
+
+
+def load_finbert_backend(name: str, model_name: str,
+                         cache_directory: str = FINBERT_BACKEND_DIRECTORY) -> FinbertBackend:
+    """Returns the finbert backend with the given name, loaded from the cache directory
+
+    Preconditions:
+        - name in FINBERT_BACKENDS
+    """
+    if name == INT8_BACKEND:
+        return QuantizedFinbertBackend(model_name, cache_directory)
+    elif name == ONNX_BACKEND:
+        return OnnxFinbertBackend(model_name, cache_directory)
+    else:
+        return TorchFinbertBackend(model_name, cache_directory)
+
+
+if __name__ == '__main__':
+    import doctest
+    import python_ta
+
+    doctest.testmod(verbose=True)
+
+    python_ta.check_all(config={
+        'max-line-length': 120,
+        'extra-imports': ['__future__', 'SentimentCache', 'json', 'os', 'transformers', 'torch', 'onnxruntime',
+                          'numpy'],
+        'allowed-io': ['OnnxFinbertBackend.__init__', '_export_onnx'],
+        'max-nested-blocks': 10
+    })
@@ -0,0 +1,104 @@
+"""
+This Python module benchmarks the finbert inference backends. Every backend scores the same corpus of passages, by
+default the passages already scored in the sentiment memo cache, and its throughput and its agreement with the labels
+of the fp32 model are reported.
+
+Usage: python FinbertBenchmark.py [--corpus FILE] [--limit N] [--batch-size N] [--backends fp32 int8 onnx]
+
+Copyright and Usage Information
+===============================
+
+This file is provided solely for the personal and private use of TAs and professors
+at the University of Toronto St. George campus. All forms of
+distribution of this code, whether as given or with any changes, are
+expressly prohibited. For more information on copyright for CSC111 materials,
+please consult the Course Syllabus.
+
+This file is Copyright (c) 2023 Mark Zhang, Li Zhang and Luke Zhang
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Optional
+from FinbertBackends import FINBERT_BACKENDS, FP32_BACKEND
+from SentimentCache import SentimentMemoCache, SENTIMENT_CACHE_FILE
+import argparse
+import time
+import Sentiment
+
+
+@dataclass
+class BackendBenchmarkResult:
+    """A dataclass representing the result of benchmarking one finbert backend
+
+    Instance Attributes:
+        - backend: the name of the backend
+        - load_time: the number of seconds it took to load the backend
+        - passages_per_second: the number of passages scored per second
+        - agreement: the fraction of passages given the same label as the fp32 model
+
+    Representation Invariants:
+        - self.passages_per_second >= 0
+        - 0 <= self.agreement <= 1
+    """
+    backend: str
+    load_time: float
+    passages_per_second: float
+    agreement: float
+
+
+def load_corpus(corpus_file: Optional[str], limit: Optional[int]) -> list[str]:
+    """Returns the passages to benchmark with, one per line of corpus_file, or the passages in the sentiment memo
+    cache if corpus_file is None
+    """
+    if corpus_file is not None:
+        with open(corpus_file, errors='ignore') as file:
+            passages = [line.strip() for line in file if line.strip() != '']
+        return passages[:limit] if limit is not None else passages
+    return SentimentMemoCache(SENTIMENT_CACHE_FILE).get_passages(Sentiment.SINGLE_SCORER, limit)
+
+
+def benchmark_backends(passages: list[str], backends: list[str],
+                       batch_size: int = Sentiment.FINBERT_MAX_BATCH_SIZE) -> list[BackendBenchmarkResult]:
+    """Returns the benchmark result of every backend scoring the passages. The fp32 backend is always run first
+    since the agreement of the other backends is measured against it
+
+    Preconditions:
+        - passages != []
+        - all(backend in FINBERT_BACKENDS for backend in backends)
+    """
+    # the tokenizer is shared by every backend so it shouldn't count towards the first backend's time
+    Sentiment.get_finbert_tokenizer()
+    results = []
+    reference_scores = None
+    for backend in [FP32_BACKEND] + [backend for backend in backends if backend != FP32_BACKEND]:
+        Sentiment.set_finbert_backend(backend)
+        start = time.perf_counter()
+        Sentiment.get_finbert_backend()
+        load_time = time.perf_counter() - start
+        start = time.perf_counter()
+        scores = Sentiment.get_finbert_scores(passages, batch_size)
+        elapsed = time.perf_counter() - start
+        if reference_scores is None:
+            reference_scores = scores
+        agreement = sum(1 for a, b in zip(scores, reference_scores) if a == b) / len(passages)
+        if backend in backends:
+            results += [BackendBenchmarkResult(backend, load_time, len(passages) / elapsed, agreement)]
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the finbert inference backends')
+    parser.add_argument('--corpus', default=None, help='a text file with one passage per line, the passages in '
+                                                       'the sentiment memo cache are used if not given')
+    parser.add_argument('--limit', type=int, default=None, help='the most passages to benchmark with')
+    parser.add_argument('--batch-size', type=int, default=Sentiment.FINBERT_MAX_BATCH_SIZE)
+    parser.add_argument('--backends', nargs='+', choices=FINBERT_BACKENDS, default=FINBERT_BACKENDS)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus, args.limit)
+    if corpus == []:
+        raise SystemExit('The corpus is empty, score some articles first or pass --corpus')
+    print('Benchmarking ' + str(len(corpus)) + ' passages')
+    for result in benchmark_backends(corpus, args.backends, args.batch_size):
+        print(f'{result.backend:>5}: load {result.load_time:.2f}s, {result.passages_per_second:.1f} passages/s, '
+              f'{result.agreement * 100:.2f}% agreement with fp32')
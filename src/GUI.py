@@ -297,7 +297,9 @@ class MainMenu:
         self._root.title("StocksConnectionAnalyzer")
         self._root.update()
 
-        self.cache_preset_data = get_file_names_from_path(SCRAPE_CACHE_ROOT)
+        # the stores kept next to the caches in scrape_cache/ aren't presets
+        self.cache_preset_data = [file_name for file_name in get_file_names_from_path(SCRAPE_CACHE_ROOT)
+                                  if file_name.endswith('.csv')]
         self.ticker_preset_data = get_live_ticker_presets()
 
         self._search_bar = SearchBar(self._root, "Preset Selection", self.cache_preset_data)
@@ -322,8 +324,9 @@ class MainMenu:
         selected_item = self._search_bar.entry.get()
         if selected_item in self.cache_preset_data:
             # load settings
+            # the graph is only built from the cache, tickers missing from it are reported rather than scraped
             default_settings = StockAnalyzerSettings(id=selected_item, articles_per_ticker=10,
-                                                     use_cache=True,
+                                                     use_cache=True, offline=True,
                                                      search_focus='Stock')
             tickers = get_tickers()
             analyzer = StockAnalyzer(tickers, default_settings)
@@ -352,8 +355,14 @@ if __name__ == '__main__':
         'max-line-length': 120,
         'extra-imports': ['tkinter', 'CSV', 'GUI', 'StockAnalyzer', 'StockGraphAnalyzer', 'StockInfo', 'os'],
         'allowed-io': ['StockAnalyzer._save_cache',
-                       'StockAnalyzer._analyze_stock',
+                       'StockAnalyzer._load_cache',
+                       'StockAnalyzer._search_stage',
+                       'StockAnalyzer._fetch_stage',
+                       'StockAnalyzer._score_articles',
+                       'StockAnalyzer._merge_analysis',
                        'StockAnalyzer._build_data',
+                       'StockAnalyzer._start_refresh',
+                       'StockAnalyzer._analyze_tickers',
                        'StockAnalyzer.__init__'],
         'max-nested-blocks': 10
     })
@@ -247,10 +247,14 @@ class Graph:
         """
         Removes the specified edge from the graph
         """
-        u, v = edge.u.name, edge.v.name
-        self.nodes[u].edges.remove(edge)
-        self.nodes[v].edges.remove(edge)
+        u, v = self.nodes[edge.u.get_as_key()], self.nodes[edge.v.get_as_key()]
+        u.edges.remove(edge)
+        v.edges.remove(edge)
         self.edges.remove(edge)
+        # the nodes are only neighbours while another edge still joins them
+        if not any(other.u is v or other.v is v for other in u.edges):
+            u.neighbours.discard(v)
+            v.neighbours.discard(u)
 
 
 if __name__ == '__main__':
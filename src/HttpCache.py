@@ -0,0 +1,336 @@
+"""
+This Python module contains the class for caching downloaded web pages on disk. Response bodies are compressed and
+stored in files named by the hash of their content, so pages served under several urls are only stored once, and a
+SQLite index maps every canonical url to its body along with the ETag and Last-Modified headers needed to revalidate
+it with a conditional request once it goes stale.
+
+Copyright and Usage Information
+===============================
+
+This file is provided solely for the personal and private use of TAs and professors
+at the University of Toronto St. George campus. All forms of
+distribution of this code, whether as given or with any changes, are
+expressly prohibited. For more information on copyright for CSC111 materials,
+please consult the Course Syllabus.
+
+This file is Copyright (c) 2023 Mark Zhang, Li Zhang and Luke Zhang
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import quote_plus, unquote_plus, urlsplit, urlunsplit
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+HTTP_CACHE_DIRECTORY = 'http_cache/'
+# the number of seconds a cached page is served without revalidating it
+HTTP_CACHE_TTL = 24 * 60 * 60
+# the largest number of compressed bytes of pages kept in the cache
+HTTP_CACHE_MAX_BYTES = 512 * 1024 * 1024
+# fraction of max_bytes kept when evicting so eviction doesn't happen again on the very next page
+EVICTION_RATIO = 0.9
+# query parameters that only track where a reader came from and never change the page
+TRACKING_PARAMETERS = {'fbclid', 'gclid', 'dclid', 'msclkid', 'mc_cid', 'mc_eid', 'ocid', 'cmpid',
+                       'guccounter', 'guce_referrer', 'guce_referrer_sig', 'ito', 'siteid', 'yptr'}
+# a dictionary mapping a site to the query parameters that only track readers on that site, but can change the page
+# on other sites
+SITE_TRACKING_PARAMETERS = {
+    'seekingalpha.com': {'source'},
+    'marketwatch.com': {'mod'},
+    'wsj.com': {'mod'},
+    'barrons.com': {'mod'}
+}
+_DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def canonicalize_url(url: str) -> str:
+    """Returns the canonical form of the url. The scheme and host are lower cased, default ports, fragments and
+    tracking query parameters are removed and the remaining query parameters are sorted
+
+    >>> canonicalize_url('HTTPS://www.MarketWatch.com:443/story/gilead?utm_source=x&mod=mw_quote_news&b=2&a=1#top')
+    'https://www.marketwatch.com/story/gilead?a=1&b=2'
+    >>> canonicalize_url('https://seekingalpha.com/article/4591250-gilead?source=content_type%3Areact%7Csection%3A'
+    ...                  'News%7Csection_asset%3ANews%7Cfirst_level_url%3Asymbol%7Cbutton%3ATitle%7Clock_status%3ANo')
+    'https://seekingalpha.com/article/4591250-gilead'
+    >>> canonicalize_url('https://example.com/story?mod=print&ref=home')
+    'https://example.com/story?mod=print&ref=home'
+
+    Parameters without a value keep having no value
+    >>> canonicalize_url('https://www.cnbc.com/2023/04/27/gilead-earnings.html?amp&b=')
+    'https://www.cnbc.com/2023/04/27/gilead-earnings.html?amp&b='
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port is not None and _DEFAULT_PORTS.get(scheme) != parts.port:
+        host += ':' + str(parts.port)
+    site_parameters = set()
+    for site in SITE_TRACKING_PARAMETERS:
+        if host == site or host.endswith('.' + site):
+            site_parameters |= SITE_TRACKING_PARAMETERS[site]
+    parameters = []
+    for parameter in parts.query.split('&'):
+        # parse_qsl would give a parameter without a value the value '', which urlencode writes as 'key='
+        key, has_value, value = parameter.partition('=')
+        key = unquote_plus(key)
+        if parameter != '' and not key.lower().startswith('utm_') and key.lower() not in TRACKING_PARAMETERS \
+                and key.lower() not in site_parameters:
+            parameters.append((key, has_value, unquote_plus(value)))
+    query = '&'.join(quote_plus(key) + ('=' + quote_plus(value) if has_value else '')
+                     for key, has_value, value in sorted(parameters))
+    return urlunsplit((scheme, host, parts.path or '/', query, ''))
+
+
+@dataclass
+class CachedResponse:
+    """A dataclass to represent a page stored in the cache
+
+    Instance Attributes:
+        - url: the canonical url of the page
+        - content: the body of the response
+        - status: the http status of the response
+        - etag: the ETag header of the response, or None if it didn't have one
+        - last_modified: the Last-Modified header of the response, or None if it didn't have one
+        - fetched_at: the time the response was downloaded or last revalidated
+
+    Representation Invariants:
+        - self.url == canonicalize_url(self.url)
+    """
+    url: str
+    content: bytes
+    status: int
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fetched_at: float
+
+    def is_fresh(self, ttl: float) -> bool:
+        """Returns whether the page can be served without revalidating it"""
+        return time.time() - self.fetched_at < ttl
+
+
+class HttpCache:
+    """This class stores downloaded pages on disk.
+
+    Pages are keyed by their canonical url and are served as they are until they are ttl seconds old, after which they
+    are revalidated with a conditional request. Once the stored pages take up more than max_bytes, the least recently
+    used ones are evicted. In offline mode nothing is downloaded and only the stored pages are served, however old.
+    The number of bytes the stored bodies take up is kept in the index as bodies are stored and deleted, so storing
+    a page never needs to add up the size of every body.
+
+    Instance Attributes:
+        - directory: the folder the index and compressed pages are stored in
+        - ttl: the number of seconds a page is served without revalidating it
+        - max_bytes: the largest number of compressed bytes of pages kept
+        - offline: whether pages are only served from the cache
+        - hits: the number of pages served from the cache without a request
+        - revalidations: the number of stale pages the server confirmed were unchanged
+        - misses: the number of pages that had to be downloaded
+    Private Instance Attributes:
+        - _connection: the connection to the index, None until the index is first used
+        - _pid: the id of the process _connection was opened in
+        - _lock: a lock guarding the connection and counters
+
+    Representation Invariants:
+        - self.ttl >= 0
+        - self.max_bytes > 0
+    """
+    directory: str
+    ttl: float
+    max_bytes: int
+    offline: bool
+    hits: int
+    revalidations: int
+    misses: int
+    _connection: Optional[sqlite3.Connection]
+    _pid: int
+    _lock: threading.Lock
+
+    def __init__(self, directory: str = HTTP_CACHE_DIRECTORY, ttl: float = HTTP_CACHE_TTL,
+                 max_bytes: int = HTTP_CACHE_MAX_BYTES, offline: bool = False) -> None:
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.hits = 0
+        self.revalidations = 0
+        self.misses = 0
+        self._connection = None
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """Returns the connection to the index, creating the index if needed"""
+        if self._connection is None or self._pid != os.getpid():
+            os.makedirs(os.path.join(self.directory, 'blobs'), exist_ok=True)
+            self._connection = sqlite3.connect(os.path.join(self.directory, 'index.sqlite3'),
+                                               check_same_thread=False, timeout=30)
+            self._pid = os.getpid()
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS responses (url TEXT PRIMARY KEY, blob TEXT, '
+                                     'size INTEGER, status INTEGER, etag TEXT, last_modified TEXT, '
+                                     'fetched_at REAL, last_used REAL)')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS responses_blob ON responses (blob)')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)')
+            # the size of an index written before the size was kept is added up once
+            self._connection.execute("INSERT OR IGNORE INTO meta SELECT 'total_bytes', COALESCE(SUM(size), 0) FROM "
+                                     "(SELECT DISTINCT blob, size FROM responses)")
+            self._connection.commit()
+        return self._connection
+
+    def _get_blob_path(self, blob: str) -> str:
+        """Returns the path of the file holding the compressed body with the given hash"""
+        return os.path.join(self.directory, 'blobs', blob[:2], blob[2:] + '.zlib')
+
+    def get(self, url: str) -> Optional[CachedResponse]:
+        """Returns the stored page of the url, or None if it isn't stored
+        """
+        url = canonicalize_url(url)
+        with self._lock:
+            connection = self._get_connection()
+            row = connection.execute('SELECT blob, status, etag, last_modified, fetched_at, size FROM responses '
+                                     'WHERE url = ?', (url,)).fetchone()
+            if row is None:
+                return None
+            try:
+                with open(self._get_blob_path(row[0]), 'rb') as blob_file:
+                    content = zlib.decompress(blob_file.read())
+            except (OSError, zlib.error):
+                # the body was deleted or damaged outside the cache, forget about the page
+                connection.execute('BEGIN IMMEDIATE')
+                connection.execute('DELETE FROM responses WHERE url = ?', (url,))
+                self._delete_unused_blobs(connection, {row[0]: row[5]})
+                connection.commit()
+                return None
+            connection.execute('UPDATE responses SET last_used = ? WHERE url = ?', (time.time(), url))
+            connection.commit()
+        return CachedResponse(url, content, row[1], row[2], row[3], row[4])
+
+    def put(self, url: str, content: bytes, status: int, etag: Optional[str] = None,
+            last_modified: Optional[str] = None) -> None:
+        """Stores the page of the url, evicting the least recently used pages if needed
+        """
+        url = canonicalize_url(url)
+        blob = hashlib.sha256(content).hexdigest()
+        path = self._get_blob_path(blob)
+        compressed = zlib.compress(content, 6)
+        with self._lock:
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # write to a temporary file first so a crash never leaves half a body behind
+                temporary_path = path + '.' + str(os.getpid()) + '.' + str(threading.get_ident()) + '.tmp'
+                with open(temporary_path, 'wb') as blob_file:
+                    blob_file.write(compressed)
+                os.replace(temporary_path, path)
+            now = time.time()
+            connection = self._get_connection()
+            # other processes can share the index, so the size is read and changed in one transaction
+            connection.execute('BEGIN IMMEDIATE')
+            old_blob = connection.execute('SELECT blob, size FROM responses WHERE url = ?', (url,)).fetchone()
+            if connection.execute('SELECT 1 FROM responses WHERE blob = ? LIMIT 1', (blob,)).fetchone() is None:
+                self._add_total_bytes(connection, len(compressed))
+            connection.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                               (url, blob, len(compressed), status, etag, last_modified, now, now))
+            if old_blob is not None and old_blob[0] != blob:
+                self._delete_unused_blobs(connection, {old_blob[0]: old_blob[1]})
+            self._evict(connection)
+            connection.commit()
+
+    def refresh(self, url: str) -> None:
+        """Marks the stored page of the url as just revalidated, after the server confirmed it hasn't changed
+        """
+        now = time.time()
+        with self._lock:
+            connection = self._get_connection()
+            connection.execute('UPDATE responses SET fetched_at = ?, last_used = ? WHERE url = ?',
+                               (now, now, canonicalize_url(url)))
+            connection.commit()
+
+    def record(self, kind: str) -> None:
+        """Counts a page served from the cache ('hit'), revalidated ('revalidation') or downloaded ('miss')
+        """
+        with self._lock:
+            if kind == 'hit':
+                self.hits += 1
+            elif kind == 'revalidation':
+                self.revalidations += 1
+            else:
+                self.misses += 1
+
+    def _get_total_bytes(self, connection: sqlite3.Connection) -> int:
+        """Returns the number of compressed bytes of the stored bodies"""
+        return connection.execute("SELECT value FROM meta WHERE key = 'total_bytes'").fetchone()[0]
+
+    def _add_total_bytes(self, connection: sqlite3.Connection, size: int) -> None:
+        """Adds size to the number of compressed bytes of the stored bodies"""
+        connection.execute("UPDATE meta SET value = value + ? WHERE key = 'total_bytes'", (size,))
+
+    def _evict(self, connection: sqlite3.Connection) -> None:
+        """Evicts the least recently used pages until the stored bodies fit under EVICTION_RATIO of max_bytes"""
+        if self._get_total_bytes(connection) <= self.max_bytes:
+            return
+        for url, blob, size in connection.execute('SELECT url, blob, size FROM responses ORDER BY last_used'
+                                                  ).fetchall():
+            if self._get_total_bytes(connection) <= self.max_bytes * EVICTION_RATIO:
+                break
+            connection.execute('DELETE FROM responses WHERE url = ?', (url,))
+            # a body shared with a page that is still stored keeps its bytes
+            self._delete_unused_blobs(connection, {blob: size})
+
+    def _delete_unused_blobs(self, connection: sqlite3.Connection, blobs: dict[str, int]) -> None:
+        """Deletes the files of the given bodies that no stored page uses anymore, blobs maps every body to its size
+        """
+        for blob in blobs:
+            if connection.execute('SELECT 1 FROM responses WHERE blob = ? LIMIT 1', (blob,)).fetchone() is None:
+                self._add_total_bytes(connection, -blobs[blob])
+                try:
+                    os.remove(self._get_blob_path(blob))
+                except OSError:
+                    pass
+
+    def get_urls(self, limit: Optional[int] = None) -> list[str]:
+        """Returns the canonical urls of the stored pages, most recently used first
+        """
+        with self._lock:
+            connection = self._get_connection()
+            rows = connection.execute('SELECT url FROM responses ORDER BY last_used DESC LIMIT ?',
+                                      (-1 if limit is None else limit,)).fetchall()
+        return [row[0] for row in rows]
+
+    def get_stats(self) -> dict[str, float]:
+        """Returns the counters of the cache along with the fraction of pages not downloaded again
+        """
+        lookups = self.hits + self.revalidations + self.misses
+        return {
+            'hits': self.hits,
+            'revalidations': self.revalidations,
+            'misses': self.misses,
+            'hit_rate': (self.hits + self.revalidations) / lookups if lookups > 0 else 0.0
+        }
+
+    def close(self) -> None:
+        """Closes the connection to the index
+        """
+        with self._lock:
+            if self._connection is not None and self._pid == os.getpid():
+                self._connection.close()
+            self._connection = None
+
+
+if __name__ == '__main__':
+    import doctest
+    import python_ta
+
+    doctest.testmod(verbose=True)
+
+    python_ta.check_all(config={
+        'max-line-length': 120,
+        'extra-imports': ['__future__', 'dataclasses', 'typing', 'urllib.parse', 'hashlib', 'os', 'sqlite3',
+                          'threading', 'time', 'zlib'],
+        'allowed-io': ['HttpCache.get', 'HttpCache.put'],
+        'max-nested-blocks': 10
+    })
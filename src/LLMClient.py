@@ -0,0 +1,168 @@
+"""
+This Python module contains the client used to send chat completion requests to an OpenAI compatible API. Requests
+are sent concurrently from a bounded pool of threads and go through an adaptive token bucket, so many passages can be
+scored at once without running into the API's rate limits.
+
+Copyright and Usage Information
+===============================
+
+This file is provided solely for the personal and private use of TAs and professors
+at the University of Toronto St. George campus. All forms of
+distribution of this code, whether as given or with any changes, are
+expressly prohibited. For more information on copyright for CSC111 materials,
+please consult the Course Syllabus.
+
+This file is Copyright (c) 2023 Mark Zhang, Li Zhang and Luke Zhang
+"""
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from RateLimiter import TokenBucket, parse_retry_after
+import os
+import threading
+import time
+import requests
+
+# the base url can point at any OpenAI compatible server, ie. a local stand in server for tests and benchmarks
+OPENAI_BASE_URL = os.environ.get('OPENAI_BASE_URL', 'https://api.openai.com/v1')
+LLM_MAX_IN_FLIGHT = 8
+LLM_REQUESTS_PER_SECOND = 10.0
+LLM_REQUEST_TIMEOUT = 60
+LLM_MAX_REQUESTS = 3
+# the pause (in seconds) before retrying a request that failed on the server's end, doubled after every failure
+LLM_RETRY_BACKOFF = 0.5
+
+
+class ChatCompletionClient:
+    """This class sends chat completion requests to an OpenAI compatible API.
+
+    At most max_in_flight requests are sent at once and every request takes a token from a TokenBucket first.
+    Rate limit responses (429) cut the bucket's rate and are retried after the server's Retry-After time, server
+    errors are retried with exponential backoff.
+
+    Instance Attributes:
+        - base_url: the url of the API, chat completions are posted to base_url + '/chat/completions'
+        - model: the name of the model the completions are requested from
+        - max_in_flight: the largest number of requests waiting on a response at once
+        - max_requests: the number of times a request is tried before giving up on it
+        - timeout: the number of seconds to wait for a response before giving up on a try
+        - bucket: the token bucket every request goes through
+    Private Instance Attributes:
+        - _api_key: the key sent with every request
+        - _session: the http session shared by all requests so connections are kept alive, per process
+        - _executor: the pool of threads sending the requests
+        - _pid: the id of the process _session and _executor were created in
+        - _lock: a lock guarding the creation of _session and _executor
+
+    Representation Invariants:
+        - self.base_url != ''
+        - self.max_in_flight > 0
+        - self.max_requests > 0
+    """
+    base_url: str
+    model: str
+    max_in_flight: int
+    max_requests: int
+    timeout: float
+    bucket: TokenBucket
+    _api_key: str
+    _session: Optional[requests.Session]
+    _executor: Optional[ThreadPoolExecutor]
+    _pid: int
+    _lock: threading.Lock
+
+    def __init__(self, api_key: str, model: str, base_url: str = OPENAI_BASE_URL,
+                 max_in_flight: int = LLM_MAX_IN_FLIGHT, requests_per_second: float = LLM_REQUESTS_PER_SECOND,
+                 max_requests: int = LLM_MAX_REQUESTS, timeout: float = LLM_REQUEST_TIMEOUT) -> None:
+        self.base_url = base_url.rstrip('/')
+        self.model = model
+        self.max_in_flight = max_in_flight
+        self.max_requests = max_requests
+        self.timeout = timeout
+        self.bucket = TokenBucket(requests_per_second, capacity=max_in_flight)
+        self._api_key = api_key
+        self._session = None
+        self._executor = None
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def _get_session(self) -> requests.Session:
+        """Returns the http session of this process, creating it if needed"""
+        with self._lock:
+            if self._session is None or self._pid != os.getpid():
+                self._session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.max_in_flight)
+                self._session.mount('http://', adapter)
+                self._session.mount('https://', adapter)
+                self._executor = None
+                self._pid = os.getpid()
+            return self._session
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Returns the pool of threads of this process, creating it if needed"""
+        self._get_session()
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight)
+            return self._executor
+
+    def complete(self, messages: list[dict[str, str]], max_tokens: int, temperature: float = 0) -> Optional[str]:
+        """Sends a chat completion request and returns the content of the reply, or None if every try failed
+        """
+        session = self._get_session()
+        backoff = LLM_RETRY_BACKOFF
+        for _ in range(self.max_requests):
+            self.bucket.acquire()
+            try:
+                response = session.post(self.base_url + '/chat/completions',
+                                        headers={'Authorization': 'Bearer ' + self._api_key},
+                                        json={'model': self.model, 'messages': messages, 'max_tokens': max_tokens,
+                                              'temperature': temperature},
+                                        timeout=self.timeout)
+            except requests.exceptions.RequestException:
+                time.sleep(backoff)
+                backoff *= 2
+                continue
+            if response.status_code == 429:
+                # rate limited, slow down every request going through the bucket
+                self.bucket.on_throttled(parse_retry_after(response.headers.get('Retry-After')))
+                print("Retry CHAT-GPT Api Call")
+                continue
+            if response.status_code >= 500:
+                time.sleep(backoff)
+                backoff *= 2
+                continue
+            if response.status_code != 200:
+                # the request itself is bad so trying again won't help
+                return None
+            self.bucket.on_success()
+            try:
+                return response.json()['choices'][0]['message']['content']
+            except (ValueError, KeyError, IndexError, TypeError):
+                return None
+        return None
+
+    def complete_many(self, conversations: list[list[dict[str, str]]], max_tokens: int,
+                      temperature: float = 0) -> list[Optional[str]]:
+        """Sends a chat completion request for every conversation concurrently and returns the content of the
+        replies in the same order as conversations. A reply is None if every try of its request failed
+        """
+        if len(conversations) == 0:
+            return []
+        executor = self._get_executor()
+        return list(executor.map(lambda messages: self.complete(messages, max_tokens, temperature), conversations))
+
+
+if __name__ == '__main__':
+    import doctest
+    import python_ta
+
+    doctest.testmod(verbose=True)
+
+    python_ta.check_all(config={
+        'max-line-length': 120,
+        'extra-imports': ['__future__', 'concurrent.futures', 'typing', 'RateLimiter', 'os', 'threading', 'time',
+                          'requests'],
+        'allowed-io': ['ChatCompletionClient.complete'],
+        'max-nested-blocks': 10
+    })
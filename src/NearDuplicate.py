@@ -0,0 +1,181 @@
+"""
+This Python module contains the functions for finding near duplicate news articles. Syndicated and templated
+articles are often the same text with a different date or byline, so scoring each of them is wasted model work.
+Articles are compared with MinHash signatures of their word shingles, and locality sensitive hashing (LSH) on the
+signatures finds the likely duplicates without comparing every pair of articles.
+
+Copyright and Usage Information
+===============================
+
+This file is provided solely for the personal and private use of TAs and professors
+at the University of Toronto St. George campus. All forms of
+distribution of this code, whether as given or with any changes, are
+expressly prohibited. For more information on copyright for CSC111 materials,
+please consult the Course Syllabus.
+
+This file is Copyright (c) 2023 Mark Zhang, Li Zhang and Luke Zhang
+"""
+from __future__ import annotations
+from typing import Optional
+from NewsScraper import NewsArticleContent
+import hashlib
+import random
+import re
+
+# the number of words in a shingle
+SHINGLE_SIZE = 5
+# the number of hash functions in a MinHash signature, split into LSH_BANDS bands of equal size
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 16
+# the smallest jaccard similarity of the shingles of two articles for them to be near duplicates
+SIMILARITY_THRESHOLD = 0.8
+# a mersenne prime larger than every shingle hash, the hash functions are (a * x + b) mod _PRIME
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_random = random.Random(111)
+_PERMUTATIONS = [(_random.randrange(1, _PRIME), _random.randrange(0, _PRIME)) for _ in range(NUM_PERMUTATIONS)]
+
+
+def get_shingles(text: str) -> set[int]:
+    """Returns the hashes of every SHINGLE_SIZE word shingle of the text. Case and punctuation are ignored and every
+    number is treated as the same number, so articles that only differ in their dates and figures share their shingles
+
+    >>> get_shingles('Gilead shares rose 2% on May 3') == get_shingles('gilead shares ROSE 5% on May 9.')
+    True
+    """
+    words = re.sub(r'\d+', '0', text.lower())
+    words = re.findall(r'[a-z0-9]+', words)
+    if len(words) < SHINGLE_SIZE:
+        # too short to shingle, the whole text is the only shingle
+        words = [' '.join(words)] if words else []
+        size = 1
+    else:
+        size = SHINGLE_SIZE
+    return {int.from_bytes(hashlib.blake2b(' '.join(words[i:i + size]).encode('utf-8'), digest_size=4).digest(),
+                           'little') for i in range(len(words) - size + 1)}
+
+
+def get_minhash(shingles: set[int]) -> tuple[int, ...]:
+    """Returns the MinHash signature of the shingles, the minimum of every hash function over the shingles
+
+    Preconditions:
+        - shingles != set()
+    """
+    return tuple(min((a * shingle + b) % _PRIME for shingle in shingles) & _MAX_HASH for a, b in _PERMUTATIONS)
+
+
+def get_jaccard_similarity(shingles1: set[int], shingles2: set[int]) -> float:
+    """Returns the jaccard similarity of the two sets of shingles
+
+    >>> get_jaccard_similarity({1, 2, 3}, {2, 3, 4})
+    0.5
+    """
+    union = len(shingles1 | shingles2)
+    return len(shingles1 & shingles2) / union if union > 0 else 0.0
+
+
+class NearDuplicateIndex:
+    """This class finds near duplicate texts among the texts added to it.
+
+    Every text is banded by its MinHash signature, texts sharing a band are candidates, and a candidate is only a near
+    duplicate if the exact jaccard similarity of the shingles is at least the threshold. The titles of the texts must be
+    near duplicates too, since a title changes the score of an article as much as its text.
+
+    Instance Attributes:
+        - threshold: the smallest jaccard similarity of two texts for them to be near duplicates
+    Private Instance Attributes:
+        - _buckets: a dictionary mapping a (band index, band of a signature) pair to the indices of the representative
+                    texts with that band
+        - _shingles: the shingles of every representative text, by its index
+        - _title_shingles: the shingles of the title of every representative text, by its index
+
+    Representation Invariants:
+        - 0 < self.threshold <= 1
+    """
+    threshold: float
+    _buckets: dict[tuple[int, tuple[int, ...]], list[int]]
+    _shingles: dict[int, set[int]]
+    _title_shingles: dict[int, set[int]]
+
+    def __init__(self, threshold: float = SIMILARITY_THRESHOLD) -> None:
+        self.threshold = threshold
+        self._buckets = {}
+        self._shingles = {}
+        self._title_shingles = {}
+
+    def add(self, index: int, text: str, title: str = '') -> Optional[int]:
+        """Adds the text with the given index and title. Returns the index of the representative text it and its title
+        are near duplicates of, or None if it isn't a near duplicate of any text added so far, in which case it becomes
+        a representative
+        """
+        shingles = get_shingles(text)
+        title_shingles = get_shingles(title)
+        if len(shingles) == 0:
+            # nothing to compare, an empty text is never a near duplicate
+            return None
+        signature = get_minhash(shingles)
+        rows = NUM_PERMUTATIONS // LSH_BANDS
+        bands = [(band, signature[band * rows:(band + 1) * rows]) for band in range(LSH_BANDS)]
+        checked = set()
+        for band in bands:
+            for candidate in self._buckets.get(band, []):
+                if candidate not in checked:
+                    checked.add(candidate)
+                    if get_jaccard_similarity(shingles, self._shingles[candidate]) >= self.threshold and \
+                            self._is_same_title(title_shingles, self._title_shingles[candidate]):
+                        return candidate
+        self._shingles[index] = shingles
+        self._title_shingles[index] = title_shingles
+        for band in bands:
+            self._buckets.setdefault(band, []).append(index)
+        return None
+
+    def _is_same_title(self, title_shingles1: set[int], title_shingles2: set[int]) -> bool:
+        """Returns whether the titles with the given shingles are near duplicates, two empty titles are"""
+        if len(title_shingles1) == 0 or len(title_shingles2) == 0:
+            return title_shingles1 == title_shingles2
+        return get_jaccard_similarity(title_shingles1, title_shingles2) >= self.threshold
+
+
+def get_article_text(article: NewsArticleContent) -> str:
+    """Returns the text of the article compared when finding near duplicates, its sentences without the title, which
+    is compared on its own"""
+    return '. '.join(article.sentences)
+
+
+def get_representatives(articles: list[NewsArticleContent], threshold: float = SIMILARITY_THRESHOLD) -> list[int]:
+    """Returns the index of the representative of every article, the first article it is a near duplicate of or its
+    own index if it isn't a near duplicate of an earlier article
+
+    >>> article = NewsArticleContent('Gilead', ['Gilead Sciences stock rises Monday, outperforms market on May 3'])
+    >>> dated = NewsArticleContent('Gilead', ['Gilead Sciences stock rises Monday, outperforms market on May 10'])
+    >>> other = NewsArticleContent('Apple', ['Apple unveils a new iPhone at its annual product event in September'])
+    >>> get_representatives([article, other, dated])
+    [0, 1, 0]
+
+    Syndicated articles with the same text but different titles aren't near duplicates
+    >>> body = ['Gilead Sciences reported its quarterly earnings on Thursday, with revenue of 7 billion dollars']
+    >>> get_representatives([NewsArticleContent('Gilead beats estimates', body),
+    ...                      NewsArticleContent('Gilead misses estimates', body)])
+    [0, 1]
+    """
+    index = NearDuplicateIndex(threshold)
+    representatives = []
+    for i in range(len(articles)):
+        representative = index.add(i, get_article_text(articles[i]), articles[i].title)
+        representatives.append(i if representative is None else representative)
+    return representatives
+
+
+if __name__ == '__main__':
+    import doctest
+    import python_ta
+
+    doctest.testmod(verbose=True)
+
+    python_ta.check_all(config={
+        'max-line-length': 120,
+        'extra-imports': ['__future__', 'typing', 'NewsScraper', 'hashlib', 'random', 're'],
+        'allowed-io': [],
+        'max-nested-blocks': 10
+    })
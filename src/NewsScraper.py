@@ -1,16 +1,18 @@
 """
 This Python module contains all classes and functions for webscraping and collecting data
 """
-
+from __future__ import annotations
 import random
 from dataclasses import dataclass, field
-import bs4
+from html.entities import html5
+from html.parser import HTMLParser
+import codecs
+import re
 from typing import Union
 from python_ta.contracts import check_contracts
-from bs4 import BeautifulSoup
 from StockInfo import Stock
-import requests
-import time
+from RateLimiter import get_host_rate_limiter
+from urllib.parse import urlsplit
 
 # == CONSTANTS ==
 USER_AGENTS = [
@@ -27,7 +29,28 @@ SEARCH_PARAMS = {
     "tbs": "qdr:",
 }
 NEWS_URL = "https://www.google.com/search"
+NEWS_HOST = urlsplit(NEWS_URL).hostname
 WEB_TIMEOUT = 30
+# the number of search pages requested per second until the search host rate limits us
+SEARCH_REQUESTS_PER_SECOND = 0.5
+# the number of times a search page is requested before giving up on it when the search host keeps rate limiting us
+SEARCH_MAX_REQUESTS = 4
+# the most pages of search results requested by one search, so a search whose results were all skipped ends
+SEARCH_MAX_PAGES = 10
+get_host_rate_limiter().set_host_rate(NEWS_HOST, SEARCH_REQUESTS_PER_SECOND)
+
+# the tags that never hold anything, as BeautifulSoup's html.parser builder treats them
+EMPTY_ELEMENT_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen', 'link', 'menuitem', 'meta',
+                      'param', 'source', 'track', 'wbr', 'basefont', 'bgsound', 'command', 'frame', 'image', 'isindex',
+                      'nextid', 'spacer'}
+# the tags inside which text that is only whitespace is kept as it is
+PRESERVE_WHITESPACE_TAGS = {'pre', 'textarea'}
+ASCII_SPACES = '\x20\x0a\x09\x0c\x0d'
+# newlines are removed by the translation table, every other non ascii character by encoding to ascii
+REMOVE_NEWLINES = str.maketrans('', '', '\n')
+HTML_ENTITIES = {name.rstrip(';'): character for name, character in html5.items()}
+XML_ENCODING_PATTERN = re.compile(b'^\\s*<\\?.*encoding=[\'"](.*?)[\'"].*\\?>', re.I)
+HTML_META_ENCODING_PATTERN = re.compile(b'<\\s*meta[^>]+charset\\s*=\\s*["\']?([^>]*?)[ /;\'">]', re.I)
 
 PUBLISH_RANGE = {
     'PastYear': 'y',
@@ -66,6 +89,7 @@ def get_children_as_str(obj: bs4.PageElement | bs4.element.NavigableString | bs4
     Preconditions:
         - obj is a bs4 object that represents the HTML corresponding to a website
     """
+    import bs4
     if isinstance(obj, bs4.element.NavigableString):
         return remove_non_ascii(str(obj))
     else:
@@ -98,43 +122,291 @@ def get_random_header_agent() -> str:
 
 
 # @check_contracts
-def get_content_from_article_url(url: str) -> NewsArticleContent | None:
+def decode_html(html: bytes) -> tuple[str, str]:
+    """
+    Returns the html decoded to a string along with the encoding it was decoded with. The encodings are tried in the
+    same order BeautifulSoup tries them: the encoding of the byte order mark, the encoding declared in the html, then
+    utf-8 and windows-1252 (BeautifulSoup's guess from a character set detector is skipped)
+
+    >>> decode_html(b'<meta charset="windows-1252"><p>caf\\xe9</p>')
+    ('<meta charset="windows-1252"><p>caf\xe9</p>', 'windows-1252')
+    """
+    encodings = []
+    for byte_order_mark, encoding in ((codecs.BOM_UTF32_BE, 'utf-32be'), (codecs.BOM_UTF32_LE, 'utf-32le'),
+                                      (codecs.BOM_UTF8, 'utf-8'), (codecs.BOM_UTF16_BE, 'utf-16be'),
+                                      (codecs.BOM_UTF16_LE, 'utf-16le')):
+        if html.startswith(byte_order_mark):
+            html = html[len(byte_order_mark):]
+            encodings.append(encoding)
+            break
+    declared = XML_ENCODING_PATTERN.search(html, endpos=1024) or \
+        HTML_META_ENCODING_PATTERN.search(html, endpos=max(2048, int(len(html) * 0.05)))
+    if declared is not None and declared.group(1):
+        encodings.append(declared.group(1).decode('ascii', 'replace').lower())
+    for encoding in encodings + ['utf-8', 'windows-1252']:
+        try:
+            return html.decode(encoding), encoding
+        except (LookupError, UnicodeDecodeError):
+            pass
+    return html.decode('utf-8', 'replace'), 'utf-8'
+
+
+class _ArticleTextParser(HTMLParser):
+    """A single pass parser collecting the text of every <p> tag and the title of an article.
+
+    The html is tokenized by the standard library's HTMLParser and tags are opened and closed exactly like
+    BeautifulSoup's html.parser builder opens and closes them (ie. a <p> inside another <p> is nested in it), so the
+    text collected is the same as the text of the <p> tags of a BeautifulSoup tree, without building the tree.
+
+    Instance Attributes:
+        - sentences: the sentences of the text of the <p> tags completed so far
+        - title: the children of the first <title> tag, or None if there hasn't been one
+    Private Instance Attributes:
+        - _encoding: the encoding the html was decoded with, used for numeric character references
+        - _stack: a [tag name, paragraph] pair for every open tag, where paragraph is the index of the <p> tag's
+                  text in _paragraphs, or None if the tag isn't a <p>
+        - _open_counts: the number of open tags of every name
+        - _already_closed: the empty element tags closed when they were opened, whose end tags are ignored
+        - _preserve_whitespace: the number of open tags whitespace is kept in
+        - _data: the pieces of the text seen since the last tag or comment
+        - _paragraphs: the text pieces of every <p> tag whose text hasn't been added to the sentences yet
+        - _closed: whether every <p> tag in _paragraphs has been closed
+        - _first_paragraph: the index of the first <p> tag in _paragraphs, <p> tags are added to the sentences in
+                            the order they were opened
+        - _pending: the text after the last sentence break, the start of the next sentence
+        - _title_stack: the children lists of the open tags inside the first <title> tag
     """
-    Returns a NewsArticleContentObject that contains the content for the article
+    sentences: list[str]
+    title: list | None
+    _encoding: str
+    _stack: list[list]
+    _open_counts: dict[str, int]
+    _already_closed: list[str]
+    _preserve_whitespace: int
+    _data: list[str]
+    _paragraphs: dict[int, list[str]]
+    _closed: dict[int, bool]
+    _first_paragraph: int
+    _pending: str
+    _title_stack: list[list]
+
+    def __init__(self, encoding: str) -> None:
+        super().__init__(convert_charrefs=False)
+        self.sentences = []
+        self.title = None
+        self._encoding = encoding
+        self._stack = []
+        self._open_counts = {}
+        self._already_closed = []
+        self._preserve_whitespace = 0
+        self._data = []
+        self._paragraphs = {}
+        self._closed = {}
+        self._first_paragraph = 0
+        self._pending = ''
+        self._title_stack = []
+
+    def _end_data(self) -> None:
+        """Adds the text seen since the last tag or comment as one string to every open tag"""
+        if not self._data:
+            return
+        text = ''.join(self._data)
+        self._data = []
+        if self._preserve_whitespace == 0 and text.strip(ASCII_SPACES) == '':
+            text = '\n' if '\n' in text else ' '
+        for _, paragraph in self._stack:
+            if paragraph is not None:
+                self._paragraphs[paragraph].append(text)
+        if self._title_stack:
+            self._title_stack[-1].append(text)
+
+    def _push(self, tag: str) -> None:
+        """Opens the tag"""
+        paragraph = None
+        if tag == 'p':
+            paragraph = self._first_paragraph + len(self._paragraphs)
+            self._paragraphs[paragraph] = []
+            self._closed[paragraph] = False
+        self._stack.append([tag, paragraph])
+        self._open_counts[tag] = self._open_counts.get(tag, 0) + 1
+        if tag in PRESERVE_WHITESPACE_TAGS:
+            self._preserve_whitespace += 1
+        if self._title_stack:
+            children = []
+            self._title_stack[-1].append(children)
+            self._title_stack.append(children)
+        elif tag == 'title' and self.title is None:
+            self.title = []
+            self._title_stack.append(self.title)
+
+    def _pop(self) -> None:
+        """Closes the most recently opened tag"""
+        tag, paragraph = self._stack.pop()
+        self._open_counts[tag] -= 1
+        if tag in PRESERVE_WHITESPACE_TAGS:
+            self._preserve_whitespace -= 1
+        if self._title_stack:
+            self._title_stack.pop()
+        if paragraph is not None:
+            self._closed[paragraph] = True
+            # paragraphs are added in the order they were opened, so a closed paragraph waits for the ones around it
+            while self._first_paragraph in self._closed and self._closed[self._first_paragraph]:
+                self._add_paragraph(self._paragraphs.pop(self._first_paragraph))
+                del self._closed[self._first_paragraph]
+                self._first_paragraph += 1
+
+    def _add_paragraph(self, pieces: list[str]) -> None:
+        """Adds the text of a closed <p> tag to the sentences if it has more than one word"""
+        text = ''.join(pieces).translate(REMOVE_NEWLINES).encode('ascii', 'ignore').decode('ascii')
+        if len(text.split()) > 1:
+            sentences = (self._pending + text).split('. ')
+            self._pending = sentences.pop()
+            self.sentences.extend(sentences)
+
+    def handle_starttag(self, tag: str, attrs: list, handle_empty_element: bool = True) -> None:
+        """Opens the tag, empty element tags are closed right away"""
+        self._end_data()
+        self._push(tag)
+        if tag in EMPTY_ELEMENT_TAGS and handle_empty_element:
+            self.handle_endtag(tag, check_already_closed=False)
+            self._already_closed.append(tag)
+
+    def handle_startendtag(self, tag: str, attrs: list) -> None:
+        """Opens and closes a tag written as <tag/>"""
+        self.handle_starttag(tag, attrs, handle_empty_element=False)
+        self.handle_endtag(tag)
+
+    def handle_endtag(self, tag: str, check_already_closed: bool = True) -> None:
+        """Closes every tag opened since the most recent open tag with the given name, if there is one"""
+        if check_already_closed and tag in self._already_closed:
+            self._already_closed.remove(tag)
+            return
+        self._end_data()
+        if self._open_counts.get(tag):
+            while self._stack[-1][0] != tag:
+                self._pop()
+            self._pop()
+
+    def handle_data(self, data: str) -> None:
+        """Adds text"""
+        self._data.append(data)
+
+    def handle_charref(self, name: str) -> None:
+        """Adds the character of a numeric character reference, references to the windows-1252 range are read as
+        windows-1252 characters. Like BeautifulSoup, references to the null character, to surrogates or past the last
+        code point are replaced with the replacement character"""
+        number = int(name[1:], 16) if name[0] in 'xX' else int(name)
+        data = None
+        if number == 0 or 0xD800 <= number <= 0xDFFF or number > 0x10FFFF:
+            data = '\N{REPLACEMENT CHARACTER}'
+        elif number < 256:
+            for encoding in (self._encoding, 'windows-1252'):
+                try:
+                    data = bytes([number]).decode(encoding)
+                    break
+                except (LookupError, UnicodeDecodeError):
+                    pass
+        self._data.append(data or chr(number))
+
+    def handle_entityref(self, name: str) -> None:
+        """Adds the character of a named character reference, or the reference itself if it isn't known"""
+        self._data.append(HTML_ENTITIES.get(name, '&' + name))
+
+    def _add_string(self, data: str) -> None:
+        """Adds a string that isn't joined with the text around it, ie. the text of a comment"""
+        self._end_data()
+        self._data.append(data)
+        self._end_data()
+
+    def handle_comment(self, data: str) -> None:
+        """Adds the text of a comment, BeautifulSoup keeps comments as strings of the tag they're in"""
+        self._add_string(data)
+
+    def handle_decl(self, decl: str) -> None:
+        """Adds the text of a declaration"""
+        self._add_string(decl[len('DOCTYPE '):])
+
+    def unknown_decl(self, data: str) -> None:
+        """Adds the text of a CDATA section or other declaration"""
+        self._add_string(data[len('CDATA['):] if data.upper().startswith('CDATA[') else data)
+
+    def handle_pi(self, data: str) -> None:
+        """Adds the text of a processing instruction"""
+        self._add_string(data)
+
+    def close(self) -> None:
+        """Finishes parsing, closing every open tag and completing the last sentence"""
+        super().close()
+        self._end_data()
+        while self._stack:
+            self._pop()
+        self.sentences.append(self._pending)
+        self._pending = ''
+
+
+def _get_string(children: list) -> str | None:
+    """Returns the string of a tag with the given children like BeautifulSoup's Tag.string, which is its only child
+    if that is a string, the string of its only child if that is a tag, or None otherwise"""
+    if len(children) != 1:
+        return None
+    elif isinstance(children[0], str):
+        return children[0]
+    else:
+        return _get_string(children[0])
+
+
+# @check_contracts
+def parse_article_html(html: bytes | str) -> NewsArticleContent:
+    """
+    Returns a NewsArticleContentObject that contains the content of the article in the given html
     Texts will be given in as a list of strings, and only <p> tags will be scraped to avoid too many texts. Note
     that any piece of text with only one word in it will NOT be included
 
+    The html is parsed in a single pass which collects the text of the <p> tags, strips their non ascii characters
+    and splits them into sentences as it goes, giving the same content as building a BeautifulSoup tree of the html
+
+    >>> parse_article_html(b'<title>Apple</title><p>Apple rose. It beat <b>estimates</b>.</p><p>Ad</p>')
+    NewsArticleContent(title='Apple', sentences=['Apple rose', 'It beat estimates.'])
+    >>> parse_article_html(b'<p>Apple&#0; rose&#xD800; today.</p>')
+    NewsArticleContent(title='', sentences=['Apple rose today.'])
+    """
+    if isinstance(html, bytes):
+        html, encoding = decode_html(html)
+    else:
+        encoding = 'utf-8'
+    parser = _ArticleTextParser(encoding)
+    parser.feed(html)
+    parser.close()
+    if parser.title is None:
+        title = ""
+    else:
+        title = str(_get_string(parser.title))
+
+    return NewsArticleContent(
+        title=title,
+        sentences=parser.sentences
+    )
+
+
+# @check_contracts
+def get_content_from_article_url(url: str) -> NewsArticleContent | None:
+    """
+    Returns a NewsArticleContentObject that contains the content for the article, see parse_article_html
+
     If this functions fails to fetch the url, return nothing
 
     Preconditions:
         - news_article.url is a legal url.
     """
-    texts = ''
+    import requests
     try:
         # try to send a request and retrieve the article
-        page = requests.get(url, headers={"User-Agent": get_random_header_agent()}, timeout=30)
+        page = requests.get(url, headers={"User-Agent": get_random_header_agent()}, timeout=WEB_TIMEOUT)
     except requests.exceptions.RequestException:
         # something went wrong so return nothing
         return None
 
-    soup = BeautifulSoup(page.content, 'html.parser')
-
-    tags = {'p'}
-    found_title = soup.find('title')
-    if found_title:
-        title = str(found_title.string)
-    else:
-        title = ""
-    content = soup.find_all(tags)
-    for passage in content:
-        string = get_children_as_str(passage)
-        if len(string.split()) > 1:  # has more than just 1 word
-            texts += string
-
-    return NewsArticleContent(
-        title=title,
-        sentences=texts.split('. ')
-    )
+    return parse_article_html(page.content)
 
 
 # @check_contracts
@@ -146,53 +418,73 @@ class NewsScraper:
         - number_of_articles: an integer representing the number of articles to scrape.
         - articles_scraped: a list containing the urls of the news articles scraped.
         - publish_range: a string representing how recent the articles should be when being scraped.
+        - skipped_urls: the urls of the articles that were already tried, they are skipped while paging through the
+          search results and don't count towards number_of_articles
 
     Representation Invariants:
         - self.search_query != ''
         - 0 < self.number_of_articles
         - self.articles_scraped >= 0
+        - all(url not in self.skipped_urls for url in self.articles_scraped)
     """
     search_query: str
     number_of_articles: int
     articles_scraped: list[str]
     publish_range: str
+    skipped_urls: set[str]
 
     # @check_contracts
     def scrape_articles(self) -> bool:
-        """Scrapes the specified amount of articles stated in self.number_of_articles
+        """Scrapes the specified amount of articles stated in self.number_of_articles, paging through the search
+        results until there are enough articles that aren't in self.skipped_urls or there are no more pages.
         Returns true of the scraping was successful, false otherwise.
 
         Preconditions:
             - query != ''
             - 0 < number_of_articles
         """
+        # the scraping libraries are only imported once there is something to scrape
+        import requests
+        from bs4 import BeautifulSoup
         number_of_articles_so_far = len(self.articles_scraped)
-        # configure search params
-        SEARCH_PARAMS['start'] = 0
-        SEARCH_PARAMS['q'] = self.search_query
-        SEARCH_PARAMS['tbs'] = "qdr:" + self.publish_range
-        while number_of_articles_so_far < self.number_of_articles:
-            # sleep for an arbitrary amount to avoid rate limiting
-            time.sleep(random.uniform(2, 5))
-            print(SEARCH_PARAMS)
+        # configure search params, on a copy so several scrapers can search at once
+        search_params = dict(SEARCH_PARAMS)
+        search_params['start'] = 0
+        search_params['q'] = self.search_query
+        search_params['tbs'] = "qdr:" + self.publish_range
+        rate_limiter = get_host_rate_limiter()
+        requests_made = 0
+        pages_read = 0
+        while number_of_articles_so_far < self.number_of_articles and pages_read < SEARCH_MAX_PAGES:
+            # wait until the search host can take another request, the wait only grows if it rate limits us
+            rate_limiter.acquire(NEWS_HOST)
+            print(search_params)
             try:
                 # try to send a request and retrieve the articles from Google News
                 header_agent = get_random_header_agent()
-                html = requests.get(NEWS_URL, params=SEARCH_PARAMS, headers={"User-Agent": header_agent},
+                html = requests.get(NEWS_URL, params=search_params, headers={"User-Agent": header_agent},
                                     timeout=5)
             except requests.exceptions.RequestException as _:
                 # something went wrong so abort the program
                 return False
+            requests_made += 1
+            if rate_limiter.on_response(NEWS_HOST, html.status_code, html.headers.get('Retry-After')):
+                # rate limited, try the same page again once the rate limiter lets us
+                if requests_made < SEARCH_MAX_REQUESTS:
+                    continue
+                return False
+            requests_made = 0
+            pages_read += 1
             # parse the html using beautifulsoup
             soup = BeautifulSoup(html.text, "lxml")
             for result in soup.select(".WlydOe"):
                 # get the article link by retrieving href tags.
                 article_link = result.get("href")
-                if article_link not in self.articles_scraped:
+                if article_link not in self.articles_scraped and article_link not in self.skipped_urls:
                     self.articles_scraped += [article_link]
                     number_of_articles_so_far += 1
             if soup.select_one('.d6cvqb BBwThe'):
-                SEARCH_PARAMS["start"] += 10
+                search_params["start"] += 10
             else:
                 break
 
@@ -219,6 +511,7 @@ class NewsScraper:
         self.number_of_articles = number_of_articles
         self.publish_range = publish_range
         self.articles_scraped = []
+        self.skipped_urls = set()
 
 
 if __name__ == '__main__':
@@ -227,7 +520,8 @@ if __name__ == '__main__':
     doctest.testmod(verbose=True)
 
     python_ta.check_all(config={
-        'extra-imports': ['bs4', 'typing', 'dataclass'],
+        'extra-imports': ['bs4', 'typing', 'dataclass', 'html.entities', 'html.parser', 'codecs', 're',
+                          'RateLimiter', 'urllib.parse'],
         'allowed-io': [],  # the names (strs) of functions that call print/open/input
         'max-line-length': 120
     })
@@ -0,0 +1,292 @@
+"""
+This Python module contains the classes for rate limiting requests made to outside services. Rather than sleeping
+for a fixed amount before every request, a token bucket lets requests through at a steady rate and adapts that rate
+to the rate limit responses the service sends back. A HostRateLimiter keeps one such bucket per host, so only the
+hosts that actually throttle us are slowed down.
+
+Copyright and Usage Information
+===============================
+
+This file is provided solely for the personal and private use of TAs and professors
+at the University of Toronto St. George campus. All forms of
+distribution of this code, whether as given or with any changes, are
+expressly prohibited. For more information on copyright for CSC111 materials,
+please consult the Course Syllabus.
+
+This file is Copyright (c) 2023 Mark Zhang, Li Zhang and Luke Zhang
+"""
+from __future__ import annotations
+from typing import Optional
+import datetime
+import email.utils
+import threading
+import time
+
+# the rate is multiplied by this when the service rate limits a request
+THROTTLE_FACTOR = 0.5
+# the fraction of the max rate the rate grows back by for every successful request
+RECOVERY_FRACTION = 0.05
+# the default number of requests per second sent to a host, and how many can be sent at once
+HOST_REQUESTS_PER_SECOND = 2.0
+HOST_BURST = 2.0
+# the http statuses a host rate limits us with
+THROTTLE_STATUSES = (429, 503)
+# the pause (in seconds) after a host first rate limits us without a Retry-After header, doubled for every rate limit
+# response in a row up to BACKOFF_MAX
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+
+class TokenBucket:
+    """This class is a thread safe token bucket that adapts its rate to rate limit responses.
+
+    Tokens refill at rate per second up to capacity and every request takes a token. When the service rate limits a
+    request, the rate is cut by THROTTLE_FACTOR and no tokens are given out until the service's retry after time has
+    passed. Every successful request grows the rate back towards max_rate.
+
+    Instance Attributes:
+        - rate: the current number of tokens refilled per second
+        - min_rate: the lowest the rate can be cut down to
+        - max_rate: the highest the rate can grow back to
+        - capacity: the largest number of tokens the bucket holds, how many requests can burst at once
+    Private Instance Attributes:
+        - _tokens: the number of tokens currently in the bucket
+        - _updated_at: the time the tokens were last refilled
+        - _blocked_until: the time before which no tokens are given out
+        - _throttle_count: the number of rate limit responses seen
+        - _lock: a lock guarding the state of the bucket
+
+    Representation Invariants:
+        - 0 < self.min_rate <= self.rate <= self.max_rate
+        - self.capacity >= 1
+        - 0 <= self._tokens <= self.capacity
+    """
+    rate: float
+    min_rate: float
+    max_rate: float
+    capacity: float
+    _tokens: float
+    _updated_at: float
+    _blocked_until: float
+    _throttle_count: int
+    _lock: threading.Lock
+
+    def __init__(self, rate: float, capacity: float = 1.0, min_rate: Optional[float] = None,
+                 max_rate: Optional[float] = None) -> None:
+        self.rate = rate
+        self.min_rate = min_rate if min_rate is not None else rate / 16
+        self.max_rate = max_rate if max_rate is not None else rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._blocked_until = 0.0
+        self._throttle_count = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        """Adds the tokens refilled since the last refill"""
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def try_acquire(self) -> float:
+        """Takes a token if one is available and returns 0, otherwise returns how long to wait before trying again
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now < self._blocked_until:
+                return self._blocked_until - now
+            self._refill(now)
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Blocks until a token is taken from the bucket and returns True, or returns False without taking a token if
+        that would take longer than timeout seconds
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        wait_time = self.try_acquire()
+        while wait_time > 0:
+            if deadline is not None and time.monotonic() + wait_time > deadline:
+                return False
+            time.sleep(wait_time)
+            wait_time = self.try_acquire()
+        return True
+
+    def on_throttled(self, retry_after: Optional[float] = None) -> None:
+        """Called when the service rate limited a request. Cuts the rate and stops giving out tokens for retry_after
+        seconds, or for the time it takes to refill one token at the new rate if retry_after isn't given
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.rate = max(self.min_rate, self.rate * THROTTLE_FACTOR)
+            self._tokens = 0
+            self._throttle_count += 1
+            pause = retry_after if retry_after is not None else 1 / self.rate
+            self._blocked_until = max(self._blocked_until, now + pause)
+
+    def on_success(self) -> None:
+        """Called when a request went through, grows the rate back towards max_rate
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = min(self.max_rate, self.rate + self.max_rate * RECOVERY_FRACTION)
+
+    def get_state(self) -> dict[str, float]:
+        """Returns the current state of the bucket for monitoring
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            return {
+                'rate': self.rate,
+                'tokens': self._tokens,
+                'blocked_for': max(0.0, self._blocked_until - now),
+                'throttle_count': self._throttle_count
+            }
+
+
+class HostRateLimiter:
+    """This class rate limits the requests sent to every host with its own TokenBucket.
+
+    Every host starts at the same rate (or the rate given for it in host_rates). When a host rate limits a request,
+    its bucket is paused for the host's Retry-After time or, if it didn't send one, for an exponential backoff that
+    doubles with every rate limit response in a row, and its rate is cut. Other hosts are never slowed down.
+
+    Instance Attributes:
+        - rate: the number of requests per second sent to a host without a rate in host_rates
+        - capacity: the number of requests that can be sent to a host at once
+        - host_rates: a dictionary mapping a host to the number of requests per second sent to it
+    Private Instance Attributes:
+        - _buckets: a dictionary mapping every host requested to its token bucket
+        - _failures: a dictionary mapping every host to the number of rate limit responses it sent in a row
+        - _lock: a lock guarding the creation of buckets and the failure counts
+
+    Representation Invariants:
+        - self.rate > 0
+        - self.capacity >= 1
+        - all(rate > 0 for rate in self.host_rates.values())
+    """
+    rate: float
+    capacity: float
+    host_rates: dict[str, float]
+    _buckets: dict[str, TokenBucket]
+    _failures: dict[str, int]
+    _lock: threading.Lock
+
+    def __init__(self, rate: float = HOST_REQUESTS_PER_SECOND, capacity: float = HOST_BURST,
+                 host_rates: Optional[dict[str, float]] = None) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.host_rates = dict(host_rates) if host_rates is not None else {}
+        self._buckets = {}
+        self._failures = {}
+        self._lock = threading.Lock()
+
+    def _get_bucket(self, host: str) -> TokenBucket:
+        """Returns the token bucket of the host, creating it if needed"""
+        with self._lock:
+            if host not in self._buckets:
+                rate = self.host_rates.get(host, self.rate)
+                self._buckets[host] = TokenBucket(rate, capacity=max(1.0, min(self.capacity, rate)))
+            return self._buckets[host]
+
+    def set_host_rate(self, host: str, rate: float) -> None:
+        """Sets the number of requests per second sent to the host
+        """
+        with self._lock:
+            self.host_rates[host] = rate
+            self._buckets.pop(host, None)
+
+    def acquire(self, host: str, timeout: Optional[float] = None) -> bool:
+        """Blocks until a request can be sent to the host and returns True, or returns False if that would take longer
+        than timeout seconds
+        """
+        return self._get_bucket(host).acquire(timeout)
+
+    def try_acquire(self, host: str) -> float:
+        """Takes a token for a request to the host if one is available and returns 0, otherwise returns how long to
+        wait before trying again
+        """
+        return self._get_bucket(host).try_acquire()
+
+    def on_response(self, host: str, status: int, retry_after: Optional[str] = None) -> bool:
+        """Called with the status and Retry-After header of every response from the host. Returns whether the host
+        rate limited the request
+        """
+        bucket = self._get_bucket(host)
+        if status not in THROTTLE_STATUSES:
+            with self._lock:
+                self._failures[host] = 0
+            bucket.on_success()
+            return False
+        with self._lock:
+            self._failures[host] = self._failures.get(host, 0) + 1
+            backoff = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (self._failures[host] - 1))
+        pause = parse_retry_after(retry_after)
+        bucket.on_throttled(pause if pause is not None else backoff)
+        return True
+
+    def get_state(self, throttled_only: bool = False) -> dict[str, dict[str, float]]:
+        """Returns the state of the bucket of every host requested for monitoring, or of only the hosts that have
+        rate limited a request if throttled_only is True
+        """
+        with self._lock:
+            buckets = dict(self._buckets)
+            failures = dict(self._failures)
+        states = {}
+        for host in buckets:
+            state = buckets[host].get_state()
+            if not throttled_only or state['throttle_count'] > 0:
+                state['failures_in_a_row'] = failures.get(host, 0)
+                states[host] = state
+        return states
+
+
+_host_rate_limiter = HostRateLimiter()
+
+
+def get_host_rate_limiter() -> HostRateLimiter:
+    """Returns the HostRateLimiter shared by everything sending requests to news sites
+    """
+    return _host_rate_limiter
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Returns the number of seconds given by a Retry-After header, which is either a number of seconds or a http
+    date. Returns None if the header is missing or can't be read
+
+    >>> parse_retry_after('2')
+    2.0
+    >>> parse_retry_after(None) is None
+    True
+    """
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, (retry_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+
+if __name__ == '__main__':
+    import doctest
+    import python_ta
+
+    doctest.testmod(verbose=True)
+
+    python_ta.check_all(config={
+        'max-line-length': 120,
+        'extra-imports': ['__future__', 'typing', 'datetime', 'email.utils', 'threading', 'time'],
+        'allowed-io': [],
+        'max-nested-blocks': 10
+    })
@@ -0,0 +1,211 @@
+"""
+This Python module contains the class for memoizing passage sentiment scores on disk. Scraped articles are often
+templated, so the same sentences are seen again and again across articles and runs. Storing the score of every
+passage in a local SQLite file lets those sentences skip VADER, finbert and the LLM entirely.
+
+Copyright and Usage Information
+===============================
+
+This file is provided solely for the personal and private use of TAs and professors
+at the University of Toronto St. George campus. All forms of
+distribution of this code, whether as given or with any changes, are
+expressly prohibited. For more information on copyright for CSC111 materials,
+please consult the Course Syllabus.
+
+This file is Copyright (c) 2023 Mark Zhang, Li Zhang and Luke Zhang
+"""
+from __future__ import annotations
+from typing import Any, Optional
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+MODEL_CACHE_DIRECTORY = 'model_cache/'
+SENTIMENT_CACHE_FILE = MODEL_CACHE_DIRECTORY + 'sentiment_memo.sqlite3'
+SENTIMENT_CACHE_MAX_ENTRIES = 500000
+# fraction of max_entries kept when evicting so eviction doesn't happen again on the very next insert
+EVICTION_RATIO = 0.9
+
+
+def normalize_passage(passage: str) -> str:
+    """Returns the passage with its whitespace collapsed, the form of a passage used for its cache key
+
+    >>> normalize_passage('  Apple   rose\\ntoday ')
+    'Apple rose today'
+    """
+    return ' '.join(passage.split())
+
+
+def get_passage_key(scorer: str, version: str, passage: str) -> str:
+    """Returns the cache key for the passage scored by the given scorer and version
+    """
+    text = scorer + '\0' + version + '\0' + normalize_passage(passage)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class SentimentMemoCache:
+    """This class stores the sentiment scores of passages in a SQLite file.
+
+    A score is keyed by a hash of the normalized passage, the scorer that produced it and the scorer's version, so
+    changing a model or prompt never returns stale scores. Once the file holds more than max_entries scores, the
+    least recently used ones are evicted. The number of scores is kept up to date by triggers as scores are inserted
+    and evicted, so it is right even when several processes write to the file and never needs counting.
+
+    Instance Attributes:
+        - path: the location of the SQLite file
+        - max_entries: the largest number of scores kept in the file
+        - hits: the number of lookups that found a score
+        - misses: the number of lookups that didn't find a score
+    Private Instance Attributes:
+        - _connection: the connection to the SQLite file, None until the file is first used
+        - _pid: the id of the process _connection was opened in, connections can't be shared with forked workers
+        - _lock: a lock guarding the connection and counters
+
+    Representation Invariants:
+        - self.max_entries > 0
+        - self.hits >= 0
+        - self.misses >= 0
+    """
+    path: str
+    max_entries: int
+    hits: int
+    misses: int
+    _connection: Optional[sqlite3.Connection]
+    _pid: int
+    _lock: threading.Lock
+
+    def __init__(self, path: str = SENTIMENT_CACHE_FILE, max_entries: int = SENTIMENT_CACHE_MAX_ENTRIES) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._connection = None
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """Returns the connection to the SQLite file, creating the file and its table if needed
+        """
+        if self._connection is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory != '':
+                os.makedirs(directory, exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._pid = os.getpid()
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS memo (key TEXT PRIMARY KEY, scorer TEXT, '
+                                     'passage TEXT, value TEXT, last_used REAL)')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS memo_last_used ON memo (last_used)')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS memo_count (id INTEGER PRIMARY KEY, count INTEGER)')
+            self._connection.commit()
+            # the count of a file written before it was counted is set up once, in the same transaction as its
+            # triggers so no score is missed
+            self._connection.execute('BEGIN IMMEDIATE')
+            self._connection.execute('CREATE TRIGGER IF NOT EXISTS memo_inserted AFTER INSERT ON memo BEGIN '
+                                     'UPDATE memo_count SET count = count + 1 WHERE id = 0; END')
+            self._connection.execute('CREATE TRIGGER IF NOT EXISTS memo_deleted AFTER DELETE ON memo BEGIN '
+                                     'UPDATE memo_count SET count = count - 1 WHERE id = 0; END')
+            self._connection.execute('INSERT OR IGNORE INTO memo_count SELECT 0, COUNT(*) FROM memo')
+            self._connection.commit()
+        return self._connection
+
+    def get_many(self, scorer: str, version: str, passages: list[str]) -> dict[str, Any]:
+        """Returns a dictionary mapping each passage that has a cached score to its score
+        """
+        # passages that only differ in whitespace share the same key
+        keys = {}
+        for passage in passages:
+            keys.setdefault(get_passage_key(scorer, version, passage), []).append(passage)
+        found = {}
+        with self._lock:
+            connection = self._get_connection()
+            key_list = list(keys)
+            # stay under SQLite's limit on the number of parameters in a query
+            for start in range(0, len(key_list), 500):
+                chunk = key_list[start:start + 500]
+                rows = connection.execute('SELECT key, value FROM memo WHERE key IN (' +
+                                          ', '.join(['?'] * len(chunk)) + ')', chunk).fetchall()
+                for key, value in rows:
+                    for passage in keys[key]:
+                        found[passage] = json.loads(value)
+            if found:
+                now = time.time()
+                connection.executemany('UPDATE memo SET last_used = ? WHERE key = ?',
+                                       [(now, key) for key in keys if keys[key][0] in found])
+                connection.commit()
+            self.hits += sum(1 for passage in passages if passage in found)
+            self.misses += sum(1 for passage in passages if passage not in found)
+        return found
+
+    def get(self, scorer: str, version: str, passage: str) -> Optional[Any]:
+        """Returns the cached score of the passage, or None if it isn't cached
+        """
+        return self.get_many(scorer, version, [passage]).get(passage)
+
+    def put_many(self, scorer: str, version: str, scores: dict[str, Any]) -> None:
+        """Stores the score of every passage in scores, evicting the least recently used scores if needed
+        """
+        if not scores:
+            return
+        now = time.time()
+        rows = [(get_passage_key(scorer, version, passage), scorer, normalize_passage(passage), json.dumps(score), now)
+                for passage, score in scores.items()]
+        with self._lock:
+            connection = self._get_connection()
+            # an upsert rather than INSERT OR REPLACE, whose deletes don't fire the trigger keeping the count
+            connection.executemany('INSERT INTO memo VALUES (?, ?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET '
+                                   'value = excluded.value, last_used = excluded.last_used', rows)
+            count = connection.execute('SELECT count FROM memo_count WHERE id = 0').fetchone()[0]
+            if count > self.max_entries:
+                connection.execute('DELETE FROM memo WHERE key IN (SELECT key FROM memo ORDER BY last_used LIMIT ?)',
+                                   (count - int(self.max_entries * EVICTION_RATIO),))
+            connection.commit()
+
+    def put(self, scorer: str, version: str, passage: str, score: Any) -> None:
+        """Stores the score of the passage
+        """
+        self.put_many(scorer, version, {passage: score})
+
+    def get_passages(self, scorer: str, limit: Optional[int] = None) -> list[str]:
+        """Returns the normalized passages that have a score from the given scorer, most recently used first
+        """
+        with self._lock:
+            connection = self._get_connection()
+            rows = connection.execute('SELECT DISTINCT passage FROM memo WHERE scorer = ? ORDER BY last_used DESC '
+                                      'LIMIT ?', (scorer, -1 if limit is None else limit)).fetchall()
+        return [row[0] for row in rows]
+
+    def get_stats(self) -> dict[str, float]:
+        """Returns the hit and miss counters of the cache along with its hit rate
+        """
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups > 0 else 0.0
+        }
+
+    def close(self) -> None:
+        """Closes the connection to the SQLite file
+        """
+        with self._lock:
+            if self._connection is not None and self._pid == os.getpid():
+                self._connection.close()
+            self._connection = None
+
+
+if __name__ == '__main__':
+    import doctest
+    import python_ta
+
+    doctest.testmod(verbose=True)
+
+    python_ta.check_all(config={
+        'max-line-length': 120,
+        'extra-imports': ['__future__', 'typing', 'hashlib', 'json', 'os', 'sqlite3', 'threading', 'time'],
+        'allowed-io': [],
+        'max-nested-blocks': 10
+    })
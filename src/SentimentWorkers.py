@@ -0,0 +1,183 @@
+"""
+This Python module contains the pool of worker processes used to score articles in parallel. The sentiment models
+are loaded once in the parent process before the workers are forked, so every worker shares the parent's copy of
+the model weights (copy-on-write) instead of loading its own.
+
+Copyright and Usage Information
+===============================
+
+This file is provided solely for the personal and private use of TAs and professors
+at the University of Toronto St. George campus. All forms of
+distribution of this code, whether as given or with any changes, are
+expressly prohibited. For more information on copyright for CSC111 materials,
+please consult the Course Syllabus.
+
+This file is Copyright (c) 2023 Mark Zhang, Li Zhang and Luke Zhang
+"""
+from __future__ import annotations
+from typing import Optional
+from NewsScraper import NewsArticleContent
+import gc
+import multiprocessing
+import queue
+import sys
+import threading
+import Sentiment
+
+# the number of tasks that can wait in the queue for every worker before adding more tasks blocks
+TASKS_PER_WORKER = 2
+# the most articles sent to a worker as one task, the passages of a task's articles are batched together
+MAX_ARTICLES_PER_TASK = 4
+# the seconds waited for a result before checking that every worker is still alive
+RESULT_POLL_TIME = 1.0
+
+
+def _run_worker(tasks: multiprocessing.Queue, results: multiprocessing.Queue, max_batch_size: int,
+                llm_token_budget: Optional[int], processes: int) -> None:
+    """Scores the articles of every task taken from tasks until a None task is taken, putting the results in results
+    as (task index, list of ArticlePassageScores or the exception raised) tuples
+    """
+    if 'torch' in sys.modules:
+        # every worker gets a core, so torch's own threads would only fight over them
+        sys.modules['torch'].set_num_threads(1)
+    # every worker would otherwise send chat-gpt requests at the full rate with its own copy of the client
+    Sentiment.set_llm_processes(processes)
+    scorer = Sentiment.FinbertBatchScorer(max_batch_size)
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        index, articles = task
+        try:
+            results.put((index, Sentiment.score_articles(articles, scorer, llm_token_budget)))
+        except Exception as error:  # the parent re-raises it
+            results.put((index, error))
+
+
+class SentimentWorkerPool:
+    """This class scores articles in a pool of forked worker processes that share the parent's sentiment models.
+
+    Articles are sent to the workers in tasks through a bounded queue, so the parent never gets far ahead of the
+    workers, and the results are put back in the order the articles were given.
+
+    Instance Attributes:
+        - processes: the number of worker processes
+        - max_batch_size: the largest number of passages a worker gives to finbert at once
+        - llm_token_budget: the token budget of the coalesced chat-gpt requests, or None to not coalesce
+    Private Instance Attributes:
+        - _tasks: the bounded queue of tasks waiting for a worker
+        - _results: the queue of results sent back by the workers
+        - _workers: the worker processes
+        - _lock: a lock making sure only one batch of articles goes through the pool at once
+
+    Representation Invariants:
+        - self.processes > 0
+        - len(self._workers) == self.processes
+    """
+    processes: int
+    max_batch_size: int
+    llm_token_budget: Optional[int]
+    _tasks: multiprocessing.Queue
+    _results: multiprocessing.Queue
+    _workers: list[multiprocessing.Process]
+    _lock: threading.Lock
+
+    def __init__(self, processes: int, max_batch_size: int = Sentiment.FINBERT_MAX_BATCH_SIZE,
+                 llm_token_budget: Optional[int] = None, finbert: bool = True) -> None:
+        """Loads the sentiment models and forks the workers, finbert isn't loaded up front if finbert is False
+
+        Preconditions:
+            - processes > 0
+            - the platform supports forking processes
+        """
+        self.processes = processes
+        self.max_batch_size = max_batch_size
+        self.llm_token_budget = llm_token_budget
+        Sentiment.warm_up(finbert=finbert)
+        # move everything loaded so far out of the garbage collector's reach, otherwise collections in the workers
+        # write to the objects' headers and copy the pages holding the model weights
+        gc.collect()
+        gc.freeze()
+        context = multiprocessing.get_context('fork')
+        self._tasks = context.Queue(maxsize=processes * TASKS_PER_WORKER)
+        self._results = context.Queue()
+        self._workers = [context.Process(target=_run_worker, daemon=True,
+                                         args=(self._tasks, self._results, max_batch_size, llm_token_budget,
+                                               processes))
+                         for _ in range(processes)]
+        for worker in self._workers:
+            worker.start()
+        self._lock = threading.Lock()
+
+    def map_articles(self, articles: list[NewsArticleContent]) -> list[Sentiment.ArticlePassageScores]:
+        """Returns the scores of the passages of every article in articles, in the same order
+
+        Raises a RuntimeError if a worker died while the articles were being scored, since its tasks would never
+        be finished. The pool can't be used after that and only needs to be closed.
+        """
+        if len(articles) == 0:
+            return []
+        # split the articles evenly between the workers, in tasks of at most MAX_ARTICLES_PER_TASK articles
+        task_size = max(1, min(MAX_ARTICLES_PER_TASK, -(-len(articles) // self.processes)))
+        tasks = [articles[start:start + task_size] for start in range(0, len(articles), task_size)]
+        with self._lock:
+            # the tasks are added from another thread since adding blocks while the queue is full
+            feeder = threading.Thread(target=self._feed_tasks, args=(tasks,), daemon=True)
+            feeder.start()
+            task_results = [None] * len(tasks)
+            error = None
+            for _ in range(len(tasks)):
+                index, result = self._get_result()
+                if isinstance(result, Exception):
+                    error = result
+                task_results[index] = result
+            feeder.join()
+        if error is not None:
+            raise error
+        return [article_scores for result in task_results for article_scores in result]
+
+    def _get_result(self) -> tuple[int, list[Sentiment.ArticlePassageScores] | Exception]:
+        """Returns the next result sent back by the workers, raising a RuntimeError if a worker died before it came
+        """
+        while True:
+            try:
+                return self._results.get(timeout=RESULT_POLL_TIME)
+            except queue.Empty:
+                for worker in self._workers:
+                    if not worker.is_alive():
+                        raise RuntimeError('a sentiment worker died with exit code ' + str(worker.exitcode))
+
+    def _feed_tasks(self, tasks: list[list[NewsArticleContent]]) -> None:
+        """Adds the tasks to the bounded task queue, blocking whenever it is full"""
+        for index in range(len(tasks)):
+            self._tasks.put((index, tasks[index]))
+
+    def close(self) -> None:
+        """Stops the workers once they finish their current tasks, or right away if one of them died
+        """
+        if all(worker.is_alive() for worker in self._workers):
+            for _ in self._workers:
+                self._tasks.put(None)
+        else:
+            # the rest of the aborted batch would be scored first, so the workers are stopped without waiting
+            self._tasks.cancel_join_thread()
+            for worker in self._workers:
+                worker.terminate()
+        for worker in self._workers:
+            worker.join()
+        gc.unfreeze()
+
+
+if __name__ == '__main__':
+    import doctest
+    import python_ta
+
+    doctest.testmod(verbose=True)
+
+    python_ta.check_all(config={
+        'max-line-length': 120,
+        'extra-imports': ['__future__', 'typing', 'NewsScraper', 'gc', 'multiprocessing', 'queue', 'sys',
+                          'threading', 'Sentiment'],
+        'allowed-io': [],
+        'max-nested-blocks': 10
+    })
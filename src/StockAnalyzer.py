@@ -20,24 +20,35 @@ from typing import Optional
 from dataclasses import dataclass, field
 from CSV import read_file, write_to_file
 from StockInfo import get_info_from_ticker
-from NewsScraper import NewsArticleContent, NewsScraper, PUBLISH_RANGE, get_content_from_article_url
-from Sentiment import get_sentiment_for_article
+from NewsScraper import NewsArticleContent, NewsScraper, PUBLISH_RANGE, parse_article_html
+from Sentiment import score_articles, get_article_scorer_version, get_memo_cache, set_finbert_backend, set_cascade, \
+    get_cascade_stats, warm_up, FinbertBatchScorer, CascadeSettings, FINBERT_MAX_BATCH_SIZE, LLM_TOKEN_BUDGET, \
+    FINBERT_BACKEND
+from SentimentWorkers import SentimentWorkerPool
+from NearDuplicate import get_representatives
+from ArticleFetcher import ArticleFetcher, FetchResult, FETCH_MAX_IN_FLIGHT, FETCH_MAX_PER_HOST, FETCH_DEADLINE, \
+    FETCH_MAX_BYTES, FETCH_SNIFF_BYTES
+from HttpCache import HttpCache, HTTP_CACHE_TTL, canonicalize_url
+from ArticleStore import ArticleStore, StoredArticle
+from DomainStats import DomainStats
+from AnalysisPipeline import AnalysisPipeline, PipelineStage, PIPELINE_QUEUE_SIZE
+from FeedReader import FeedReader, FeedScraper, FEED_URLS
+from CacheJournal import CacheJournal, CachedTicker, get_journal_path
+from ColumnarCache import ColumnarCache, CACHE_HEADERS, get_columnar_path
 from StockInfo import Stock
-import time
-import ast
-import random
 import os
+import time
 
 CACHE_DIRECTORY = 'scrape_cache/'
-CACHE_HEADERS = [
-    'Ticker', 'ArticlesUrls', 'ArticlesSentimentScores', 'ConnectedTickers', 'ConnectedFrequency',
-    'LinkingArticlesUrls', 'LinkingArticlesSentimentScores', 'DoneScraping'
-]
 SEARCH_FOCUS = {
     'Competitors': ' stock competitors news',
     'Stock': ' stock news',
     'General': ' news',
 }
+# where the urls of the articles of every ticker are found, a Google news search or the feeds of the ticker
+DISCOVERY_BACKENDS = ['search', 'feed']
+# the number of seconds after the articles of a ticker were last searched for that a refresh searches for new ones
+REFRESH_AFTER = 12 * 60 * 60
 
 
 @dataclass
@@ -55,13 +66,22 @@ class StockAnalyzeData:
                                 value calculated from the article.
         - connected_tickers: a dictionary with the key as a stock's ticker and an integer representing the frequency of
                      .       that specific stock being mentioned in articles that focus specifically on the primary stock
+        - scraper: the scraper finding the urls of the stock's articles, or None if the data is only built from the
+                   cache
+        - refreshed_at: the time the articles of the stock were last searched for, or None if they never were
+        - seen_urls: the urls of the articles tried for the stock so far, whether or not they were analyzed
+        - articles_before_refresh: the number of primary articles the stock had when its refresh started, or None if
+                                   it isn't being refreshed
     """
     stock: Stock
-    scraper: NewsScraper
+    scraper: Optional[NewsScraper | FeedScraper]
     primary_articles_data: list[tuple[str, float]] = field(default_factory=list)
     linking_articles_data: list[tuple[str, float]] = field(default_factory=list)
     connected_tickers: dict[str, int] = field(default_factory=dict)
     done_scraping: bool = False
+    refreshed_at: Optional[float] = None
+    seen_urls: set[str] = field(default_factory=set)
+    articles_before_refresh: Optional[int] = None
 
 
 @dataclass
@@ -78,11 +98,69 @@ class StockAnalyzerSettings:
         - id: a string representing the cached csv file name associated with analyzation.
         - cache_root: a string representing the folder location of where the cached analyzed data should be stored.
         - output_info: a boolean representing if information should be printed to the console on the analyzation process
+        - finbert_max_batch_size: the largest number of passages finbert scores in one batch
+        - finbert_backend: the backend finbert is run with, one of FinbertBackends.FINBERT_BACKENDS
+        - cascade: the thresholds of the cascade mode, where single stock passages only go to finbert when VADER is
+                   unsure about them, or None to score every single stock passage with both VADER and finbert
+        - llm_token_budget: the most tokens a chat-gpt request coalescing many passages can use, or None to send
+                            every passage with multiple stocks in its own request
+        - fetch_max_in_flight: the largest number of articles downloaded at once
+        - fetch_max_per_host: the largest number of articles downloaded at once from the same publisher
+        - fetch_deadline: the most seconds the download of an article can take before it is abandoned
+        - fetch_max_bytes: the most bytes downloaded of an article, longer articles are cut off
+        - fetch_sniff_bytes: the number of bytes downloaded of an article without finding a <p> tag before the
+                             download is abandoned
+        - use_http_cache: a boolean representing if downloaded articles should be stored in and served from the
+                          local http cache
+        - http_cache_ttl: the number of seconds a cached article is served before it is revalidated
+        - http_cache_offline: a boolean representing if articles should only be served from the http cache, without
+                              downloading anything
+        - sentiment_workers: the number of forked worker processes scoring articles, which share the sentiment models
+                             loaded in this process, or 0 to score articles in this process
+        - discovery_backend: where the articles of every ticker are found, one of DISCOVERY_BACKENDS
+        - feed_urls: the feeds polled for every ticker when discovery_backend is 'feed', see FeedReader.FEED_URLS
+        - use_article_store: a boolean representing if the scores of articles should be stored in and taken from the
+                             article store shared by every ticker, search focus and run, so every article is only
+                             downloaded and scored once
+        - use_domain_stats: a boolean representing if statistics on how many useful articles every publisher's domain
+                            gives should be kept and used to download from the most productive domains first and to
+                            skip domains that keep giving unusable pages
+        - search_workers: the number of tickers whose articles are searched for at once
+        - fetch_workers: the number of tickers whose articles are downloaded at once, the downloads of every ticker
+                         are capped by fetch_max_in_flight and fetch_max_per_host together
+        - parse_workers: the number of tickers whose articles are parsed at once
+        - pipeline_queue_size: the number of tickers that can wait for every worker of a stage of the analysis
+        - refresh: a boolean representing if the tickers of the cache whose articles were last searched for at least
+                   refresh_after seconds ago should be refreshed: searched again for up to articles_per_ticker
+                   articles that weren't tried for them before, which are added to their cached data
+        - refresh_after: the number of seconds after the articles of a ticker were last searched for that it is
+                         refreshed
+        - offline: a boolean representing if the data should only be built from the cache, without searching,
+                   downloading or scoring anything and without writing to the cache. The scraping and sentiment
+                   libraries aren't loaded, and the tickers whose cached data is incomplete are kept in
+                   StockAnalyzer.incomplete_tickers instead of being scraped
 
     Representation Invariants:
         - self.articles_per_ticker > 0
         - any(key == self.articles_publish_range for key in PUBLISH_RANGE)
         - any(key == self.search_focus for key in SEARCH_FOCUS)
+        - self.finbert_max_batch_size > 0
+        - self.llm_token_budget is None or self.llm_token_budget > 0
+        - self.fetch_max_in_flight > 0
+        - self.fetch_max_per_host > 0
+        - self.fetch_deadline > 0
+        - self.fetch_max_bytes > 0
+        - self.fetch_sniff_bytes > 0
+        - self.http_cache_ttl >= 0
+        - self.sentiment_workers >= 0
+        - self.search_workers > 0
+        - self.fetch_workers > 0
+        - self.parse_workers > 0
+        - self.pipeline_queue_size > 0
+        - self.refresh_after >= 0
+        - not self.offline or (self.use_cache and not self.refresh)
+        - self.discovery_backend in DISCOVERY_BACKENDS
+        - self.discovery_backend != 'feed' or self.feed_urls != []
     """
 
     id: str
@@ -92,6 +170,59 @@ class StockAnalyzerSettings:
     output_info: bool = True
     articles_publish_range: str = 'Recent'
     search_focus: str = 'Stock'
+    finbert_max_batch_size: int = FINBERT_MAX_BATCH_SIZE
+    finbert_backend: str = FINBERT_BACKEND
+    cascade: Optional[CascadeSettings] = None
+    llm_token_budget: Optional[int] = LLM_TOKEN_BUDGET
+    fetch_max_in_flight: int = FETCH_MAX_IN_FLIGHT
+    fetch_max_per_host: int = FETCH_MAX_PER_HOST
+    fetch_deadline: float = FETCH_DEADLINE
+    fetch_max_bytes: int = FETCH_MAX_BYTES
+    fetch_sniff_bytes: int = FETCH_SNIFF_BYTES
+    use_http_cache: bool = True
+    http_cache_ttl: float = HTTP_CACHE_TTL
+    http_cache_offline: bool = False
+    sentiment_workers: int = 0
+    discovery_backend: str = 'search'
+    feed_urls: list[str] = field(default_factory=lambda: list(FEED_URLS))
+    use_article_store: bool = True
+    use_domain_stats: bool = True
+    search_workers: int = 2
+    fetch_workers: int = 4
+    parse_workers: int = 2
+    pipeline_queue_size: int = PIPELINE_QUEUE_SIZE
+    refresh: bool = False
+    refresh_after: float = REFRESH_AFTER
+    offline: bool = False
+
+
+@dataclass
+class TickerAnalysisJob:
+    """A dataclass representing the progress of a ticker through the stages of the analysis pipeline
+
+    Instance Attributes:
+        - ticker: the ticker analyzed
+        - should_analyze: whether the ticker needs more articles and the search for its articles worked
+        - has_analyzed: whether articles were scraped for the ticker, if so its progress is saved once it is merged
+        - urls: the scraped urls of the articles picked to fill the ticker's quota, in the order they are merged
+        - stored_articles: the articles already in the article store, by the url they were scraped under
+        - downloads: the successful downloads, in batches, every one of them is scored even if its article isn't
+                     picked
+        - contents: the parsed contents of the downloads, in the same batches
+        - articles: the articles picked, in the same order as urls, ready to be merged
+        - searched_at: the time the articles of the ticker were searched for
+        - seen_urls: the scraped urls of the articles tried for the ticker, whether or not they were picked
+    """
+    ticker: str
+    should_analyze: bool = False
+    has_analyzed: bool = False
+    urls: list[str] = field(default_factory=list)
+    stored_articles: dict[str, StoredArticle] = field(default_factory=dict)
+    downloads: list[list[FetchResult]] = field(default_factory=list)
+    contents: list[list[NewsArticleContent]] = field(default_factory=list)
+    articles: list[StoredArticle] = field(default_factory=list)
+    searched_at: float = 0.0
+    seen_urls: list[str] = field(default_factory=list)
 
 
 # helper methods
@@ -116,60 +247,95 @@ class StockAnalyzer:
 
      Instance Attributes:
         - tickers: a list of stock tickers to be analyzed by the object.
+        - incomplete_tickers: the tickers whose articles weren't all scraped when the data was last built, because
+                              the scraping failed or, in offline mode, because the cache doesn't have them all
+        - pipeline_stats: the statistics of every stage of the analysis pipeline the last time articles were
+                          analyzed, see AnalysisPipeline.get_stats
      Private Instance Attributes:
         - _settings: a StockAnalyzerSettings object that represents the settings to be used when analyzing the stocks.
         - analyze_data: a dictionary containing all the data of the stocks analyzed
+        - _finbert_scorer: the FinbertBatchScorer used to score the passages of the articles analyzed
+        - _fetcher: the ArticleFetcher downloading the articles analyzed
+        - _worker_pool: the pool of worker processes scoring articles while the data is built, or None if articles
+                        are scored in this process
+        - _feed_reader: the FeedReader polling the feeds of the tickers, or None if articles are found by searching
+        - _article_store: the ArticleStore the scores of the articles are kept in, or None if they aren't kept
+        - _domain_stats: the DomainStats of the domains articles are downloaded from, or None if they aren't kept
+        - _started_at: the time the analysis of the tickers started
+        - _cache_journal: the CacheJournal the progress of the analysis is committed to as it happens
+        - _has_analyzed: whether articles were analyzed since the cache csv was last exported
+        - _changed_tickers: the tickers whose data changed during the current analysis
     """
 
     tickers: list[str]
+    incomplete_tickers: list[str]
+    pipeline_stats: dict[str, dict[str, float]]
     _settings: StockAnalyzerSettings
+    _finbert_scorer: FinbertBatchScorer
+    _fetcher: ArticleFetcher
+    _worker_pool: Optional[SentimentWorkerPool] = None
+    _feed_reader: Optional[FeedReader] = None
+    _article_store: Optional[ArticleStore] = None
+    _domain_stats: Optional[DomainStats] = None
+    _started_at: float = 0.0
+    _cache_journal: CacheJournal
+    _has_analyzed: bool = False
+    _changed_tickers: set[str]
     analyzed_data: dict[str, StockAnalyzeData] = {}
     window: Window
 
     def _save_cache(self) -> None:
-        """Called to save the current progress of scraping to a csv file.
+        """Called to export the current progress of scraping to a csv file and its columnar file, the progress is
+        committed to the cache journal as it happens.
         """
         if self._settings.output_info:
             print("Saving To Cache")
-        row_data = []
+        cached_tickers = []
         for ticker in self.analyzed_data:
             analyze_data: StockAnalyzeData = self.analyzed_data[ticker]
-            # parse primary articles data
-            primary_articles_urls = []
-            primary_articles_sentiment_scores = []
-            for primary_data in analyze_data.primary_articles_data:
-                url = primary_data[0]
-                score = primary_data[1]
-                primary_articles_urls += [url]
-                primary_articles_sentiment_scores += [score]
-            # parse linking articles data
-            linking_articles_urls = []
-            linking_articles_sentiment_scores = []
-            for linking_data in analyze_data.linking_articles_data:
-                url = linking_data[0]
-                score = linking_data[1]
-                linking_articles_urls += [url]
-                linking_articles_sentiment_scores += [score]
-            # parse connected tickers
-            connected_tickers = []
-            connected_frequencies = []
-
-            for ticker_name in analyze_data.connected_tickers:
-                frequency = analyze_data.connected_tickers[ticker_name]
-                connected_tickers += [ticker_name]
-                connected_frequencies += [frequency]
-            # add the data to rows
-            row_data += [{
-                'Ticker': ticker,
-                'ArticlesUrls': str(primary_articles_urls),
-                'ArticlesSentimentScores': str(primary_articles_sentiment_scores),
-                'ConnectedTickers': str(connected_tickers),
-                'ConnectedFrequency': str(connected_frequencies),
-                'LinkingArticlesUrls': str(linking_articles_urls),
-                'LinkingArticlesSentimentScores': str(linking_articles_sentiment_scores),
-                'DoneScraping': str(analyze_data.done_scraping)
-            }]
-        write_to_file(CACHE_DIRECTORY + self._settings.id, CACHE_HEADERS, row_data)
+            cached_tickers += [CachedTicker(ticker, analyze_data.primary_articles_data,
+                                            analyze_data.linking_articles_data, analyze_data.connected_tickers,
+                                            analyze_data.done_scraping)]
+        columns = ColumnarCache.from_cached_tickers(cached_tickers)
+        # replace the csv only once it is fully written, a half written csv would look like it was changed outside of
+        # the analyzer and replace the journal
+        write_to_file(self._get_cache_path() + '.tmp', CACHE_HEADERS, columns.get_rows())
+        os.replace(self._get_cache_path() + '.tmp', self._get_cache_path())
+        self._cache_journal.mark_exported(self._get_cache_path())
+        columns.write(get_columnar_path(self._get_cache_path()), self._get_cache_path())
+
+    def _get_cache_path(self) -> str:
+        """Returns the location of the cache csv"""
+        return self._settings.cache_root + self._settings.id
+
+    def _load_cache(self) -> list[CachedTicker]:
+        """Returns the progress of every ticker in the cache, from the cache journal if the last analysis stopped
+        before exporting its progress and otherwise from the columnar file of the cache csv, which is converted from
+        the csv first if it is missing or out of date. The journal is preferred whenever it has unexported progress,
+        whatever happened to the csv, since the csv can only hold older progress
+        """
+        cache_path = self._get_cache_path()
+        # in offline mode nothing is written to the cache, not even an empty journal
+        offline = self._settings.offline
+        has_journal = not offline or os.path.exists(self._cache_journal.path)
+        is_exported = has_journal and self._cache_journal.is_exported(cache_path)
+        if has_journal and self._cache_journal.has_unexported_records():
+            # the progress of the last analysis is exported once the data is built
+            self._has_analyzed = not offline
+            return list(self._cache_journal.load().values())
+        columns = ColumnarCache.load(get_columnar_path(cache_path), cache_path)
+        if columns is None:
+            if self._settings.output_info:
+                print("Converting Cache To Columns")
+            columns = ColumnarCache.from_rows(read_file(cache_path))
+            if not offline:
+                columns.write(get_columnar_path(cache_path), cache_path)
+        cached_tickers = columns.get_cached_tickers()
+        columns.close()
+        if not is_exported and not offline:
+            # the csv is new or was changed outside of the analyzer
+            self._cache_journal.reset(cached_tickers, cache_path)
+        return cached_tickers
 
     #@check_contracts
     def remove_linking_article_by_url(self, ticker: str, url: str) -> None:
@@ -199,140 +365,450 @@ class StockAnalyzer:
 
         return False
 
-    #@check_contracts
-    def _analyze_stock(self, ticker: str) -> None:
+    def _get_needed_articles(self, ticker: str) -> int:
+        """Returns the number of primary articles the ticker still needs to fill its quota, the quota of a ticker
+        being refreshed is articles_per_ticker articles on top of the ones it had"""
         stock_analyze_data = self.analyzed_data[ticker]
-        has_analyzed = False
-        if len(stock_analyze_data.primary_articles_data) < self._settings.articles_per_ticker and \
+        return self._settings.articles_per_ticker + (stock_analyze_data.articles_before_refresh or 0) - \
+            len(stock_analyze_data.primary_articles_data)
+
+    def _search_stage(self, job: TickerAnalysisJob) -> TickerAnalysisJob:
+        """The first stage of the analysis pipeline, scrapes the urls of the ticker's articles if it needs more"""
+        stock_analyze_data = self.analyzed_data[job.ticker]
+        job.searched_at = time.time()
+        if self._get_needed_articles(job.ticker) > 0 and \
                 not stock_analyze_data.done_scraping and stock_analyze_data.scraper.scrape_articles():
             if self._settings.output_info:
-                print("Start Analyzing " + ticker)
-            for url in stock_analyze_data.scraper.articles_scraped:
-                if len(stock_analyze_data.primary_articles_data) >= self._settings.articles_per_ticker:
-                    break
-                # sleep for a bit to not get rate limited
-                time.sleep(random.uniform(0.1, 0.25))
-                has_analyzed = True
-                if not self.has_analyzed_primary_article_url(ticker, url):
-                    print(url)
-                    news_article_content = get_content_from_article_url(url)
-                    if news_article_content:
-                        if self._settings.output_info:
-                            print("[" + ticker + "] scraping: " + url)
-                        article_sentiment_data = get_sentiment_for_article(stock_analyze_data.stock,
-                                                                           news_article_content)
-                        if self._settings.output_info:
-                            print(article_sentiment_data)
-                        # update analyze data
-                        stock_analyze_data.primary_articles_data += [(url, article_sentiment_data.main_sentiment_score)]
-                        # update connected tickers through the linked company sentiment scores
-                        for connected_ticker in article_sentiment_data.other_sentiment_scores:
-                            # the ticker is not in the analyze data's connected tickers
-                            if connected_ticker not in stock_analyze_data.connected_tickers:
-                                stock_analyze_data.connected_tickers[connected_ticker] = 0
-                            stock_analyze_data.connected_tickers[connected_ticker] += 1
-                            # update linked tickers that were mentioned in the article
-                            if connected_ticker in self.analyzed_data:
-                                # if the connected ticker is being analyzed
-                                connected_stock_analyze_data = self.analyzed_data[connected_ticker]
-                                if not self.has_analyzed_linking_article_url(connected_ticker, url):
-                                    # the article hasn't been linked yet so link it
-                                    connected_stock_sentiment_score = \
-                                        article_sentiment_data.other_sentiment_scores[connected_ticker]
-                                    connected_stock_analyze_data.linking_articles_data += \
-                                        [(url, connected_stock_sentiment_score)]
-
-            # remove edge connected companies
-            # get total frequencies
-            total_connected_frequencies = 0
-            for connected_ticker in stock_analyze_data.connected_tickers:
-                total_connected_frequencies += stock_analyze_data.connected_tickers[connected_ticker]
-            # compare connection frequency to see if it's frequent enough
-            for connected_ticker in stock_analyze_data.connected_tickers:
-                connected_frequency = stock_analyze_data.connected_tickers[connected_ticker]
-                if total_connected_frequencies != 0 and connected_frequency / total_connected_frequencies <= 0.1:
+                print("Start Analyzing " + job.ticker)
+            job.should_analyze = True
+            job.has_analyzed = len(stock_analyze_data.scraper.articles_scraped) > 0
+        return job
+
+    def _fetch_stage(self, job: TickerAnalysisJob) -> TickerAnalysisJob:
+        """The second stage of the analysis pipeline, picks the scraped articles of the ticker that haven't been
+        analyzed yet until there are enough to fill its quota of primary articles. Articles in the article store are
+        taken from it first, the rest are downloaded from the domains that gave the most useful articles so far first.
+        The articles picked only depend on the order their urls were scraped, the article store and domain statistics
+        as they were when the analysis started, never on the order the downloads of any ticker finish in
+        """
+        if not job.should_analyze:
+            return job
+        ticker = job.ticker
+        stock_analyze_data = self.analyzed_data[ticker]
+        urls = [url for url in stock_analyze_data.scraper.articles_scraped
+                if not self.has_analyzed_primary_article_url(ticker, url)]
+        if stock_analyze_data.articles_before_refresh is not None:
+            # a refresh only tries articles that are new to the ticker
+            urls = [url for url in urls if url not in stock_analyze_data.seen_urls]
+        if self._article_store is not None:
+            for url in urls:
+                # only articles stored before the analysis started, the score stage takes the ones stored since then
+                stored_article = self._article_store.get(url, self._started_at)
+                if stored_article is not None:
+                    job.stored_articles[url] = stored_article
+        urls_to_download = [url for url in urls if url not in job.stored_articles]
+        if self._domain_stats is not None:
+            urls_to_download = self._domain_stats.rank_urls(urls_to_download)
+        # stored articles cost nothing so they go first
+        urls = [url for url in urls if url in job.stored_articles] + urls_to_download
+        article_urls = set()
+        position = 0
+        needed = self._get_needed_articles(ticker)
+        while len(job.urls) < needed and position < len(urls):
+            # get just enough urls to fill the quota if every download works, then more if some don't
+            batch = urls[position:position + needed - len(job.urls)]
+            position += len(batch)
+            job.seen_urls += batch
+            results = {}
+            for result in self._fetcher.fetch_many([url for url in batch if url not in job.stored_articles]):
+                results[result.url] = result
+                if result.content is not None:
                     if self._settings.output_info:
-                        print("removing " + connected_ticker)
-                    # connected stock's weighting is too low so just set it as 0
-                    stock_analyze_data.connected_tickers[connected_ticker] = 0
-                    for primary_article in stock_analyze_data.primary_articles_data:
-                        # remove the associated article
-                        self.remove_linking_article_by_url(connected_ticker, primary_article[0])
+                        print("[" + ticker + "] scraping: " + result.url)
+                else:
+                    self._record_download(ticker, result, None)
+                    if self._settings.output_info:
+                        print("[" + ticker + "] failed to download: " + result.url + " (" + str(result.error) + ")")
+            # every article downloaded is scored, in the order of the batch
+            job.downloads += [[results[url] for url in batch if url in results and results[url].content is not None]]
+            for url in batch:
+                if url in job.stored_articles:
+                    article_url = job.stored_articles[url].url
+                elif url in results and results[url].content is not None:
+                    article_url = canonicalize_url(results[url].final_url or url)
+                else:
+                    continue
+                # the same article can be scraped under several urls
+                if article_url not in article_urls and not self.has_analyzed_primary_article_url(ticker, article_url):
+                    article_urls.add(article_url)
+                    job.urls += [url]
+        return job
+
+    def _parse_stage(self, job: TickerAnalysisJob) -> TickerAnalysisJob:
+        """The third stage of the analysis pipeline, parses the content of the articles downloaded"""
+        job.contents = [[parse_article_html(result.content) for result in batch] for batch in job.downloads]
+        return job
+
+    def _score_stage(self, job: TickerAnalysisJob) -> TickerAnalysisJob:
+        """The last stage of the analysis pipeline, scores the articles downloaded, adding them to the article store,
+        and gives the articles picked. The tickers are scored in order, so the articles every ticker takes from the
+        ones stored by the tickers before it are the same every run"""
+        if not job.should_analyze:
+            return job
+        downloaded = self._score_articles(job.ticker, job.downloads, job.contents)
+        for batch in job.downloads:
+            for result in batch:
+                self._record_download(job.ticker, result, downloaded[result.url])
+        job.articles = [job.stored_articles[url] if url in job.stored_articles else downloaded[url]
+                        for url in job.urls]
+        return job
+
+    def _record_download(self, ticker: str, result: FetchResult, article: Optional[StoredArticle]) -> None:
+        """Adds the download of an article of the ticker to the domain statistics, article is None if the download
+        failed. Pages served from the http cache and downloads that never reached the publisher aren't counted
+        """
+        if self._domain_stats is None or result.from_cache or result.error in ('offline', 'rate-limited'):
+            return
+        useful_sentences = len(article.scores.passage_scores) if article is not None else 0
+        success = useful_sentences > 0 and article.scores.get_sentiment_data(ticker).main_sentiment_score != 0
+        self._domain_stats.record(result.url, result.elapsed, result.bytes_read, useful_sentences, success)
+
+    def _get_stored_article(self, result: FetchResult) -> Optional[StoredArticle]:
+        """Returns the article of the download in the article store, or None if it isn't stored"""
+        if self._article_store is None:
+            return None
+        stored_article = self._article_store.get(result.url)
+        if stored_article is None and result.final_url is not None:
+            stored_article = self._article_store.get(result.final_url)
+        return stored_article
+
+    def _score_articles(self, ticker: str, downloads: list[list[FetchResult]],
+                        contents: list[list[NewsArticleContent]]) -> dict[str, StoredArticle]:
+        """Scores the downloaded articles, given in batches along with their contents, adding them to the article
+        store. Returns the articles by the url they were downloaded under
+        """
+        results, representatives, articles = [], [], {}
+        for batch, batch_contents in zip(downloads, contents):
+            batch_results = []
+            for result, content in zip(batch, batch_contents):
+                # a ticker scored before this one may have stored the article since it was downloaded
+                stored_article = self._get_stored_article(result)
+                if stored_article is not None:
+                    articles[result.url] = stored_article
+                else:
+                    batch_results += [(result, content)]
+            # near duplicate articles (ie. syndicated or templated ones) of the same batch are only scored once, every
+            # article of a cluster is given the scores of its representative
+            batch_representatives = get_representatives([content for _, content in batch_results])
+            representatives += [len(results) + i for i in batch_representatives]
+            results += batch_results
+        unique_indices = sorted(set(representatives))
+        unique_contents = [results[i][1] for i in unique_indices]
+        if unique_contents == []:
+            unique_scores = []
+        elif self._worker_pool is not None:
+            unique_scores = self._worker_pool.map_articles(unique_contents)
+        else:
+            unique_scores = score_articles(unique_contents, self._finbert_scorer, self._settings.llm_token_budget)
+        scores_by_index = dict(zip(unique_indices, unique_scores))
+        if self._settings.output_info and len(unique_indices) < len(results):
+            print("[" + ticker + "] skipped scoring " + str(len(results) - len(unique_indices)) +
+                  " near duplicate articles")
+        for i in range(len(results)):
+            result, content = results[i]
+            if self._article_store is not None:
+                articles[result.url] = self._article_store.put(result.url, content.title,
+                                                               scores_by_index[representatives[i]], result.final_url)
+            else:
+                articles[result.url] = StoredArticle(canonicalize_url(result.final_url or result.url), content.title,
+                                                     scores_by_index[representatives[i]])
+        return articles
+
+    #@check_contracts
+    def _merge_analysis(self, job: TickerAnalysisJob) -> None:
+        """Merges the articles of a ticker that went through the analysis pipeline into the analyzed data, in the order
+        the tickers are analyzed, committing the progress to the cache journal"""
+        if not job.should_analyze:
+            return
+        ticker = job.ticker
+        stock_analyze_data = self.analyzed_data[ticker]
+        stock_analyze_data.refreshed_at = job.searched_at
+        stock_analyze_data.seen_urls.update(job.seen_urls)
+        self._cache_journal.record_refresh(ticker, job.searched_at, job.seen_urls)
+        self._changed_tickers.add(ticker)
+        for article in job.articles:
+            url = article.url
+            # the stored scores don't depend on the stock, give the sentiment data of the article for this one
+            article_sentiment_data = article.scores.get_sentiment_data(ticker)
             if self._settings.output_info:
-                print("Finished Analyzing " + ticker)
-                print(stock_analyze_data)
-            stock_analyze_data.done_scraping = True
-            if has_analyzed:
-                # if we analyzed articles and didn't rely entire only cached data
-                self._save_cache()
+                print(article_sentiment_data)
+            # update analyze data
+            stock_analyze_data.primary_articles_data += [(url, article_sentiment_data.main_sentiment_score)]
+            linking_articles = []
+            # update connected tickers through the linked company sentiment scores
+            for connected_ticker in article_sentiment_data.other_sentiment_scores:
+                # the ticker is not in the analyze data's connected tickers
+                if connected_ticker not in stock_analyze_data.connected_tickers:
+                    stock_analyze_data.connected_tickers[connected_ticker] = 0
+                stock_analyze_data.connected_tickers[connected_ticker] += 1
+                # update linked tickers that were mentioned in the article
+                if connected_ticker in self.analyzed_data:
+                    # if the connected ticker is being analyzed
+                    connected_stock_analyze_data = self.analyzed_data[connected_ticker]
+                    if not self.has_analyzed_linking_article_url(connected_ticker, url):
+                        # the article hasn't been linked yet so link it
+                        connected_stock_sentiment_score = \
+                            article_sentiment_data.other_sentiment_scores[connected_ticker]
+                        connected_stock_analyze_data.linking_articles_data += \
+                            [(url, connected_stock_sentiment_score)]
+                        linking_articles += [(connected_ticker, url, connected_stock_sentiment_score)]
+                        self._changed_tickers.add(connected_ticker)
+            # commit the article on its own so a crash loses at most this one
+            self._cache_journal.record_article(ticker, url, article_sentiment_data.main_sentiment_score,
+                                               {connected_ticker: stock_analyze_data.connected_tickers[connected_ticker]
+                                                for connected_ticker in article_sentiment_data.other_sentiment_scores},
+                                               linking_articles)
+        if isinstance(stock_analyze_data.scraper, FeedScraper):
+            # the feed items are only remembered as seen once their articles are committed to the journal
+            stock_analyze_data.scraper.commit(job.seen_urls)
+
+        # remove edge connected companies
+        # get total frequencies
+        total_connected_frequencies = 0
+        for connected_ticker in stock_analyze_data.connected_tickers:
+            total_connected_frequencies += stock_analyze_data.connected_tickers[connected_ticker]
+        # compare connection frequency to see if it's frequent enough
+        removed_connected_tickers, removed_linking_articles = {}, []
+        for connected_ticker in stock_analyze_data.connected_tickers:
+            connected_frequency = stock_analyze_data.connected_tickers[connected_ticker]
+            if total_connected_frequencies != 0 and connected_frequency / total_connected_frequencies <= 0.1:
+                if self._settings.output_info:
+                    print("removing " + connected_ticker)
+                # connected stock's weighting is too low so just set it as 0
+                stock_analyze_data.connected_tickers[connected_ticker] = 0
+                removed_connected_tickers[connected_ticker] = 0
+                for primary_article in stock_analyze_data.primary_articles_data:
+                    # remove the associated article
+                    self.remove_linking_article_by_url(connected_ticker, primary_article[0])
+                    removed_linking_articles += [(connected_ticker, primary_article[0])]
+                if connected_ticker in self.analyzed_data:
+                    self._changed_tickers.add(connected_ticker)
+        if self._settings.output_info:
+            print("Finished Analyzing " + ticker)
+            print(stock_analyze_data)
+        stock_analyze_data.done_scraping = True
+        self._cache_journal.record_ticker(ticker, removed_connected_tickers, removed_linking_articles, True)
+        if job.has_analyzed:
+            # if we analyzed articles and didn't rely entire only cached data, the cache csv is exported once the
+            # data is built
+            self._has_analyzed = True
+
     #@check_contracts
     def _build_data(self) -> None:
         """This private function is responsible for scraping news articles and building up data for the
         sentiment values associated with a stock """
         if self._settings.output_info:
             print("Starting Analyzation...")
+        cached_tickers = set()
+        # in offline mode the journal is only read, its tables aren't created and its log isn't checkpointed
+        self._cache_journal = CacheJournal(get_journal_path(self._get_cache_path()), read_only=self._settings.offline)
         if self._settings.use_cache:
             if self._settings.output_info:
                 print("Loading Scrape Data From Cache")
-            # load cached data if it exists
-            cached_data = read_file(CACHE_DIRECTORY + self._settings.id)
-            # load the cached data into local variables
-            for row in cached_data:
-                # get all row data
-                if row != {}:
-                    ticker = row['Ticker']
-                    if ticker in self.analyzed_data:
-                        stock_analyze_data = self.analyzed_data[ticker]
-                        if stock_analyze_data:
-                            # the stock analyze data exists for the ticker
-                            if self._settings.output_info:
-                                print("Loading Cached Data For: " + ticker)
-                            print(row['ArticlesUrls'])
-
-                            primary_articles_analyzed = ast.literal_eval(row['ArticlesUrls'])
-                            primary_articles_sentiment_scores = ast.literal_eval(row['ArticlesSentimentScores'])
-                            connected_companies = ast.literal_eval(row['ConnectedTickers'])
-                            connected_frequencies = ast.literal_eval(row['ConnectedFrequency'])
-                            linking_articles_analyzed = ast.literal_eval(row['LinkingArticlesUrls'])
-                            linking_articles_sentiment_scores = ast.literal_eval(row['LinkingArticlesSentimentScores'])
-                            done_scraping = row['DoneScraping'] == 'TRUE'
-                            # load in primary articles data
-                            for i in range(len(primary_articles_analyzed)):
-                                article_link = primary_articles_analyzed[i]
-                                article_sentiment = primary_articles_sentiment_scores[i]
-                                stock_analyze_data.primary_articles_data += [(article_link, article_sentiment)]
-                            # load in linking articles data
-                            for i in range(len(linking_articles_analyzed)):
-                                article_link = linking_articles_analyzed[i]
-                                article_sentiment = linking_articles_sentiment_scores[i]
-                                stock_analyze_data.linking_articles_data += [(article_link, article_sentiment)]
-                            # load in connected stocks
-                            for i in range(len(connected_companies)):
-                                ticker, frequency = connected_companies[i], connected_frequencies[i]
-                                stock_analyze_data.connected_tickers[ticker] = frequency
-                            # update scraper
-                            stock_analyze_data.scraper.articles_scraped = primary_articles_analyzed
-                            stock_analyze_data.done_scraping = done_scraping
+            cached_data = {cached_ticker.ticker: cached_ticker for cached_ticker in self._load_cache()}
+            for ticker in cached_data:
+                if ticker in self.analyzed_data:
+                    # the stock analyze data exists for the ticker
+                    stock_analyze_data = self.analyzed_data[ticker]
+                    cached_ticker = cached_data[ticker]
+                    cached_tickers.add(ticker)
+                    if self._settings.output_info:
+                        print("Loading Cached Data For: " + ticker)
+                    stock_analyze_data.primary_articles_data += cached_ticker.primary_articles_data
+                    stock_analyze_data.linking_articles_data += cached_ticker.linking_articles_data
+                    stock_analyze_data.connected_tickers.update(cached_ticker.connected_tickers)
+                    # update scraper
+                    if stock_analyze_data.scraper is not None:
+                        stock_analyze_data.scraper.articles_scraped = [url for url, _ in
+                                                                       cached_ticker.primary_articles_data]
+                    stock_analyze_data.done_scraping = cached_ticker.done_scraping
+            if not self._settings.offline:
+                refreshes, seen_urls = self._cache_journal.load_refreshes()
+                for ticker in cached_tickers:
+                    self.analyzed_data[ticker].refreshed_at = refreshes.get(ticker)
+                    self.analyzed_data[ticker].seen_urls = seen_urls.get(ticker, set())
+        else:
+            # start over, the csv is overwritten once there is progress to export
+            self._cache_journal.reset([], self._get_cache_path())
+            self._cache_journal.forget_refreshes()
+        if self._feed_reader is not None:
+            # feed items seen by earlier runs are only skipped for tickers whose analysis they were cached with
+            for ticker in self.analyzed_data:
+                if ticker not in cached_tickers:
+                    self._feed_reader.forget(self.analyzed_data[ticker].scraper.consumer)
+        if self._settings.offline:
+            self._cache_journal.close()
+        else:
+            if self._settings.refresh:
+                self._start_refresh()
+            self._analyze_tickers()
+        self.incomplete_tickers = [ticker for ticker in self.analyzed_data
+                                   if not self.analyzed_data[ticker].done_scraping]
+        if self._settings.output_info and self.incomplete_tickers != []:
+            print("Incomplete Tickers: " + str(self.incomplete_tickers))
+
+    def _start_refresh(self) -> None:
+        """Marks every ticker whose articles were last searched for at least refresh_after seconds ago, or never
+        were, to be searched again for articles it hasn't tried yet"""
+        now = time.time()
+        for stock_analyze_data in self.analyzed_data.values():
+            if stock_analyze_data.refreshed_at is None or \
+                    now - stock_analyze_data.refreshed_at >= self._settings.refresh_after:
+                stock_analyze_data.done_scraping = False
+                stock_analyze_data.articles_before_refresh = len(stock_analyze_data.primary_articles_data)
+                # scrape new results instead of counting the articles already tried towards the quota
+                stock_analyze_data.scraper.articles_scraped = []
+                stock_analyze_data.scraper.skipped_urls = set(stock_analyze_data.seen_urls)
+            else:
+                stock_analyze_data.articles_before_refresh = None
+        if self._settings.output_info:
+            stale = [ticker for ticker in self.analyzed_data
+                     if self.analyzed_data[ticker].articles_before_refresh is not None]
+            print("Refreshing " + str(len(stale)) + " Of " + str(len(self.analyzed_data)) + " Tickers")
+
+    def _analyze_tickers(self) -> set[str]:
+        """Scrapes and analyzes the articles of every ticker that needs more, returning the tickers whose data changed
+        """
+        self._changed_tickers = set()
         # scrape for data if required
         if self._settings.output_info:
             print("Starting Web Scrape")
-        # begin analysis
+        if any(not stock_analyze_data.done_scraping for stock_analyze_data in self.analyzed_data.values()):
+            # articles are going to be scored so load the sentiment models up front, in cascade mode finbert is only
+            # loaded if a passage needs it
+            if self._settings.sentiment_workers > 0:
+                # the models are loaded before the workers are forked so they all share them
+                self._worker_pool = SentimentWorkerPool(self._settings.sentiment_workers,
+                                                        self._settings.finbert_max_batch_size,
+                                                        self._settings.llm_token_budget,
+                                                        finbert=self._settings.cascade is None)
+            else:
+                warm_up(finbert=self._settings.cascade is None)
+        # begin analysis, the tickers go through the stages at the same time but are scored and merged in order
+        self._started_at = time.time()
+        if self._domain_stats is not None:
+            self._domain_stats.reset_ranking()
+        pipeline = AnalysisPipeline([
+            PipelineStage('search', self._search_stage, self._settings.search_workers),
+            PipelineStage('fetch', self._fetch_stage, self._settings.fetch_workers),
+            PipelineStage('parse', self._parse_stage, self._settings.parse_workers),
+            PipelineStage('score', self._score_stage, ordered=True)
+        ], self._settings.pipeline_queue_size)
         progress = 0
         total_progress = len(self.analyzed_data)
-        for ticker in self.analyzed_data:
-            self._analyze_stock(ticker)
-            progress += 1
-            if self._settings.output_info:
-                print("============================")
-                print("PROGRESS [" + str(progress/total_progress * 100) + '%' + ']')
-                print("============================")
+        try:
+            for job in pipeline.run([TickerAnalysisJob(ticker) for ticker in self.analyzed_data]):
+                self._merge_analysis(job)
+                progress += 1
+                if self._settings.output_info:
+                    print("============================")
+                    print("PROGRESS [" + str(progress/total_progress * 100) + '%' + ']')
+                    print("PIPELINE " + str(pipeline.get_stats()))
+                    print("============================")
+        finally:
+            self.pipeline_stats = pipeline.get_stats()
+            if self._worker_pool is not None:
+                self._worker_pool.close()
+                self._worker_pool = None
+            if self._has_analyzed:
+                self._save_cache()
+                self._has_analyzed = False
+            self._cache_journal.close()
 
         if self._settings.output_info:
             print("!==============!")
             print("DATA BUILD COMPLETE")
             print("!==============!")
+            print("Article Downloads: " + str(self._fetcher.stats.get_stats()))
+            print("Rate Limited Hosts: " + str(self._fetcher.rate_limiter.get_state(throttled_only=True)))
+            if self._fetcher.http_cache is not None:
+                print("HTTP Cache: " + str(self._fetcher.http_cache.get_stats()))
+            if get_memo_cache() is not None:
+                print("Sentiment Memo Cache: " + str(get_memo_cache().get_stats()))
+            if self._feed_reader is not None:
+                print("Feeds: " + str(self._feed_reader.get_stats()))
+            if self._article_store is not None:
+                print("Article Store: " + str(self._article_store.get_stats()))
+            if self._domain_stats is not None:
+                print("Domain Stats: " + str(self._domain_stats.get_stats()))
+            if self._settings.cascade is not None and self._settings.sentiment_workers == 0:
+                # the workers keep their own cascade counters
+                print("Sentiment Cascade: " + str(get_cascade_stats()))
+        return self._changed_tickers
+
+    def refresh(self) -> set[str]:
+        """Searches every ticker whose articles were last searched for at least refresh_after seconds ago for new
+        articles, adds them to its data and updates the sentiment of every ticker whose data changed. Returns the
+        tickers whose data changed, see StockGraphAnalyzer.refresh_nodes
 
-
+        Preconditions:
+            - not self._settings.offline
+        """
+        self._start_refresh()
+        changed_tickers = self._analyze_tickers()
+        self.incomplete_tickers = [ticker for ticker in self.analyzed_data
+                                   if not self.analyzed_data[ticker].done_scraping]
+        for ticker in changed_tickers:
+            self._update_sentiment(ticker)
+        return changed_tickers
+
+    def _update_sentiment(self, ticker: str) -> None:
+        """Calculates the sentiment of the ticker's stock from the articles analyzed for it"""
+        analyze_data = self.analyzed_data[ticker]
+        # calculate sentiment values
+        # calculate the sentiment from primary articles
+        primary_sentiment, linking_sentiment = 0, 0
+        if len(analyze_data.primary_articles_data) > 0:
+            # get median of sentiment data to avoid heavy influences from outliers.
+            # also, since the data size is relatively small, median is the better choice in this case
+            primary_sentiment = _get_median_sentiment_score(analyze_data.primary_articles_data)
+        # calculate the sentiment from secondary articles
+        if len(analyze_data.linking_articles_data) > 0:
+            # ignore sentiment values of exactly 0 as it dilutes the overall sentiment
+            linking_sentiment = _get_median_sentiment_score(analyze_data.linking_articles_data)
+        # get sentiment value from combining linking sentiment and primary sentiment
+        analyze_data.stock.sentiment = (primary_sentiment + linking_sentiment) / 2
+
+    def _set_up_analysis(self) -> None:
+        """Sets up the scoring, downloading and storing of the articles analyzed"""
+        set_finbert_backend(self._settings.finbert_backend)
+        set_cascade(self._settings.cascade)
+        self._finbert_scorer = FinbertBatchScorer(self._settings.finbert_max_batch_size)
+        http_cache = None
+        if self._settings.use_http_cache:
+            http_cache = HttpCache(ttl=self._settings.http_cache_ttl, offline=self._settings.http_cache_offline)
+        self._fetcher = ArticleFetcher(self._settings.fetch_max_in_flight, self._settings.fetch_max_per_host,
+                                       self._settings.fetch_deadline, http_cache, self._settings.fetch_max_bytes,
+                                       self._settings.fetch_sniff_bytes)
+        if self._settings.discovery_backend == 'feed':
+            self._feed_reader = FeedReader()
+        if self._settings.use_article_store:
+            self._article_store = ArticleStore(get_article_scorer_version(self._settings.llm_token_budget))
+        if self._settings.use_domain_stats:
+            self._domain_stats = DomainStats()
+
+    def _get_scraper(self, ticker: str) -> NewsScraper | FeedScraper:
+        """Returns the scraper finding the articles of the ticker with the discovery backend of the settings"""
+        search_query = ticker + SEARCH_FOCUS[self._settings.search_focus]
+        publish_range = PUBLISH_RANGE[self._settings.articles_publish_range]
+        if self._feed_reader is not None:
+            return FeedScraper(search_query, self._settings.articles_per_ticker, publish_range, ticker,
+                               self._settings.feed_urls, self._feed_reader, consumer=self._settings.id + '/' + ticker)
+        return NewsScraper(
+            search_query=search_query,
+            number_of_articles=self._settings.articles_per_ticker,
+            publish_range=publish_range
+        )
 
     def __init__(self, tickers: list[str],
                  settings: StockAnalyzerSettings = StockAnalyzerSettings(id="Default", articles_per_ticker=5,
@@ -344,7 +820,11 @@ class StockAnalyzer:
         - all ticker in tickers exist inside the data/tickers_data.csv file
         """
         self.tickers = tickers
+        self.incomplete_tickers = []
+        self.pipeline_stats = {}
         self._settings = settings
+        if not self._settings.offline:
+            self._set_up_analysis()
 
         if self._settings.output_info:
             print("Fetching Stocks...")
@@ -362,11 +842,7 @@ class StockAnalyzer:
                         industry=stock_info['Industry'],
                         sentiment=0,
                     ),
-                    scraper=NewsScraper(
-                        search_query=stock_info['Symbol'] + SEARCH_FOCUS[self._settings.search_focus],
-                        number_of_articles=self._settings.articles_per_ticker,
-                        publish_range=PUBLISH_RANGE[self._settings.articles_publish_range]
-                    )
+                    scraper=self._get_scraper(stock_info['Symbol']) if not self._settings.offline else None
                 )
             else:
                 if self._settings.output_info:
@@ -375,20 +851,7 @@ class StockAnalyzer:
         self._build_data()
         # calculate stock attributes from scaped values
         for ticker in self.analyzed_data:
-            analyze_data = self.analyzed_data[ticker]
-            # calculate sentiment values
-            # calculate the sentiment from primary articles
-            primary_sentiment, linking_sentiment = 0, 0
-            if len(analyze_data.primary_articles_data) > 0:
-                # get median of sentiment data to avoid heavy influences from outliers.
-                # also, since the data size is relatively small, median is the better choice in this case
-                primary_sentiment = _get_median_sentiment_score(analyze_data.primary_articles_data)
-            # calculate the sentiment from secondary articles
-            if len(analyze_data.linking_articles_data) > 0:
-                # ignore sentiment values of exactly 0 as it dilutes the overall sentiment
-                linking_sentiment = _get_median_sentiment_score(analyze_data.linking_articles_data)
-            # get sentiment value from combining linking sentiment and primary sentiment
-            analyze_data.stock.sentiment = (primary_sentiment + linking_sentiment) / 2
+            self._update_sentiment(ticker)
 
 if __name__ == '__main__':
     import doctest
@@ -399,7 +862,9 @@ if __name__ == '__main__':
     python_ta.check_all(config={
         'max-line-length': 120,
         'extra-imports': ['__future__', 'typing', 'dataclasses', 'CSV', 'StockInfo', 'NewsScraper', 'Sentiment',
-                          'StockInfo', 'time', 'ast', 'random', 'os'],
+                          'SentimentWorkers', 'NearDuplicate', 'ArticleFetcher', 'HttpCache', 'FeedReader',
+                          'ArticleStore', 'DomainStats', 'AnalysisPipeline', 'CacheJournal', 'ColumnarCache',
+                          'StockInfo', 'os', 'time'],
         'allowed-io': ['NewsScraper.scrape_articles'],
         'max-nested-blocks': 10
     })
@@ -109,17 +109,14 @@ class StockGraphAnalyzer:
                     industries[ticker_stock.industry].industry_cap += new_node.market_cap
 
         # add edge to neighbouring nodes; weigh the edges based on frequency
+        # tickers that weren't analyzed, such as ones mentioned by a preset's tickers but not in it, are left out
         created_edges = set()
         for ticker in all_tickers:
-            connected = data[ticker].connected_tickers
+            connected = data[ticker].connected_tickers if ticker in data else {}
             for neighbour in connected:
-                if (ticker, neighbour) not in created_edges and (neighbour, ticker) not in created_edges:
-                    if ticker in data[neighbour].connected_tickers:
-                        other_freq = float(data[neighbour].connected_tickers[ticker])
-                    else:
-                        other_freq = 0.0
-
-                    self.graph.add_edge(ticker, neighbour, float(connected[neighbour]), other_freq)
+                if neighbour in data and (ticker, neighbour) not in created_edges and \
+                        (neighbour, ticker) not in created_edges:
+                    self._add_company_edge(ticker, neighbour)
 
         # add industry nodes
         for industry in industries:
@@ -135,11 +132,65 @@ class StockGraphAnalyzer:
                 self.graph.add_edge(industry, ticker, weight, 0.0)
 
         # store a ranking of highest sentiment to lowest
+        self._order_node_sentiment_scores()
+
+    def _add_company_edge(self, ticker: str, neighbour: str) -> None:
+        """
+        Adds the edge between the company nodes of the ticker and a ticker connected to it, weighed by how often
+        each ticker's articles mention the other
+        """
+        data = self.analyzer.analyzed_data
+        if ticker in data[neighbour].connected_tickers:
+            other_freq = float(data[neighbour].connected_tickers[ticker])
+        else:
+            other_freq = 0.0
+
+        self.graph.add_edge(ticker, neighbour, float(data[ticker].connected_tickers[neighbour]), other_freq)
+
+    def _order_node_sentiment_scores(self) -> None:
+        """
+        Stores a ranking of the nodes from highest sentiment to lowest
+        """
         all_nodes = self.graph.nodes
         self.ordered_node_sentiment_scores = \
             sorted([node for node in all_nodes], key=lambda sort_node: self.graph.nodes[sort_node].sentiment,
                    reverse=True)
 
+    def refresh_nodes(self, tickers: set[str]) -> None:
+        """
+        Updates the graph after the data of the given tickers changed, see StockAnalyzer.refresh. Only the company
+        nodes of the tickers, the edges between them and other companies and the industry nodes they fall under are
+        updated, then the preprocessed algorithms are run again
+
+        Preconditions:
+            - the graph has already been generated
+            - all(ticker in self.graph.nodes for ticker in tickers)
+        """
+        data = self.analyzer.analyzed_data
+        industries = set()
+        for ticker in tickers:
+            node = self.graph.nodes[ticker]
+            node.sentiment = data[ticker].stock.sentiment
+            industries.add(node.industry)
+            # the company edges of the ticker are added again with the frequencies as they are now
+            for edge in list(node.edges):
+                if isinstance(edge.u, CompanyNode) and isinstance(edge.v, CompanyNode):
+                    self.graph.remove_edge(edge)
+        # add the edges the same way generate_graph does, only the ones with a changed ticker on either end
+        for ticker in self.analyzer.tickers:
+            connected = data[ticker].connected_tickers if ticker in data else {}
+            for neighbour in connected:
+                if neighbour in data and (ticker in tickers or neighbour in tickers):
+                    self._add_company_edge(ticker, neighbour)
+        # the sentiment of an industry is the sentiment of its companies weighed by their market cap
+        for industry in industries:
+            industry_node = self.graph.nodes[industry]
+            companies = [neighbour for neighbour in industry_node.neighbours if isinstance(neighbour, CompanyNode)]
+            industry_node.sentiment = sum(company.sentiment * company.market_cap for company in companies) / \
+                industry_node.industry_cap
+        self._order_node_sentiment_scores()
+        self.run_preprocessed_algorithms()
+
     def get_best_neighbour(self, node: Node) -> Node | None:
         """
         Returns the best neighbouring node to the node given.
@@ -174,6 +225,7 @@ class StockGraphAnalyzer:
             - the graph has already been generated
         """
         all_nodes = set(self.graph.nodes.values())
+        self.pagerank_scores = {}
         for node in all_nodes:
             score = node.get_pr_score()
             if depth is not None:
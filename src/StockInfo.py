@@ -5,9 +5,13 @@ from python_ta.contracts import check_contracts
 from dataclasses import dataclass, field
 import csv
 from CSV import read_file
+from CompanyMatcher import CompanyMatcher
 from typing import Optional
 
 tickers = []
+# the matcher compiled from the tickers above and the tickers list it was compiled from
+_company_matcher = None
+_company_matcher_tickers = None
 
 
 @dataclass
@@ -97,6 +101,26 @@ def get_tickers() -> list[str]:
     return [stock['Symbol'] for stock in tickers]
 
 
+def load_tickers(file: str) -> None:
+    """
+    Loads the tickers csv file as the ticker universe and compiles the company matcher for it
+    """
+    global tickers
+    tickers = read_file(file)
+    get_company_matcher()
+
+
+def get_company_matcher() -> CompanyMatcher:
+    """
+    Returns the CompanyMatcher for the tickers, it is only compiled again when the tickers list is replaced
+    """
+    global _company_matcher, _company_matcher_tickers
+    if _company_matcher is None or _company_matcher_tickers is not tickers:
+        _company_matcher = CompanyMatcher(tickers)
+        _company_matcher_tickers = tickers
+    return _company_matcher
+
+
 def get_tickers_and_names() -> tuple[set, set]:
     """
     Returns tickers and names in the tickers list
@@ -116,7 +140,7 @@ if __name__ == '__main__':
 
     python_ta.check_all(config={
         'max-line-length': 120,
-        'extra-imports': ['dataclasses', 'csv', 'CSV', 'typing'],
+        'extra-imports': ['dataclasses', 'csv', 'CSV', 'CompanyMatcher', 'typing'],
         'allowed-io': [],
         'max-nested-blocks': 10
     })
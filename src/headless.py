@@ -0,0 +1,295 @@
+"""
+This Python module contains the command line entry point for running an analysis without the GUI, such as from cron
+on a server with no display. The tickers of a preset in data/presets/ go through StockAnalyzer, StockGraphAnalyzer and
+GraphVisualizer, which writes the graph without opening it. The results are written as JSON or Parquet along with a
+JSON summary of the run, and the exit status tells how the run went (see the EXIT_ constants).
+
+Usage: python headless.py tech_small.csv --focus Stock --articles 5 --parallelism 4 --output tech.json
+
+Copyright and Usage Information
+===============================
+
+This file is provided solely for the personal and private use of TAs and professors
+at the University of Toronto St. George campus. All forms of
+distribution of this code, whether as given or with any changes, are
+expressly prohibited. For more information on copyright for CSC111 materials,
+please consult the Course Syllabus.
+
+This file is Copyright (c) 2023 Mark Zhang, Li Zhang and Luke Zhang
+"""
+from __future__ import annotations
+from datetime import datetime, timezone
+from typing import Any, Callable, Optional
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import time
+import traceback
+import StockInfo
+from CSV import read_file
+from Graph import CompanyNode, IndustryNode
+from Sentiment import ensure_nltk_data
+from StockAnalyzer import StockAnalyzer, StockAnalyzerSettings, SEARCH_FOCUS
+from StockGraphAnalyzer import StockGraphAnalyzer
+
+PRESETS_ROOT = 'data/presets/'
+TICKERS_FILE = 'data/tickers_data.csv'
+OUTPUT_FORMATS = ['json', 'parquet']
+# the exit statuses, EXIT_USAGE is also what argparse exits with when the arguments are invalid
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_INCOMPLETE = 3
+EXIT_OUTPUT_FAILED = 4
+
+
+def get_argument_parser() -> argparse.ArgumentParser:
+    """Returns the parser of the command line arguments"""
+    parser = argparse.ArgumentParser(description='Runs a stock analysis without the GUI and writes its results.')
+    parser.add_argument('preset', help='the ticker preset in ' + PRESETS_ROOT + ', such as tech_small.csv')
+    parser.add_argument('--focus', default='Stock', choices=list(SEARCH_FOCUS), help='the search focus')
+    parser.add_argument('--articles', type=int, default=5, help='the number of articles analyzed per ticker')
+    parser.add_argument('--parallelism', type=int, default=2,
+                        help='the number of tickers searched, downloaded and parsed at once')
+    parser.add_argument('--sentiment-workers', type=int, default=0,
+                        help='the number of forked processes scoring articles, 0 to score them in this process')
+    parser.add_argument('--id', help='the cache csv of the analysis, by default named after the preset and focus')
+    parser.add_argument('--use-cache', action='store_true', help='continue from the cache instead of starting over')
+    parser.add_argument('--refresh', action='store_true',
+                        help='continue from the cache, searching the stale tickers for new articles')
+    parser.add_argument('--offline', action='store_true',
+                        help='only build the results from the cache, without touching the network')
+    parser.add_argument('--format', default='json', choices=OUTPUT_FORMATS, help='the format of the results')
+    parser.add_argument('--output', help='where the results are written, by default named after the cache')
+    parser.add_argument('--summary', help='where the summary of the run is written, by default next to the results')
+    parser.add_argument('--no-graph', action='store_true', help="don't write the html graph")
+    parser.add_argument('--quiet', action='store_true', help="don't print the progress of the analysis")
+    return parser
+
+
+def get_preset_tickers(preset: str) -> Optional[list[str]]:
+    """Returns the tickers of the preset in PRESETS_ROOT, the .csv extension can be left out. Returns None if there
+    is no such preset
+    """
+    for file_name in (preset, preset + '.csv'):
+        if os.path.isfile(PRESETS_ROOT + file_name):
+            return [row['Ticker'] for row in read_file(PRESETS_ROOT + file_name)]
+    return None
+
+
+def get_ticker_results(analyzer: StockAnalyzer, graph_analyzer: StockGraphAnalyzer) -> list[dict[str, Any]]:
+    """Returns the results of every ticker in the graph, one row each. The ranks count the industries too, the same
+    way GraphVisualizer ranks them
+    """
+    rows = []
+    for ticker in analyzer.tickers:
+        node = graph_analyzer.graph.nodes.get(ticker)
+        if not isinstance(node, CompanyNode):
+            continue
+        analyze_data = analyzer.analyzed_data[ticker]
+        rows.append({
+            'ticker': ticker,
+            'name': node.name,
+            'industry': node.industry,
+            'market_cap': node.market_cap,
+            'sentiment': node.sentiment,
+            'sentiment_rank': graph_analyzer.ordered_node_sentiment_scores.index(ticker) + 1,
+            'pagerank_score': graph_analyzer.pagerank_scores.get(ticker, 0.0),
+            'pagerank_rank': graph_analyzer.ordered_pagerank_scores.index(ticker) + 1
+            if ticker in graph_analyzer.pagerank_scores else None,
+            'primary_articles': len(analyze_data.primary_articles_data),
+            'linking_articles': len(analyze_data.linking_articles_data),
+            'connected_tickers': list(analyze_data.connected_tickers),
+            'connected_frequency': list(analyze_data.connected_tickers.values()),
+            'done_scraping': analyze_data.done_scraping
+        })
+    return rows
+
+
+def get_industry_results(graph_analyzer: StockGraphAnalyzer) -> list[dict[str, Any]]:
+    """Returns the results of every industry in the graph, one row each"""
+    rows = []
+    for name, node in graph_analyzer.graph.nodes.items():
+        if isinstance(node, IndustryNode):
+            rows.append({
+                'industry': name,
+                'industry_cap': node.industry_cap,
+                'sentiment': node.sentiment,
+                'companies': sorted(neighbour.get_as_key() for neighbour in node.neighbours)
+            })
+    return rows
+
+
+def write_atomically(path: str, write: Callable[[str], None]) -> None:
+    """Calls write with a temporary path next to path, then moves the file written into place so a reader never sees
+    a partly written file
+    """
+    directory = os.path.dirname(path)
+    if directory != '':
+        os.makedirs(directory, exist_ok=True)
+    write(path + '.tmp')
+    os.replace(path + '.tmp', path)
+
+
+def write_json(path: str, data: Any) -> None:
+    """Writes the data to path as JSON"""
+    def write(temporary_path: str) -> None:
+        with open(temporary_path, 'w', encoding='UTF8') as file:
+            json.dump(data, file, indent=2)
+    write_atomically(path, write)
+
+
+def write_results(path: str, output_format: str, tickers: list[dict[str, Any]],
+                  industries: list[dict[str, Any]]) -> None:
+    """Writes the results of the tickers and industries to path. A Parquet file only holds the tickers, one row each,
+    since the industries are a different table
+
+    Preconditions:
+        - output_format in OUTPUT_FORMATS
+        - output_format != 'parquet' or is_parquet_available()
+    """
+    if output_format == 'json':
+        write_json(path, {'tickers': tickers, 'industries': industries})
+    else:
+        import pandas
+        write_atomically(path, lambda temporary_path: pandas.DataFrame(tickers).to_parquet(temporary_path,
+                                                                                           index=False))
+
+
+def is_parquet_available() -> bool:
+    """Returns whether pandas and one of the Parquet engines it uses are installed"""
+    return importlib.util.find_spec('pandas') is not None and \
+        any(importlib.util.find_spec(engine) is not None for engine in ('pyarrow', 'fastparquet'))
+
+
+def run(arguments: argparse.Namespace, tickers: list[str], summary: dict[str, Any]) -> int:
+    """Runs the analysis of the tickers with the settings of the arguments and writes its results, filling in the
+    summary as it goes. Returns the exit status
+    """
+    timings = summary['timings']
+    start = time.perf_counter()
+    if not arguments.offline:
+        ensure_nltk_data()
+        timings['nltk_data'] = round(time.perf_counter() - start, 3)
+    settings = StockAnalyzerSettings(id=summary['id'], articles_per_ticker=arguments.articles,
+                                     use_cache=arguments.use_cache or arguments.refresh or arguments.offline,
+                                     output_info=not arguments.quiet, search_focus=arguments.focus,
+                                     sentiment_workers=arguments.sentiment_workers,
+                                     search_workers=arguments.parallelism, fetch_workers=arguments.parallelism,
+                                     parse_workers=arguments.parallelism, offline=arguments.offline)
+    start = time.perf_counter()
+    analyzer = StockAnalyzer(tickers, settings)
+    timings['analysis'] = round(time.perf_counter() - start, 3)
+    summary['pipeline'] = analyzer.pipeline_stats
+    summary['incomplete_tickers'] = analyzer.incomplete_tickers
+
+    start = time.perf_counter()
+    graph_analyzer = StockGraphAnalyzer(analyzer)
+    graph_analyzer.generate_graph()
+    timings['graph'] = round(time.perf_counter() - start, 3)
+    start = time.perf_counter()
+    graph_analyzer.run_preprocessed_algorithms()
+    timings['algorithms'] = round(time.perf_counter() - start, 3)
+    if arguments.refresh:
+        # the graph of the cache is only updated where the new articles changed it, instead of being built again
+        start = time.perf_counter()
+        changed_tickers = analyzer.refresh()
+        graph_analyzer.refresh_nodes(changed_tickers)
+        timings['refresh'] = round(time.perf_counter() - start, 3)
+        summary['pipeline'] = analyzer.pipeline_stats
+        summary['incomplete_tickers'] = analyzer.incomplete_tickers
+        summary['refreshed_tickers'] = sorted(changed_tickers)
+    if not arguments.no_graph:
+        # pyvis is only needed for the graph
+        from GraphVisualizer import GraphVisualizer, GRAPHS_STORAGE
+        start = time.perf_counter()
+        # writes the graph without opening it, see GraphVisualizer.show_graph
+        GraphVisualizer(settings.id, graph_analyzer)
+        timings['visualization'] = round(time.perf_counter() - start, 3)
+        summary['graph'] = os.path.abspath('.' + GRAPHS_STORAGE + settings.id + '_graph.html')
+
+    start = time.perf_counter()
+    try:
+        write_results(summary['output'], arguments.format, get_ticker_results(analyzer, graph_analyzer),
+                      get_industry_results(graph_analyzer))
+    except (OSError, ValueError, ImportError) as error:
+        summary['error'] = 'could not write the results: ' + repr(error)
+        return EXIT_OUTPUT_FAILED
+    timings['output'] = round(time.perf_counter() - start, 3)
+    return EXIT_INCOMPLETE if analyzer.incomplete_tickers != [] else EXIT_OK
+
+
+def main(argv: list[str]) -> int:
+    """Runs the analysis described by the command line arguments, see get_argument_parser. Returns the exit status:
+    EXIT_OK if every ticker was analyzed, EXIT_INCOMPLETE if the results were written but some tickers' articles
+    weren't all scraped, EXIT_FAILED if the analysis raised an error and EXIT_OUTPUT_FAILED if the results or summary
+    couldn't be written. Exits with EXIT_USAGE if the arguments are invalid
+    """
+    parser = get_argument_parser()
+    arguments = parser.parse_args(argv)
+    if arguments.articles <= 0:
+        parser.error('--articles must be positive')
+    if arguments.parallelism <= 0:
+        parser.error('--parallelism must be positive')
+    if arguments.sentiment_workers < 0:
+        parser.error('--sentiment-workers must not be negative')
+    if arguments.offline and arguments.refresh:
+        parser.error('--offline and --refresh can not be used together')
+    if arguments.format == 'parquet' and not is_parquet_available():
+        parser.error('parquet output needs pandas and pyarrow or fastparquet')
+    cache_id = arguments.id or os.path.splitext(os.path.basename(arguments.preset))[0] + '_' + \
+        arguments.focus.lower() + '_focus_cache.csv'
+    # the paths given are relative to where the command is run, the rest to the source folder like main.py
+    output = os.path.abspath(arguments.output or os.path.splitext(cache_id)[0] + '_results.' + arguments.format)
+    summary_path = os.path.abspath(arguments.summary or os.path.splitext(output)[0] + '_summary.json')
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    tickers = get_preset_tickers(arguments.preset)
+    if tickers is None:
+        parser.error('no ticker preset named ' + arguments.preset + ' in ' + PRESETS_ROOT)
+    StockInfo.load_tickers(TICKERS_FILE)
+    # tickers that aren't in the tickers data can't be put in the graph
+    unknown_tickers = [ticker for ticker in tickers if StockInfo.get_info_from_ticker(ticker) is None]
+    summary = {
+        'preset': arguments.preset,
+        'id': cache_id,
+        'search_focus': arguments.focus,
+        'articles_per_ticker': arguments.articles,
+        'parallelism': arguments.parallelism,
+        'mode': 'offline' if arguments.offline else 'refresh' if arguments.refresh else
+        'cache' if arguments.use_cache else 'fresh',
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        'tickers': len(tickers) - len(unknown_tickers),
+        'unknown_tickers': unknown_tickers,
+        'incomplete_tickers': [],
+        'refreshed_tickers': [],
+        'output': output,
+        'graph': None,
+        'timings': {},
+        'pipeline': {},
+        'error': None
+    }
+    start = time.perf_counter()
+    try:
+        status = run(arguments, [ticker for ticker in tickers if ticker not in unknown_tickers], summary)
+    except Exception as error:  # reported in the summary and exit status
+        traceback.print_exc()
+        summary['error'] = repr(error)
+        status = EXIT_FAILED
+    summary['timings']['total'] = round(time.perf_counter() - start, 3)
+    summary['finished_at'] = datetime.now(timezone.utc).isoformat()
+    summary['status'] = status
+    try:
+        write_json(summary_path, summary)
+    except OSError as error:
+        print('Could not write the summary: ' + repr(error), file=sys.stderr)
+        return EXIT_FAILED if status == EXIT_FAILED else EXIT_OUTPUT_FAILED
+    if not arguments.quiet:
+        print('Summary: ' + summary_path)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
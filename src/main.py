@@ -13,11 +13,9 @@ please consult our Course Syllabus.
 This file is Copyright (c) 2023 Mark Zhang, Li Zhang and Luke Zhang
 """
 from python_ta.contracts import check_contracts
-import CSV
 import StockInfo
 import GUI
-import ssl
-import nltk
+from Sentiment import ensure_nltk_data
 from StockInfo import get_tickers
 from StockAnalyzer import StockAnalyzer, StockAnalyzerSettings
 from StockGraphAnalyzer import StockGraphAnalyzer
@@ -28,18 +26,9 @@ if __name__ == '__main__':
     # set relative path
     os.chdir(os.path.dirname(os.path.abspath(__file__)))
     # set up StockInfo's data
-    StockInfo.tickers = CSV.read_file('data/tickers_data.csv')
-    # download nltk data
-    # avoid the download popup with ssl
-    try:
-        _create_unverified_https_context = ssl._create_unverified_context
-    except AttributeError:
-        pass
-    else:
-        ssl._create_default_https_context = _create_unverified_https_context
-    # install vader_lexicon model
-    nltk.downloader.download('stopwords')
-    nltk.downloader.download('vader_lexicon')
+    StockInfo.load_tickers('data/tickers_data.csv')
+    # download the nltk data the first time, later starts don't need the network
+    ensure_nltk_data()
     # load in GUI
     main_screen = GUI.MainMenu()
     # run_analysis()